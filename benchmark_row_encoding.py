@@ -0,0 +1,73 @@
+"""
+Row encoding benchmark - compares change_log row_data stored as a JSON object (the default)
+with the compact positional JSON array (capture option "row_encoding": "compact").
+
+Runs offline on synthetic rows shaped like a typical product table; no database needed.
+"""
+
+import json
+import random
+import time
+import zlib
+
+COLUMNS = ["id", "sku", "name", "description", "price", "stock", "category_id", "is_active",
+           "weight_kg", "supplier_ref", "created_at", "updated_at"]
+
+
+def make_row(i):
+    return {
+        "id": i,
+        "sku": f"SKU-{i:08d}",
+        "name": f"Product {i}",
+        "description": "Lorem ipsum dolor sit amet, consectetur adipiscing elit " * random.randint(0, 2),
+        "price": f"{random.uniform(1, 500):.2f}",
+        "stock": random.randint(0, 1000),
+        "category_id": random.randint(1, 40),
+        "is_active": random.randint(0, 1),
+        "weight_kg": round(random.uniform(0.1, 20), 3),
+        "supplier_ref": None if i % 3 else f"SUP-{i % 97}",
+        "created_at": "2024-03-01 08:15:00.000000",
+        "updated_at": "2024-06-12 17:42:31.000000",
+    }
+
+
+def time_it(func, payloads, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for payload in payloads:
+            func(payload)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run_benchmark(rows=100_000):
+    random.seed(42)
+    data = [make_row(i) for i in range(1, rows + 1)]
+
+    as_object = [json.dumps(row) for row in data]
+    as_array = [json.dumps([row[col] for col in COLUMNS]) for row in data]
+
+    object_bytes = sum(len(p.encode()) for p in as_object)
+    array_bytes = sum(len(p.encode()) for p in as_array)
+    object_zlib = len(zlib.compress("\n".join(as_object).encode()))
+    array_zlib = len(zlib.compress("\n".join(as_array).encode()))
+
+    parse_object = time_it(json.loads, as_object)
+    parse_array = time_it(lambda p: dict(zip(COLUMNS, json.loads(p))), as_array)
+    # What the engine does when it fetches a compact row (see decode_compact_changes)
+    engine_decode = time_it(lambda p: json.dumps(dict(zip(COLUMNS, json.loads(p)))), as_array)
+
+    print(f"📊 Row encoding benchmark: {rows} rows, {len(COLUMNS)} columns")
+    print("=" * 60)
+    print(f"{'':28}{'json object':>15}{'compact array':>17}")
+    print(f"{'Avg bytes per row':28}{object_bytes / rows:>15.1f}{array_bytes / rows:>17.1f}")
+    print(f"{'Total MB':28}{object_bytes / 1e6:>15.2f}{array_bytes / 1e6:>17.2f}")
+    print(f"{'Total MB (zlib, transfer)':28}{object_zlib / 1e6:>15.2f}{array_zlib / 1e6:>17.2f}")
+    print(f"{'Parse to dict (rows/sec)':28}{rows / parse_object:>15,.0f}{rows / parse_array:>17,.0f}")
+    print(f"{'Engine decode (rows/sec)':28}{'-':>15}{rows / engine_decode:>17,.0f}")
+    print(f"\n📉 Compact rows are {100 * (1 - array_bytes / object_bytes):.0f}% smaller")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -2,66 +2,145 @@
 Conflict Resolution Monitor - View and manage sync conflicts
 """
 
+from core.collector import collect_from_databases, merge_sorted
 from core.config import load_config
-from core.connector import connect_mysql
+from core.schema import CONFLICT_STATS_TABLE
 import json
 
 
+def fetch_conflict_summary(conn, pair_name, db_type):
+    """Conflict counts per type and resolution, or None without conflict stats"""
+    with conn.cursor() as cur:
+        # Read-only: the agent creates (and backfills) the rollup, the monitor never does
+        cur.execute(f"SHOW TABLES LIKE '{CONFLICT_STATS_TABLE}'")
+        if not cur.fetchone():
+            return None
+
+        cur.execute(f"""
+                    SELECT conflict_type,
+                           resolution,
+                           SUM(conflict_count) as count,
+                           MAX(last_conflict_at) as latest_conflict
+                    FROM `{CONFLICT_STATS_TABLE}`
+                    GROUP BY conflict_type, resolution
+                    ORDER BY count DESC
+                    """)
+        return cur.fetchall()
+
+
 def show_conflict_summary():
-    """Show a summary of all conflicts across sync pairs"""
+    """Show a summary of all conflicts across sync pairs, read from the conflict_stats rollup"""
     config = load_config()
 
     print("\n🛡️ CONFLICT RESOLUTION SUMMARY")
     print("=" * 60)
 
     total_conflicts = 0
+    results = collect_from_databases(config, fetch_conflict_summary)
 
     for pair in config["sync_pairs"]:
         print(f"\n📋 Sync Pair: {pair['name']}")
 
-        for db_type in ["local", "cloud"]:
-            try:
-                conn = connect_mysql(pair[db_type])
-                db_name = pair[db_type]["db"]
-
-                with conn.cursor() as cur:
-                    # Check if conflict_log table exists
-                    cur.execute("SHOW TABLES LIKE 'conflict_log'")
-                    if not cur.fetchone():
-                        print(f"  📭 No conflict log in {db_type} database")
-                        continue
-
-                    # Get conflict summary
-                    cur.execute("""
-                                SELECT conflict_type,
-                                       resolution,
-                                       COUNT(*) as count,
-                            MAX(resolved_at) as latest_conflict
-                                FROM conflict_log
-                                GROUP BY conflict_type, resolution
-                                ORDER BY count DESC
-                                """)
-
-                    conflicts = cur.fetchall()
-
-                    if conflicts:
-                        print(f"  🔥 {db_type.upper()} Database Conflicts:")
-                        for conflict in conflicts:
-                            print(
-                                f"    {conflict['conflict_type']} ({conflict['resolution']}): {conflict['count']} conflicts")
-                            print(f"      Latest: {conflict['latest_conflict']}")
-                            total_conflicts += conflict['count']
-                    else:
-                        print(f"  ✅ No conflicts in {db_type} database")
-
-                conn.close()
-
-            except Exception as e:
-                print(f"  ❌ Error checking {db_type}: {e}")
+        for result in results:
+            if result.pair != pair["name"]:
+                continue
+            db_type = result.db_type
+
+            if not result.ok:
+                print(f"  ❌ Error checking {db_type}: {result.error}")
+            elif result.value is None:
+                print(f"  📭 No conflict stats in {db_type} database")
+                print(f"     Run the sync agent (python main.py) once to create {CONFLICT_STATS_TABLE}")
+            elif result.value:
+                print(f"  🔥 {db_type.upper()} Database Conflicts:")
+                for conflict in result.value:
+                    print(
+                        f"    {conflict['conflict_type']} ({conflict['resolution']}): {conflict['count']} conflicts")
+                    print(f"      Latest: {conflict['latest_conflict']}")
+                    total_conflicts += conflict['count']
+            else:
+                print(f"  ✅ No conflicts in {db_type} database")
 
     print(f"\n📊 TOTAL CONFLICTS ACROSS ALL DATABASES: {total_conflicts}")
 
 
+def fetch_conflict_trend(conn, pair_name, db_type, hours):
+    """Conflicts per hour and table over the last `hours`, or None without conflict stats"""
+    with conn.cursor() as cur:
+        cur.execute(f"SHOW TABLES LIKE '{CONFLICT_STATS_TABLE}'")
+        if not cur.fetchone():
+            return None
+
+        cur.execute(f"""
+                    SELECT hour_start,
+                           table_name,
+                           SUM(conflict_count) as count
+                    FROM `{CONFLICT_STATS_TABLE}`
+                    WHERE hour_start >= NOW() - INTERVAL %s HOUR
+                    GROUP BY hour_start, table_name
+                    ORDER BY hour_start, table_name
+                    """, (hours,))
+        return cur.fetchall()
+
+
+def show_conflict_trend(hours=24):
+    """Show conflicts per hour over the last `hours`, read from the conflict_stats rollup"""
+    config = load_config()
+
+    print(f"\n📈 CONFLICT TREND (Last {hours} hours)")
+    print("=" * 60)
+
+    results = collect_from_databases(
+        config, lambda conn, pair_name, db_type: fetch_conflict_trend(conn, pair_name, db_type, hours))
+
+    for pair in config["sync_pairs"]:
+        print(f"\n📋 Sync Pair: {pair['name']}")
+
+        for result in results:
+            if result.pair != pair["name"]:
+                continue
+            db_type = result.db_type
+
+            if not result.ok:
+                print(f"  ❌ Error checking {db_type}: {result.error}")
+            elif result.value is None:
+                print(f"  📭 No conflict stats in {db_type} database")
+                print(f"     Run the sync agent (python main.py) once to create {CONFLICT_STATS_TABLE}")
+            elif result.value:
+                print(f"  🔥 {db_type.upper()} Database:")
+                for row in result.value:
+                    print(f"    {row['hour_start']:%Y-%m-%d %H:00}  {row['table_name']}: {row['count']}")
+            else:
+                print(f"  ✅ No conflicts in {db_type} database")
+
+
+def fetch_recent_conflicts(conn, pair_name, db_type, limit):
+    """The newest `limit` conflicts of one database, newest first"""
+    with conn.cursor() as cur:
+        cur.execute("SHOW TABLES LIKE 'conflict_log'")
+        if not cur.fetchone():
+            return []
+
+        cur.execute("""
+                    SELECT table_name,
+                           record_pk,
+                           conflict_type,
+                           resolution,
+                           source_data,
+                           target_data,
+                           conflict_details,
+                           resolved_at
+                    FROM conflict_log
+                    ORDER BY resolved_at DESC
+                        LIMIT %s
+                    """, (limit,))
+
+        conflicts = cur.fetchall()
+        for conflict in conflicts:
+            conflict['database'] = f"{pair_name}.{db_type}"
+        return conflicts
+
+
 def show_recent_conflicts(limit=10):
     """Show recent conflicts in detail"""
     config = load_config()
@@ -69,46 +148,16 @@ def show_recent_conflicts(limit=10):
     print(f"\n🔥 RECENT CONFLICTS (Last {limit})")
     print("=" * 80)
 
-    all_conflicts = []
+    results = collect_from_databases(
+        config, lambda conn, pair_name, db_type: fetch_recent_conflicts(conn, pair_name, db_type, limit))
+    for result in results:
+        if not result.ok:
+            print(f"❌ Error getting conflicts from {result.label}: {result.error}")
 
-    for pair in config["sync_pairs"]:
-        for db_type in ["local", "cloud"]:
-            try:
-                conn = connect_mysql(pair[db_type])
-
-                with conn.cursor() as cur:
-                    cur.execute("SHOW TABLES LIKE 'conflict_log'")
-                    if not cur.fetchone():
-                        continue
-
-                    cur.execute("""
-                                SELECT table_name,
-                                       record_pk,
-                                       conflict_type,
-                                       resolution,
-                                       source_data,
-                                       target_data,
-                                       conflict_details,
-                                       resolved_at
-                                FROM conflict_log
-                                ORDER BY resolved_at DESC
-                                    LIMIT %s
-                                """, (limit,))
-
-                    conflicts = cur.fetchall()
-                    for conflict in conflicts:
-                        conflict['database'] = f"{pair['name']}.{db_type}"
-                        all_conflicts.append(conflict)
-
-                conn.close()
-
-            except Exception as e:
-                print(f"❌ Error getting conflicts from {pair['name']}.{db_type}: {e}")
-
-    # Sort all conflicts by time
-    all_conflicts.sort(key=lambda x: x['resolved_at'], reverse=True)
-
-    for i, conflict in enumerate(all_conflicts[:limit], 1):
+    # Each database returns its conflicts newest first; merge them by time
+    all_conflicts = merge_sorted(results, key=lambda x: x['resolved_at'], reverse=True, limit=limit)
+
+    for i, conflict in enumerate(all_conflicts, 1):
         print(f"\n{i}. {conflict['database']} - {conflict['table_name']} [PK: {conflict['record_pk']}]")
         print(f"   Type: {conflict['conflict_type']} | Resolution: {conflict['resolution']}")
         print(f"   Time: {conflict['resolved_at']}")
@@ -129,6 +178,33 @@ def show_recent_conflicts(limit=10):
                 pass
 
 
+def fetch_manual_conflicts(conn, pair_name, db_type):
+    """Conflicts of one database waiting for manual resolution, newest first"""
+    with conn.cursor() as cur:
+        cur.execute("SHOW TABLES LIKE 'conflict_log'")
+        if not cur.fetchone():
+            return []
+
+        cur.execute("""
+                    SELECT id,
+                           table_name,
+                           record_pk,
+                           conflict_type,
+                           source_data,
+                           target_data,
+                           conflict_details,
+                           resolved_at
+                    FROM conflict_log
+                    WHERE resolution = 'manual'
+                    ORDER BY resolved_at DESC
+                    """)
+
+        conflicts = cur.fetchall()
+        for conflict in conflicts:
+            conflict['database'] = f"{pair_name}.{db_type}"
+        return conflicts
+
+
 def show_manual_resolution_queue():
     """Show conflicts that need manual resolution"""
     config = load_config()
@@ -137,40 +213,11 @@ def show_manual_resolution_queue():
     print("=" * 60)
 
     manual_conflicts = []
-
-    for pair in config["sync_pairs"]:
-        for db_type in ["local", "cloud"]:
-            try:
-                conn = connect_mysql(pair[db_type])
-
-                with conn.cursor() as cur:
-                    cur.execute("SHOW TABLES LIKE 'conflict_log'")
-                    if not cur.fetchone():
-                        continue
-
-                    cur.execute("""
-                                SELECT id,
-                                       table_name,
-                                       record_pk,
-                                       conflict_type,
-                                       source_data,
-                                       target_data,
-                                       conflict_details,
-                                       resolved_at
-                                FROM conflict_log
-                                WHERE resolution = 'manual'
-                                ORDER BY resolved_at DESC
-                                """)
-
-                    conflicts = cur.fetchall()
-                    for conflict in conflicts:
-                        conflict['database'] = f"{pair['name']}.{db_type}"
-                        manual_conflicts.append(conflict)
-
-                conn.close()
-
-            except Exception as e:
-                print(f"❌ Error getting manual conflicts: {e}")
+    for result in collect_from_databases(config, fetch_manual_conflicts):
+        if result.ok:
+            manual_conflicts.extend(result.value)
+        else:
+            print(f"❌ Error getting manual conflicts from {result.label}: {result.error}")
 
     if not manual_conflicts:
         print("✅ No conflicts pending manual resolution")
@@ -193,8 +240,23 @@ def show_manual_resolution_queue():
             pass
 
 
+def delete_old_conflicts(conn, pair_name, db_type, days_old):
+    """Delete conflict_log rows older than `days_old` days; returns how many were removed"""
+    with conn.cursor() as cur:
+        cur.execute("SHOW TABLES LIKE 'conflict_log'")
+        if not cur.fetchone():
+            return 0
+
+        cur.execute("""
+                    DELETE
+                    FROM conflict_log
+                    WHERE resolved_at < DATE_SUB(NOW(), INTERVAL %s DAY)
+                    """, (days_old,))
+        return cur.rowcount
+
+
 def clear_old_conflicts(days_old=30):
-    """Clear conflict logs older than specified days"""
+    """Clear conflict logs older than specified days (the conflict_stats totals are kept)"""
     config = load_config()
 
     print(f"\n🧹 CLEARING CONFLICTS OLDER THAN {days_old} DAYS")
@@ -202,31 +264,14 @@ def clear_old_conflicts(days_old=30):
 
     total_cleared = 0
 
-    for pair in config["sync_pairs"]:
-        for db_type in ["local", "cloud"]:
-            try:
-                conn = connect_mysql(pair[db_type])
-
-                with conn.cursor() as cur:
-                    cur.execute("SHOW TABLES LIKE 'conflict_log'")
-                    if not cur.fetchone():
-                        continue
-
-                    cur.execute("""
-                                DELETE
-                                FROM conflict_log
-                                WHERE resolved_at < DATE_SUB(NOW(), INTERVAL %s DAY)
-                                """, (days_old,))
-
-                    cleared = cur.rowcount
-                    if cleared > 0:
-                        print(f"  🗑️ Cleared {cleared} old conflicts from {pair['name']}.{db_type}")
-                        total_cleared += cleared
-
-                conn.close()
-
-            except Exception as e:
-                print(f"❌ Error clearing conflicts from {pair['name']}.{db_type}: {e}")
+    results = collect_from_databases(
+        config, lambda conn, pair_name, db_type: delete_old_conflicts(conn, pair_name, db_type, days_old))
+    for result in results:
+        if not result.ok:
+            print(f"❌ Error clearing conflicts from {result.label}: {result.error}")
+        elif result.value > 0:
+            print(f"  🗑️ Cleared {result.value} old conflicts from {result.label}")
+            total_cleared += result.value
 
     print(f"\n✅ Total conflicts cleared: {total_cleared}")
 
@@ -239,8 +284,9 @@ if __name__ == "__main__":
     print("3. Show manual resolution queue")
     print("4. Clear old conflicts")
     print("5. All reports")
+    print("6. Show conflict trend")
 
-    choice = input("\nEnter choice (1-5): ").strip()
+    choice = input("\nEnter choice (1-6): ").strip()
 
     if choice == '1':
         show_conflict_summary()
@@ -258,6 +304,10 @@ if __name__ == "__main__":
         show_conflict_summary()
         show_recent_conflicts(10)
         show_manual_resolution_queue()
+    elif choice == '6':
+        hours = input("Hours of history to show (default 24): ").strip()
+        hours = int(hours) if hours.isdigit() else 24
+        show_conflict_trend(hours)
     else:
         print("Invalid choice")
 
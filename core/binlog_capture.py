@@ -0,0 +1,361 @@
+"""
+Binlog-based change capture, an alternative to the generated change_log triggers.
+
+Row events are read from the source server's binary log (python-mysql-replication) and
+written to change_log in the same shape the triggers produce, so the sync engine consumes
+them unchanged. The OLTP statements themselves no longer pay for a second insert, and
+change_log is written by one batched writer instead of by every transaction.
+
+Requires binlog_format=ROW and binlog_row_image=FULL on the server (binlog_row_metadata=FULL
+is recommended so events carry column names), plus a user with REPLICATION SLAVE and
+REPLICATION CLIENT privileges.
+"""
+import json
+import zlib
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from core.connector import connect_mysql
+from core.schema import (BINLOG_CHECKPOINT_TABLE, COMPACT_ROW_FORMAT, ROW_VERSION_TABLE, SERVER_STARTED_SQL,
+                         SYNC_AGENT_SESSION_TABLE, SYNC_CLOCK_TABLE,
+                         ensure_binlog_capture_tables, format_hlc, get_primary_key_column, get_table_columns,
+                         get_table_list, parse_hlc, register_columns_version, resolve_capture_options)
+
+try:
+    from pymysqlreplication import BinLogStreamReader
+    from pymysqlreplication.event import QueryEvent, XidEvent
+    from pymysqlreplication.row_event import DeleteRowsEvent, UpdateRowsEvent, WriteRowsEvent
+except ImportError:  # optional dependency, only needed for capture mode "binlog"
+    BinLogStreamReader = None
+
+# Rows buffered before they are written to change_log together with the new checkpoint
+BINLOG_FLUSH_ROWS = 500
+
+# Server start times derived from Uptime may differ by a second between reads; markers
+# within this many seconds belong to the same server run
+SERVER_STARTED_TOLERANCE_SECONDS = 2
+
+
+def require_binlog_support():
+    if BinLogStreamReader is None:
+        raise RuntimeError("Capture mode 'binlog' needs the mysql-replication package "
+                           "(pip install mysql-replication)")
+
+
+def load_agent_sessions(conn):
+    """
+    {connection_id: origin_node} of the sync_agent_session markers written during the
+    server's current run. Markers from earlier runs are left over from agent sessions that
+    never unmarked themselves; their connection ids may now belong to application
+    sessions, so they are deleted.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {SERVER_STARTED_SQL} AS server_started")
+        server_started = cur.fetchone()["server_started"]
+        cur.execute(f"SELECT connection_id, origin_node, server_started FROM `{SYNC_AGENT_SESSION_TABLE}`")
+        markers = cur.fetchall()
+
+        stale = [row["connection_id"] for row in markers
+                 if abs(row["server_started"] - server_started) > SERVER_STARTED_TOLERANCE_SECONDS]
+        if stale:
+            placeholders = ", ".join(["%s"] * len(stale))
+            cur.execute(f"DELETE FROM `{SYNC_AGENT_SESSION_TABLE}` WHERE connection_id IN ({placeholders})", stale)
+            print(f"    🧹 Removed {len(stale)} agent session markers left from before a server restart")
+
+    return {row["connection_id"]: row["origin_node"] for row in markers if row["connection_id"] not in stale}
+
+
+def get_binlog_position(conn):
+    """Current (log_file, log_pos) of the server's binary log."""
+    with conn.cursor() as cur:
+        try:
+            cur.execute("SHOW BINARY LOG STATUS")  # MySQL 8.4+
+        except Exception:
+            cur.execute("SHOW MASTER STATUS")
+        status = cur.fetchone()
+
+    if not status:
+        raise RuntimeError("Binary logging is disabled on this server (log_bin=OFF)")
+    return status["File"], status["Position"]
+
+
+def load_binlog_checkpoint(conn, node_id):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT log_file, log_pos FROM `{BINLOG_CHECKPOINT_TABLE}` WHERE node_id = %s", (node_id,))
+        row = cur.fetchone()
+    return (row["log_file"], row["log_pos"]) if row else None
+
+
+def save_binlog_checkpoint(cur, node_id, log_file, log_pos):
+    cur.execute(f"""
+                INSERT INTO `{BINLOG_CHECKPOINT_TABLE}` (node_id, log_file, log_pos)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE log_file = VALUES(log_file), log_pos = VALUES(log_pos)
+                """, (node_id, log_file, log_pos))
+
+
+def setup_binlog_capture(conn, db_name, tables, node_id):
+    """
+    Switch a database to binlog capture: check the server settings, remove the generated
+    change_log triggers (they would capture every change twice) and start the checkpoint at
+    the current binlog position.
+    """
+    # Fail before the triggers are removed, not later when the first capture run starts
+    require_binlog_support()
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT @@log_bin AS log_bin, @@binlog_format AS binlog_format, "
+                    "@@binlog_row_image AS row_image")
+        settings = cur.fetchone()
+
+    if not settings["log_bin"]:
+        raise RuntimeError("Binary logging is disabled on this server (log_bin=OFF)")
+    if settings["binlog_format"] != "ROW" or settings["row_image"] != "FULL":
+        print(f"    ⚠️ Binlog capture needs binlog_format=ROW and binlog_row_image=FULL "
+              f"(server has {settings['binlog_format']}/{settings['row_image']})")
+
+    ensure_binlog_capture_tables(conn)
+
+    table_list = get_table_list(conn, db_name, tables)
+    with conn.cursor() as cur:
+        for table in table_list:
+            for op in ("insert", "update", "delete"):
+                cur.execute(f"DROP TRIGGER IF EXISTS `trg_{table}_{op}`")
+    print(f"    🧹 Removed change_log triggers from {len(table_list)} tables (binlog capture)")
+
+    checkpoint = load_binlog_checkpoint(conn, node_id)
+    if checkpoint:
+        print(f"    📍 Binlog capture resumes at {checkpoint[0]}:{checkpoint[1]}")
+    else:
+        log_file, log_pos = get_binlog_position(conn)
+        with conn.cursor() as cur:
+            save_binlog_checkpoint(cur, node_id, log_file, log_pos)
+        print(f"    📍 Binlog capture starts at {log_file}:{log_pos}")
+
+
+def encode_binlog_value(value):
+    """JSON fallback for the Python types python-mysql-replication decodes columns into."""
+    if isinstance(value, (datetime, date, dt_time, timedelta, Decimal)):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, set):
+        return ",".join(sorted(value))
+    return str(value)
+
+
+def name_binlog_columns(values, columns):
+    """Map positional UNKNOWN_COLn keys (binlog_row_metadata=MINIMAL) to column names."""
+    if not any(str(key).startswith("UNKNOWN_COL") for key in values):
+        return values
+    return {columns[int(str(key)[len("UNKNOWN_COL"):])]: value for key, value in values.items()}
+
+
+def build_binlog_change(event_type, pk_col, row, table_capture):
+    """
+    Turn one binlog row image into change_log fields (operation, row_pk, row_data, row_format),
+    honouring the same capture options as the triggers. Returns None for a skipped no-op UPDATE.
+    """
+    if event_type == "UPDATE":
+        before, after = row["before_values"], row["after_values"]
+        changed = {col: value for col, value in after.items() if before.get(col) != value}
+
+        if not changed and table_capture["skip_noop_updates"]:
+            return None
+
+        if table_capture["update_capture"] == "delta" and before.get(pk_col) == after.get(pk_col):
+            return "UPDATE", after[pk_col], {pk_col: after[pk_col], **changed}, "delta"
+        return "UPDATE", after[pk_col], after, "full"
+
+    values = row["values"]
+    return event_type, values[pk_col], values, "full"
+
+
+def load_binlog_clock(conn, node_id):
+    """
+    Starting [physical, counter] of the capture clock: past the newest version this node
+    already wrote to change_log and never below the floor the sync agent keeps in sync_clock.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT physical FROM `{SYNC_CLOCK_TABLE}` WHERE node_id = %s", (node_id,))
+        row = cur.fetchone()
+        clock = [row["physical"] if row else 0, 0]
+
+        cur.execute("SELECT hlc FROM change_log WHERE source_node = %s AND hlc IS NOT NULL "
+                    "ORDER BY id DESC LIMIT 1", (node_id,))
+        row = cur.fetchone()
+
+    if row:
+        physical, counter, _ = parse_hlc(row["hlc"])
+        clock = max(clock, [physical, counter])
+    return clock
+
+
+def next_binlog_hlc(clock, event_time, node_id):
+    """Advance `clock` to a row event's commit time (whole seconds) and return its version."""
+    physical = int(event_time) * 1000000
+    if physical <= clock[0]:
+        clock[1] += 1
+    else:
+        clock[0], clock[1] = physical, 0
+    return format_hlc(clock[0], clock[1], node_id)
+
+
+def capture_binlog_changes(db_config, node_id, tables="all", capture=None, max_events=50000):
+    """
+    Read row events written since the last checkpoint into change_log.
+
+    Events are buffered per transaction and flushed together with the checkpoint of the
+    last complete transaction in one source transaction, so a crash never loses or
+    duplicates a change. Transactions issued by a sync agent session (see
+    sync_agent_session) are skipped or tagged with their origin node, like the triggers'
+    "echo" option. Each change gets a hybrid logical clock version from its commit time
+    (see next_binlog_hlc). Returns the number of change_log rows written.
+    """
+    require_binlog_support()
+
+    conn = connect_mysql(db_config)
+    db_name = db_config["db"]
+    stream = None
+    written = 0
+
+    try:
+        checkpoint = load_binlog_checkpoint(conn, node_id)
+        if not checkpoint:
+            print(f"    ⚠️ No binlog checkpoint for {db_name}; run setup first")
+            return 0
+
+        table_list = get_table_list(conn, db_name, tables)
+        table_info = {}
+        for table in table_list:
+            pk_col = get_primary_key_column(conn, db_name, table)
+            if not pk_col:
+                print(f"    ⚠️ Skipping table `{table}` (no primary key)")
+                continue
+            columns = get_table_columns(conn, db_name, table)
+            table_capture = resolve_capture_options(capture, table)
+            version = register_columns_version(conn, table, columns) if table_capture["row_encoding"] == "compact" else None
+            table_info[table] = (pk_col, columns, table_capture, version)
+
+        # Sessions the agent announced before this run; updated as marker events arrive
+        agent_sessions = load_agent_sessions(conn)
+
+        clock = load_binlog_clock(conn, node_id)
+
+        stream = BinLogStreamReader(
+            connection_settings={"host": db_config["host"], "port": db_config.get("port", 3306),
+                                 "user": db_config["user"], "passwd": db_config["password"]},
+            server_id=(capture or {}).get("server_id") or 100000 + zlib.crc32(node_id.encode()) % 100000,
+            resume_stream=True,
+            log_file=checkpoint[0],
+            log_pos=checkpoint[1],
+            blocking=False,
+            only_schemas=[db_name],
+            only_tables=list(table_info) + [SYNC_AGENT_SESSION_TABLE],
+            only_events=[QueryEvent, XidEvent, WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent],
+        )
+
+        buffered = []  # rows of committed transactions not yet flushed
+        transaction = []  # rows of the transaction being read
+        versions = {}  # (table, pk) -> (version, node) for tables with capture option row_versions
+        origin = None  # origin node if the current transaction comes from an agent session
+        events = 0
+
+        def flush(position):
+            nonlocal written
+            conn.begin()
+            try:
+                with conn.cursor() as cur:
+                    if buffered:
+                        cur.executemany("""
+                                        INSERT INTO change_log
+                                            (table_name, operation, row_pk, row_data, source_node, row_format,
+                                             columns_version, created_at, hlc)
+                                        VALUES (%s, %s, %s, %s, %s, %s, %s, FROM_UNIXTIME(%s), %s)
+                                        """, buffered)
+                    if versions:
+                        cur.executemany(f"""
+                                        INSERT INTO `{ROW_VERSION_TABLE}` (table_name, row_pk, version, node)
+                                        VALUES (%s, %s, %s, %s)
+                                        ON DUPLICATE KEY UPDATE version = VALUES(version), node = VALUES(node)
+                                        """, [(*key, *value) for key, value in versions.items()])
+                    save_binlog_checkpoint(cur, node_id, *position)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            written += len(buffered)
+            buffered.clear()
+            versions.clear()
+
+        commit_position = None
+        for event in stream:
+            events += 1
+
+            if isinstance(event, QueryEvent):
+                query = event.query.strip().upper() if isinstance(event.query, str) else ""
+                if query == "BEGIN":
+                    transaction = []
+                    origin = agent_sessions.get(event.slave_proxy_id)
+                    continue
+                if query != "COMMIT":
+                    continue  # DDL and other statements are not captured
+
+            if isinstance(event, (WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent)):
+                if event.table == SYNC_AGENT_SESSION_TABLE:
+                    for row in event.rows:
+                        values = row.get("after_values") or row.get("values")
+                        if isinstance(event, DeleteRowsEvent):
+                            agent_sessions.pop(values["connection_id"], None)
+                        else:
+                            agent_sessions[values["connection_id"]] = values["origin_node"]
+                    continue
+
+                pk_col, columns, table_capture, version = table_info[event.table]
+                echo = table_capture["echo"]
+                if origin and echo == "suppress":
+                    continue
+
+                event_type = ("INSERT" if isinstance(event, WriteRowsEvent)
+                              else "UPDATE" if isinstance(event, UpdateRowsEvent) else "DELETE")
+                for row in event.rows:
+                    row = {key: name_binlog_columns(values, columns) for key, values in row.items()
+                           if key in ("values", "before_values", "after_values")}
+                    change = build_binlog_change(event_type, pk_col, row, table_capture)
+                    if change is None:
+                        continue
+                    operation, row_pk, row_data, row_format = change
+                    if version and row_format == "full":
+                        row_data, row_format = [row_data.get(col) for col in columns], COMPACT_ROW_FORMAT
+                    source_node = origin if origin and echo == "tag" else node_id
+                    hlc = next_binlog_hlc(clock, event.timestamp, node_id) if table_capture["hlc"] else None
+                    transaction.append((event.table, operation, str(row_pk),
+                                        json.dumps(row_data, default=encode_binlog_value),
+                                        source_node, row_format, version if row_format == COMPACT_ROW_FORMAT else None,
+                                        event.timestamp, hlc))
+                continue
+
+            # XidEvent or COMMIT: the transaction is complete
+            for change in transaction:
+                if change[-1] and table_info[change[0]][2]["row_versions"] and change[4] == node_id:
+                    versions[(change[0], change[2])] = (change[-1], node_id)
+            buffered.extend(transaction)
+            transaction = []
+            origin = None
+            commit_position = (stream.log_file, stream.log_pos)
+
+            if len(buffered) >= BINLOG_FLUSH_ROWS:
+                flush(commit_position)
+            if events >= max_events:
+                break
+
+        if commit_position:
+            flush(commit_position)
+
+        print(f"    📥 Binlog capture for {db_name}: {written} changes from {events} events")
+        return written
+
+    finally:
+        if stream:
+            stream.close()
+        conn.close()
@@ -0,0 +1,106 @@
+"""
+Concurrent fan-out over every database of the configured sync pairs, for the monitoring
+and diagnostic tools.
+
+Each database is queried on a bounded worker pool with its own connect/read timeouts, so
+one slow or offline host costs at most `timeout` seconds instead of delaying every other
+host. Failures and timeouts come back as results of their own, so callers always get the
+partial picture. Workers must not print; they return what they found and the caller
+prints it in config order (or merges it, see merge_sorted).
+"""
+import heapq
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from itertools import islice
+
+from core.connector import connect_mysql
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_CONNECT_TIMEOUT = 5  # seconds to establish each connection
+DEFAULT_TIMEOUT = 30  # seconds each database may take, connection included
+
+
+@dataclass
+class CollectResult:
+    """What one database returned, or why it did not."""
+    pair: str
+    db_type: str
+    value: object = None
+    error: str = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def label(self):
+        return f"{self.pair}.{self.db_type}"
+
+
+def query_database(db_config, query, pair_name, db_type, connect_timeout, timeout):
+    """Run query(conn, pair_name, db_type) on one database; never raises."""
+    started = time.perf_counter()
+    conn = None
+    try:
+        conn = connect_mysql(db_config, connect_timeout=min(connect_timeout, timeout),
+                             read_timeout=timeout, write_timeout=timeout)
+        value = query(conn, pair_name, db_type)
+        return CollectResult(pair_name, db_type, value, elapsed=time.perf_counter() - started)
+    except Exception as e:
+        return CollectResult(pair_name, db_type, error=str(e) or type(e).__name__,
+                             elapsed=time.perf_counter() - started)
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def collect_from_databases(config, query, db_types=("local", "cloud"), max_workers=DEFAULT_MAX_WORKERS,
+                           connect_timeout=DEFAULT_CONNECT_TIMEOUT, timeout=DEFAULT_TIMEOUT):
+    """
+    Run query(conn, pair_name, db_type) against the `db_types` databases of every sync pair
+    concurrently. Returns one CollectResult per database, in config order. A database that
+    has not answered when the whole run's deadline passes is reported as timed out.
+    """
+    targets = [(pair, db_type) for pair in config["sync_pairs"] for db_type in db_types]
+    if not targets:
+        return []
+
+    workers = max(1, min(max_workers, len(targets)))
+    # Every host gets `timeout` once its turn on the pool comes up
+    deadline = timeout * math.ceil(len(targets) / workers)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="collector")
+    try:
+        futures = [executor.submit(query_database, pair[db_type], query, pair["name"], db_type,
+                                   connect_timeout, timeout)
+                   for pair, db_type in targets]
+        wait(futures, timeout=deadline)
+    finally:
+        # Do not wait for stuck hosts; their sockets time out on their own
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for (pair, db_type), future in zip(targets, futures):
+        if future.done() and not future.cancelled():
+            results.append(future.result())
+        else:
+            results.append(CollectResult(pair["name"], db_type, error=f"timed out after {deadline}s",
+                                         elapsed=deadline))
+    return results
+
+
+def merge_sorted(results, key, reverse=False, limit=None):
+    """
+    Merge the row lists of successful results, each already sorted by `key`, into one sorted
+    list of at most `limit` rows without re-sorting everything.
+    """
+    lists = [result.value for result in results if result.ok and result.value]
+    merged = heapq.merge(*lists, key=key, reverse=reverse)
+    return list(islice(merged, limit)) if limit is not None else list(merged)
+
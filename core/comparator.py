@@ -0,0 +1,158 @@
+"""
+Typed field comparison for conflict detection.
+
+Source values arrive through change_log JSON (DECIMAL as a JSON number, DATETIME as a
+string, JSON columns as nested objects) while target values come from pymysql (Decimal,
+datetime, JSON text). Comparing their str() forms reports false conflicts, so each table
+gets a comparator compiled from its column types that normalises both sides to the same
+Python value before comparing.
+"""
+import json
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from core.schema import _meta_cache_key, get_table_meta
+
+INTEGER_TYPES = {"tinyint", "smallint", "mediumint", "int", "integer", "bigint", "year"}
+DECIMAL_TYPES = {"decimal", "numeric"}
+FLOAT_TYPES = {"float", "double", "real"}
+BINARY_TYPES = {"binary", "varbinary", "tinyblob", "blob", "mediumblob", "longblob", "bit"}
+
+
+def normalize_int(value):
+    return int(value)
+
+
+def normalize_decimal(value):
+    # Decimal("1.50") and the JSON number 1.5 must compare (and hash) equal
+    return Decimal(str(value)).normalize()
+
+
+def normalize_float(value):
+    return float(value)
+
+
+def normalize_datetime(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.fromisoformat(str(value)).replace(tzinfo=None)
+
+
+def normalize_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def normalize_time(value):
+    # pymysql returns TIME columns as timedelta
+    if isinstance(value, timedelta):
+        return value
+    if isinstance(value, dt_time):
+        return timedelta(hours=value.hour, minutes=value.minute, seconds=value.second,
+                         microseconds=value.microsecond)
+    text = str(value)
+    sign = -1 if text.startswith("-") else 1
+    hours, minutes, seconds = text.lstrip("-").split(":")
+    return sign * timedelta(hours=int(hours), minutes=int(minutes), seconds=float(seconds))
+
+
+def normalize_json(value):
+    # Canonical text, so key order and whitespace do not matter
+    if isinstance(value, (str, bytes)):
+        value = json.loads(value)
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def normalize_binary(value):
+    if isinstance(value, str):
+        return value.encode("utf-8", errors="surrogateescape")
+    return bytes(value)
+
+
+def normalize_text(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+def normalizer_for_type(data_type):
+    """Normalising function for a column's INFORMATION_SCHEMA DATA_TYPE."""
+    if data_type in INTEGER_TYPES:
+        return normalize_int
+    if data_type in DECIMAL_TYPES:
+        return normalize_decimal
+    if data_type in FLOAT_TYPES:
+        return normalize_float
+    if data_type in ("datetime", "timestamp"):
+        return normalize_datetime
+    if data_type == "date":
+        return normalize_date
+    if data_type == "time":
+        return normalize_time
+    if data_type == "json":
+        return normalize_json
+    if data_type in BINARY_TYPES:
+        return normalize_binary
+    return normalize_text
+
+
+class TableComparator:
+    """Compares rows of one table column by column, using each column's normaliser."""
+
+    def __init__(self, table_name, column_types):
+        self.table_name = table_name
+        self.normalizers = {column: normalizer_for_type(data_type) for column, data_type in column_types.items()}
+
+    def normalize(self, column, value):
+        if value is None:
+            return None
+        normalizer = self.normalizers.get(column, normalize_text)
+        try:
+            return normalizer(value)
+        except (TypeError, ValueError, InvalidOperation):
+            # Anything the column type cannot parse is compared as text
+            return normalize_text(value)
+
+    def normalize_values(self, row, columns):
+        return tuple(self.normalize(column, row.get(column)) for column in columns)
+
+    def diff(self, source_row, target_row):
+        """
+        Fields whose values differ, as [{'field', 'source_value', 'target_value'}]. Only
+        columns carried by `source_row` and present in `target_row` are compared.
+        """
+        columns = [column for column in source_row if column in target_row]
+        source_values = self.normalize_values(source_row, columns)
+        target_values = self.normalize_values(target_row, columns)
+
+        if source_values == target_values:
+            return []
+
+        return [
+            {'field': column, 'source_value': source_row[column], 'target_value': target_row[column]}
+            for column, source_value, target_value in zip(columns, source_values, target_values)
+            if source_value != target_value
+        ]
+
+
+# (host, port, db_name, table_name) -> (TableMeta the comparator was compiled from, comparator)
+_comparator_cache = {}
+
+
+def get_table_comparator(conn, db_name, table_name):
+    """Comparator for a table, recompiled whenever its cached schema metadata is reloaded."""
+    meta = get_table_meta(conn, db_name, table_name)
+    if not meta:
+        return None
+
+    key = _meta_cache_key(conn, db_name, table_name)
+    cached = _comparator_cache.get(key)
+    if cached and cached[0] is meta:
+        return cached[1]
+
+    comparator = TableComparator(table_name, meta.column_types)
+    _comparator_cache[key] = (meta, comparator)
+    return comparator
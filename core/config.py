@@ -1,3 +1,4 @@
+import importlib.util
 import json
 import os
 import uuid
@@ -26,6 +27,9 @@ def load_config():
             raise ValueError(f"Missing DB info in local config for sync pair: {pair.get('name')}")
         if not all(k in pair["cloud"] for k in ("host", "user", "password", "db")):
             raise ValueError(f"Missing DB info in cloud config for sync pair: {pair.get('name')}")
+        if (pair.get("capture") or {}).get("mode") == "binlog" and not importlib.util.find_spec("pymysqlreplication"):
+            raise ValueError(f"Sync pair {pair.get('name')} uses capture mode 'binlog', which needs the optional "
+                             f"mysql-replication package (pip install db-sync-agent[binlog])")
 
     return config
 
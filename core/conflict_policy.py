@@ -0,0 +1,187 @@
+"""
+Conflict resolution policies: which side wins a conflict, per table and per column.
+
+A pair's "conflict_resolution" is either one strategy name for everything (the original
+form) or a policy such as
+
+    {
+        "default": "timestamp_wins",
+        "tables": {
+            "products": {"columns": {"price": "source_wins", "stock": "target_wins"}}
+        }
+    }
+
+The policy is compiled once into a decision table. resolve_batch() then settles every
+conflict of a batch in one pass. For each conflicting column the row keeps either the
+source value or the target value, so a conflict produces the row to write (possibly only
+some of its columns) instead of extra statements.
+"""
+import json
+from dataclasses import dataclass
+
+SOURCE = "source"
+TARGET = "target"
+MANUAL = "manual"
+
+DEFAULT_STRATEGY = "timestamp_wins"
+
+
+@dataclass
+class Strategy:
+    """A registered strategy: decide(conflict_info) -> SOURCE, TARGET or MANUAL, plus log labels."""
+    name: str
+    decide: object
+    source_label: str
+    target_label: str
+    needs_field_values: bool = False  # decides differing fields only (cannot work from versions alone)
+
+
+# name -> Strategy
+STRATEGIES = {}
+
+
+def register_strategy(name, source_label=None, target_label=None, needs_field_values=False):
+    """Decorator registering a column decision function under `name`."""
+    def decorator(decide):
+        STRATEGIES[name] = Strategy(name, decide, source_label or name, target_label or name, needs_field_values)
+        return decide
+    return decorator
+
+
+@register_strategy("source_wins")
+def source_wins(conflict_info):
+    return SOURCE
+
+
+@register_strategy("target_wins")
+def target_wins(conflict_info):
+    return TARGET
+
+
+@register_strategy("manual")
+def manual(conflict_info):
+    return MANUAL
+
+
+@register_strategy("merge_fields", needs_field_values=True)
+def merge_fields(conflict_info):
+    # Fields differ whenever the source changed them, so they are only protected when the
+    # target row has its own unsynced edit ('target_edited', set by the engine); otherwise
+    # the source values are applied. A conflict without field differences is applied in full
+    return TARGET if conflict_info.get('target_edited') else SOURCE
+
+
+@register_strategy("timestamp_wins", "timestamp_wins_source", "timestamp_wins_target")
+def timestamp_wins(conflict_info):
+    if conflict_info['type'] in ('timestamp_conflict', 'version_conflict'):
+        return SOURCE if conflict_info['source_time'] > conflict_info['target_time'] else TARGET
+    # No timestamp info: source wins
+    return SOURCE
+
+
+@dataclass
+class ConflictDecision:
+    """Outcome for one conflicting change."""
+    apply: bool
+    row: dict = None  # row to write when applying
+    partial: bool = False  # row holds only some columns: write it as an UPDATE, not an upsert
+    resolution: str = None  # conflict_log resolution label
+    kept_target: tuple = ()  # columns left at their target value
+
+
+def get_strategy(name):
+    # Older configs spell strategies with hyphens ("timestamp-wins")
+    key = name.replace("-", "_") if isinstance(name, str) else name
+    if key not in STRATEGIES:
+        raise ValueError(f"Unknown conflict resolution strategy: {name}")
+    return STRATEGIES[key]
+
+
+class ConflictPolicy:
+    """A compiled conflict_resolution setting: strategy lookup per (table, column)."""
+
+    def __init__(self, default=DEFAULT_STRATEGY, tables=None):
+        self.default = get_strategy(default)
+        self.tables = {}
+        for table, table_policy in (tables or {}).items():
+            table_default = get_strategy(table_policy.get("default", default))
+            columns = {column: get_strategy(name) for column, name in table_policy.get("columns", {}).items()}
+            self.tables[table] = (table_default, columns)
+
+        strategies = [self.default] + [s for table_default, columns in self.tables.values()
+                                       for s in [table_default, *columns.values()]]
+        self.needs_field_values = any(strategy.needs_field_values for strategy in strategies)
+
+    def __str__(self):
+        overrides = f", {len(self.tables)} table overrides" if self.tables else ""
+        return f"{self.default.name}{overrides}"
+
+    def strategy_for(self, table, column):
+        table_default, columns = self.tables.get(table, (self.default, {}))
+        return columns.get(column, table_default)
+
+    def resolve(self, change, conflict_info, pk_col):
+        """Decide one conflict (see resolve_batch)."""
+        table = change["table_name"]
+        row = json.loads(change.get("row_data") or "{}")
+
+        field_conflict = conflict_info['type'] == 'field_conflict'
+        if field_conflict:
+            conflicting = [c['field'] for c in conflict_info.get('conflicts', []) if c['field'] != pk_col]
+        else:
+            # The whole row is newer on one side: every column is decided
+            conflicting = [column for column in row if column != pk_col]
+
+        decided = {}  # strategy name -> decision; a strategy is evaluated once per row
+        by_column = {}
+        for column in conflicting:
+            strategy = self.strategy_for(table, column)
+            if strategy.needs_field_values and not field_conflict:
+                continue  # no field differs, so a field merge has nothing to protect
+            if strategy.name not in decided:
+                decided[strategy.name] = strategy.decide(conflict_info)
+            by_column[column] = (strategy, decided[strategy.name])
+
+        if any(decision == MANUAL for _, decision in by_column.values()):
+            return ConflictDecision(apply=False, resolution='manual')
+
+        kept_target = tuple(column for column, (_, decision) in by_column.items() if decision == TARGET)
+        strategies = {strategy.name: strategy for strategy, _ in by_column.values()}
+        field_merge = any(strategy.needs_field_values for strategy in strategies.values())
+        if len(strategies) == 1:
+            strategy = next(iter(strategies.values()))
+            label = strategy.target_label if len(kept_target) == len(by_column) else strategy.source_label
+        else:
+            label = 'column_policy' if strategies else self.strategy_for(table, None).source_label
+
+        merged = {column: value for column, value in row.items() if column not in kept_target}
+        if not any(column != pk_col for column in merged):
+            # Every column stays at its target value: nothing worth writing
+            label = 'merge_no_safe_fields' if field_merge else label
+            return ConflictDecision(apply=False, resolution=label, kept_target=kept_target)
+
+        if by_column and len(kept_target) == len(by_column) and not field_merge:
+            # The target wins the row: its other columns are not applied either
+            return ConflictDecision(apply=False, resolution=label, kept_target=kept_target)
+
+        return ConflictDecision(apply=True, row=merged, partial=bool(kept_target), resolution=label,
+                                kept_target=kept_target)
+
+    def resolve_batch(self, conflicts):
+        """
+        Decide a batch of detected conflicts, given as [(change, conflict_info, pk_col)].
+        Returns {change_id: ConflictDecision}.
+        """
+        return {change["id"]: self.resolve(change, conflict_info, pk_col)
+                for change, conflict_info, pk_col in conflicts}
+
+
+def compile_conflict_policy(conflict_resolution=None):
+    """Compile a pair's conflict_resolution (strategy name, policy dict or ConflictPolicy)."""
+    if isinstance(conflict_resolution, ConflictPolicy):
+        return conflict_resolution
+    if not conflict_resolution:
+        return ConflictPolicy()
+    if isinstance(conflict_resolution, str):
+        return ConflictPolicy(conflict_resolution)
+    return ConflictPolicy(conflict_resolution.get("default", DEFAULT_STRATEGY), conflict_resolution.get("tables"))
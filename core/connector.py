@@ -1,7 +1,7 @@
 import pymysql
 
-def connect_mysql(db_config):
-    """Create a pymysql connection using a DB config dict."""
+def connect_mysql(db_config, **options):
+    """Create a pymysql connection using a DB config dict. Extra options (e.g. timeouts) go to pymysql."""
     return pymysql.connect(
         host=db_config["host"],
         port=db_config.get("port", 3306),
@@ -9,5 +9,6 @@ def connect_mysql(db_config):
         password=db_config["password"],
         database=db_config["db"],
         cursorclass=pymysql.cursors.DictCursor,
-        autocommit=True
+        autocommit=True,
+        **options
     )
\ No newline at end of file
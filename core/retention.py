@@ -0,0 +1,285 @@
+"""
+change_log retention: remove rows every target has acknowledged, optionally archiving them
+to gzip-compressed JSON Lines files first.
+
+A row is acknowledged once it sits at or below the sync_cursor of every target for its
+table, so retention relies on cursor change tracking. Unpartitioned tables are purged in
+small id-ordered DELETE chunks; a partitioned change_log (ensure_change_log_table with
+partitioned=True) drops whole daily partitions instead.
+
+conflict_log detail older than conflict_log_days is purged (and archived) the same way;
+its totals stay in the conflict_stats rollup. Conflicts waiting for manual resolution
+are kept.
+"""
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from core.schema import (CHANGE_LOG_FUTURE_PARTITION, CHANGE_LOG_PARTITION_DAYS_AHEAD, CONFLICT_LOG_TABLE,
+                         SYNC_CURSOR_TABLE, build_change_log_partition_defs, is_change_log_partitioned)
+
+# Retention defaults, overridable per sync pair through "retention" in config.json
+DEFAULT_RETENTION_OPTIONS = {
+    "enabled": False,
+    "min_age_hours": 24,  # Keep acknowledged rows at least this long (useful for debugging)
+    "chunk_size": 1000,  # Rows per DELETE statement
+    "chunk_pause_seconds": 0.1,  # Pause between chunks so purging does not starve OLTP traffic
+    "max_seconds": 60,  # Time budget per database per run
+    "archive_dir": None,  # Write purged rows to <archive_dir>/change_log_<db>_<timestamp>.jsonl.gz first
+    "partitioned": False,  # Create change_log RANGE-partitioned by day (new tables only)
+    "conflict_log_days": None,  # Purge resolved conflict_log detail older than this many days (None keeps it)
+}
+
+
+def resolve_retention_options(options=None):
+    """Merge per-pair retention options over the defaults"""
+    resolved = dict(DEFAULT_RETENTION_OPTIONS)
+    if options:
+        resolved.update(options)
+    return resolved
+
+
+def get_purge_horizons(conn, source_node, target_nodes):
+    """
+    Highest change id per table that every target has acknowledged ({table: id}).
+    Tables without a cursor for some target are left out: nothing there is safe to remove.
+    """
+    placeholders = ", ".join(["%s"] * len(target_nodes))
+    with conn.cursor() as cur:
+        cur.execute(f"""
+                    SELECT table_name, MIN(last_change_id) AS horizon, COUNT(DISTINCT target_node) AS targets
+                    FROM `{SYNC_CURSOR_TABLE}`
+                    WHERE source_node = %s AND target_node IN ({placeholders})
+                    GROUP BY table_name
+                    """, [source_node, *target_nodes])
+        rows = cur.fetchall()
+
+    return {row["table_name"]: row["horizon"] for row in rows
+            if row["targets"] == len(target_nodes) and row["horizon"]}
+
+
+class ChangeLogArchive:
+    """Append-only gzip JSON Lines file for one retention run, opened on first write."""
+
+    def __init__(self, archive_dir, db_name, table="change_log"):
+        self.table = table
+        self.path = os.path.join(archive_dir, f"{table}_{db_name}_{datetime.now():%Y%m%d_%H%M%S}.jsonl.gz")
+        self.rows = 0
+        self._file = None
+
+    def write(self, rows):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = gzip.open(self.path, "at", encoding="utf-8")
+        for row in rows:
+            self._file.write(json.dumps(row, default=str) + "\n")
+        # Rows must be on disk before they are deleted from the database
+        self._file.flush()
+        self.rows += len(rows)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            print(f"    🗄️ Archived {self.rows} {self.table} rows to {self.path}")
+
+
+def purge_acknowledged_changes(conn, horizons, options, archive=None):
+    """
+    Delete acknowledged change_log rows older than min_age_hours, chunk by chunk, until done
+    or the time budget is spent. Returns the number of rows removed.
+    """
+    chunk_size = options["chunk_size"]
+    started = time.perf_counter()
+    purged = 0
+
+    for table, horizon in horizons.items():
+        while True:
+            if time.perf_counter() - started >= options["max_seconds"]:
+                print(f"    ⏸️ Retention time budget used up, {purged} rows purged so far")
+                return purged
+
+            filters = ("table_name = %s AND id <= %s "
+                       "AND created_at < NOW() - INTERVAL %s HOUR")
+            args = [table, horizon, options["min_age_hours"]]
+
+            with conn.cursor() as cur:
+                if archive:
+                    cur.execute(f"SELECT * FROM change_log WHERE {filters} ORDER BY id LIMIT %s",
+                                args + [chunk_size])
+                    rows = cur.fetchall()
+                    if not rows:
+                        break
+                    archive.write(rows)
+                    ids = [row["id"] for row in rows]
+                    cur.execute(f"DELETE FROM change_log WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+                    deleted = len(ids)
+                else:
+                    deleted = cur.execute(f"DELETE FROM change_log WHERE {filters} ORDER BY id LIMIT %s",
+                                          args + [chunk_size])
+
+            purged += deleted
+            if deleted < chunk_size:
+                break
+            time.sleep(options["chunk_pause_seconds"])
+
+        print(f"    🧽 {table}: change_log purged up to id {horizon}")
+
+    return purged
+
+
+def maintain_change_log_partitions(conn, horizons, options, archive=None, now=None):
+    """
+    Keep daily partitions created ahead of time and drop expired ones whose rows are all
+    acknowledged. Returns the number of partitions dropped.
+    """
+    now = now or datetime.now()
+    today = now.date()
+    oldest_kept = now - timedelta(hours=options["min_age_hours"])
+
+    with conn.cursor() as cur:
+        cur.execute("""
+                    SELECT PARTITION_NAME AS name
+                    FROM INFORMATION_SCHEMA.PARTITIONS
+                    WHERE TABLE_SCHEMA = DATABASE()
+                      AND TABLE_NAME = 'change_log'
+                      AND PARTITION_NAME IS NOT NULL
+                    ORDER BY PARTITION_ORDINAL_POSITION
+                    """)
+        names = [row["name"] for row in cur.fetchall()]
+
+    daily = [name for name in names if name != CHANGE_LOG_FUTURE_PARTITION]
+
+    # Split the catch-all partition so upcoming days always have their own partition
+    last_day = datetime.strptime(daily[-1], "p%Y%m%d").date() if daily else today - timedelta(days=1)
+    missing = (today + timedelta(days=CHANGE_LOG_PARTITION_DAYS_AHEAD) - last_day).days
+    if missing > 0:
+        new_defs = build_change_log_partition_defs(last_day + timedelta(days=1), missing)
+        new_defs.append(f"PARTITION {CHANGE_LOG_FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE change_log REORGANIZE PARTITION {CHANGE_LOG_FUTURE_PARTITION} "
+                        f"INTO ({', '.join(new_defs)})")
+        print(f"    📆 Added {missing} change_log partitions")
+
+    dropped = 0
+    for name in daily:
+        day = datetime.strptime(name, "p%Y%m%d").date()
+        if datetime.combine(day + timedelta(days=1), datetime.min.time()) > oldest_kept:
+            break  # partitions are in day order; the rest are too recent
+
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT table_name, MAX(id) AS max_id FROM change_log PARTITION ({name}) "
+                        f"GROUP BY table_name")
+            contents = cur.fetchall()
+
+        if any(row["max_id"] > horizons.get(row["table_name"], 0) for row in contents):
+            print(f"    ⏳ Partition {name} still holds unacknowledged changes, keeping it")
+            break
+
+        with conn.cursor() as cur:
+            last_id = 0
+            while archive and contents:
+                cur.execute(f"SELECT * FROM change_log PARTITION ({name}) WHERE id > %s ORDER BY id LIMIT %s",
+                            (last_id, options["chunk_size"]))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                archive.write(rows)
+                last_id = rows[-1]["id"]
+            cur.execute(f"ALTER TABLE change_log DROP PARTITION {name}")
+        dropped += 1
+        print(f"    🗑️ Dropped change_log partition {name}")
+
+    return dropped
+
+
+def apply_change_log_retention(conn, source_node, target_nodes, options=None):
+    """
+    Run retention on one database's change_log. `source_node` is this database's node id and
+    `target_nodes` the nodes it syncs to. Returns {"purged", "partitions_dropped"}.
+    """
+    options = resolve_retention_options(options)
+    result = {"purged": 0, "partitions_dropped": 0}
+    if not options["enabled"]:
+        return result
+
+    db_name = conn.db.decode()
+    horizons = get_purge_horizons(conn, source_node, target_nodes)
+    archive = ChangeLogArchive(options["archive_dir"], db_name) if options["archive_dir"] else None
+
+    try:
+        if is_change_log_partitioned(conn):
+            result["partitions_dropped"] = maintain_change_log_partitions(conn, horizons, options, archive)
+        elif horizons:
+            result["purged"] = purge_acknowledged_changes(conn, horizons, options, archive)
+    finally:
+        if archive:
+            archive.close()
+
+    print(f"    🧹 change_log retention on {db_name}: {result['purged']} rows purged, "
+          f"{result['partitions_dropped']} partitions dropped")
+    return result
+
+
+def purge_old_conflicts(conn, options, archive=None):
+    """
+    Delete resolved conflict_log rows older than conflict_log_days in id-ordered chunks,
+    within the time budget. Returns the number of rows removed.
+    """
+    chunk_size = options["chunk_size"]
+    started = time.perf_counter()
+    purged = 0
+    filters = "resolved_at < NOW() - INTERVAL %s DAY AND resolution <> 'manual'"
+
+    while time.perf_counter() - started < options["max_seconds"]:
+        with conn.cursor() as cur:
+            if archive:
+                cur.execute(f"SELECT * FROM `{CONFLICT_LOG_TABLE}` WHERE {filters} ORDER BY id LIMIT %s",
+                            (options["conflict_log_days"], chunk_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                archive.write(rows)
+                ids = [row["id"] for row in rows]
+                cur.execute(f"DELETE FROM `{CONFLICT_LOG_TABLE}` WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+                deleted = len(ids)
+            else:
+                deleted = cur.execute(f"DELETE FROM `{CONFLICT_LOG_TABLE}` WHERE {filters} ORDER BY id LIMIT %s",
+                                      (options["conflict_log_days"], chunk_size))
+
+        purged += deleted
+        if deleted < chunk_size:
+            break
+        time.sleep(options["chunk_pause_seconds"])
+    else:
+        print(f"    ⏸️ Retention time budget used up, {purged} conflict_log rows purged so far")
+
+    return purged
+
+
+def apply_conflict_log_retention(conn, options=None):
+    """
+    Purge old conflict_log detail on one database when conflict_log_days is set. Summaries
+    read conflict_stats, so they are unaffected. Returns the number of rows removed.
+    """
+    options = resolve_retention_options(options)
+    if not options["enabled"] or options["conflict_log_days"] is None:
+        return 0
+
+    with conn.cursor() as cur:
+        cur.execute(f"SHOW TABLES LIKE '{CONFLICT_LOG_TABLE}'")
+        if not cur.fetchone():
+            return 0
+
+    db_name = conn.db.decode()
+    archive = ChangeLogArchive(options["archive_dir"], db_name, CONFLICT_LOG_TABLE) if options["archive_dir"] else None
+    try:
+        purged = purge_old_conflicts(conn, options, archive)
+    finally:
+        if archive:
+            archive.close()
+
+    print(f"    🧹 conflict_log retention on {db_name}: {purged} rows older than "
+          f"{options['conflict_log_days']} days purged")
+    return purged
@@ -1,5 +1,6 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from core.sync_engine import sync_changes_with_conflict_resolution, sync_changes
+from core.conflict_policy import compile_conflict_policy
+from core.sync_engine import sync_changes_with_conflict_resolution, sync_changes, generate_database_node_id
 from core.connector import connect_mysql
 import logging
 
@@ -78,16 +79,30 @@ def start_sync_scheduler_with_conflict_resolution(config, node_id):
             name = pair["name"]
             tables = pair.get("tables", "all")
 
-            # Get conflict resolution strategy from config (default: timestamp_wins)
-            resolution_strategy = pair.get("conflict_resolution", "timestamp_wins")
+            sync_options = pair.get("sync_options", {})
+            capture = pair.get("capture") or {}
+            binlog_capture = capture.get("mode") == "binlog"
+            if binlog_capture:
+                # The binlog reader recognises the agent's own writes by their connection id
+                sync_options = dict(sync_options, binlog_session_marker=True)
 
             print(f"\n📋 Processing sync pair: {name}")
-            print(f"🛡️ Conflict resolution strategy: {resolution_strategy}")
 
             local_conn = None
             cloud_conn = None
 
             try:
+                # Get conflict resolution strategy from config (default: timestamp_wins); a
+                # misconfigured policy fails this pair only
+                resolution_strategy = compile_conflict_policy(pair.get("conflict_resolution", "timestamp_wins"))
+                print(f"🛡️ Conflict resolution strategy: {resolution_strategy}")
+
+                if binlog_capture:
+                    # Materialise new binlog row events into change_log before syncing
+                    from core.binlog_capture import capture_binlog_changes
+                    for side in ("local", "cloud"):
+                        capture_binlog_changes(pair[side], generate_database_node_id(name, side), tables, capture)
+
                 # Connect to both databases
                 local_conn = connect_mysql(pair["local"])
                 cloud_conn = connect_mysql(pair["cloud"])
@@ -97,12 +112,26 @@ def start_sync_scheduler_with_conflict_resolution(config, node_id):
 
                 # Bi-directional sync with conflict resolution
                 sync_changes_with_conflict_resolution(
-                    local_conn, cloud_conn, name, tables, resolution_strategy
+                    local_conn, cloud_conn, name, tables, resolution_strategy, sync_options
                 )
                 sync_changes_with_conflict_resolution(
-                    cloud_conn, local_conn, name, tables, resolution_strategy
+                    cloud_conn, local_conn, name, tables, resolution_strategy, sync_options
                 )
 
+                # Remove change_log rows both directions have acknowledged, and old conflict detail
+                retention = pair.get("retention") or {}
+                if retention.get("enabled"):
+                    from core.retention import apply_change_log_retention, apply_conflict_log_retention
+                    if sync_options.get("change_tracking", "cursor") != "cursor":
+                        print("⚠️ change_log retention needs change_tracking 'cursor', skipping")
+                    else:
+                        local_node_id = generate_database_node_id(name, "local")
+                        cloud_node_id = generate_database_node_id(name, "cloud")
+                        apply_change_log_retention(local_conn, local_node_id, [cloud_node_id], retention)
+                        apply_change_log_retention(cloud_conn, cloud_node_id, [local_node_id], retention)
+                    apply_conflict_log_retention(local_conn, retention)
+                    apply_conflict_log_retention(cloud_conn, retention)
+
             except Exception as e:
                 print(f"❌ Sync job failed: {e}")
                 import traceback
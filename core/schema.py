@@ -1,8 +1,26 @@
+import time
+import weakref
+from dataclasses import dataclass, field
+import hashlib
+import json
+from datetime import date, timedelta
+
 from pymysql.connections import Connection
 from pymysql.cursors import DictCursor
 
 CHANGE_LOG_TABLE = "change_log"
 
+# Bookkeeping tables owned by the sync agent; never captured or synced themselves
+SYNC_INTERNAL_TABLES = {"change_log", "sync_cursor", "conflict_log", "binlog_checkpoint", "sync_agent_session",
+                        "sync_trigger_state", "sync_column_version", "sync_clock", "row_version",
+                        "conflict_stats", "sync_failed_change"}
+
+# Columns recognised as "row last modified" markers, in order of preference
+TIMESTAMP_COLUMN_CANDIDATES = ("updated_at", "modified_at", "last_modified")
+
+# How long cached table metadata is trusted before the cheap DDL check runs again
+TABLE_META_RECHECK_SECONDS = 60
+
 CREATE_CHANGE_LOG_SQL = f"""
 CREATE TABLE IF NOT EXISTS `{CHANGE_LOG_TABLE}` (
     id BIGINT AUTO_INCREMENT PRIMARY KEY,
@@ -13,92 +31,817 @@ CREATE TABLE IF NOT EXISTS `{CHANGE_LOG_TABLE}` (
     source_node VARCHAR(64) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     applied_nodes JSON DEFAULT (JSON_ARRAY()),
+    row_format VARCHAR(16) NOT NULL DEFAULT 'full',
+    columns_version CHAR(12) NULL,
+    hlc VARCHAR(96) NULL,
+    INDEX idx_applied_source (source_node, created_at),
+    INDEX idx_table_created (table_name, created_at),
+    INDEX idx_table_id (table_name, id),
+    INDEX idx_row_hlc (table_name, row_pk, hlc),
+    INDEX idx_row_source_id (table_name, row_pk, source_node, id)
+);
+"""
+
+# Optional layout for retention by DROP PARTITION: one RANGE partition per day of created_at.
+# MySQL requires the partitioning column in every unique key, hence PRIMARY KEY (id, created_at).
+CREATE_PARTITIONED_CHANGE_LOG_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{CHANGE_LOG_TABLE}` (
+    id BIGINT AUTO_INCREMENT,
+    table_name VARCHAR(255) NOT NULL,
+    operation ENUM('INSERT', 'UPDATE', 'DELETE') NOT NULL,
+    row_pk VARCHAR(255) NOT NULL,
+    row_data JSON NULL,
+    source_node VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    applied_nodes JSON DEFAULT (JSON_ARRAY()),
+    row_format VARCHAR(16) NOT NULL DEFAULT 'full',
+    columns_version CHAR(12) NULL,
+    hlc VARCHAR(96) NULL,
+    PRIMARY KEY (id, created_at),
     INDEX idx_applied_source (source_node, created_at),
-    INDEX idx_table_created (table_name, created_at)
+    INDEX idx_table_created (table_name, created_at),
+    INDEX idx_table_id (table_name, id),
+    INDEX idx_row_hlc (table_name, row_pk, hlc),
+    INDEX idx_row_source_id (table_name, row_pk, source_node, id)
+)
+PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+{{partitions}}
+);
+"""
+
+# Daily partitions created ahead of time; the catch-all partition holds anything later
+CHANGE_LOG_PARTITION_DAYS_AHEAD = 7
+CHANGE_LOG_FUTURE_PARTITION = "p_future"
+
+# Columns added to change_log after its first release, checked on every startup
+CHANGE_LOG_UPGRADE_COLUMNS = [
+    ("applied_nodes", "JSON DEFAULT (JSON_ARRAY())"),
+    ("row_format", "VARCHAR(16) NOT NULL DEFAULT 'full'"),
+    ("columns_version", "CHAR(12) NULL"),
+    ("hlc", "VARCHAR(96) NULL"),
+]
+
+# Indexes added to change_log after its first release: name -> column list
+CHANGE_LOG_UPGRADE_INDEXES = [
+    ("idx_table_id", "table_name, id"),  # cursor fetches scan `table_name = ? AND id > ?`
+    ("idx_row_hlc", "table_name, row_pk, hlc"),  # latest version of a row, for HLC conflict checks
+    ("idx_row_source_id", "table_name, row_pk, source_node, id"),  # unacknowledged local edits of a row
+]
+
+# Change capture defaults; overridable per sync pair ("capture") and per table
+DEFAULT_CAPTURE_OPTIONS = {
+    "mode": "triggers",  # 'triggers' (generated AFTER triggers) or 'binlog' (row events, see core.binlog_capture)
+    "update_capture": "full",  # 'full' row image or 'delta' (changed columns + PK only)
+    "skip_noop_updates": False,  # don't log UPDATEs that leave every column unchanged
+    "echo": "suppress",  # writes made by the sync agent: 'suppress', 'tag' with origin node, or 'capture'
+    "row_encoding": "json",  # row_data as a JSON object ('json') or a positional JSON array ('compact')
+    "hlc": False,  # stamp every change with a hybrid logical clock version (change_log.hlc); costs a read per row
+    "row_versions": False,  # keep the current version of each row in row_version (needs hlc)
+}
+
+# Session variable the sync agent sets on its target connection to the node the applied
+# changes came from; generated triggers check it to recognise the agent's own writes
+SYNC_ORIGIN_VARIABLE = "@sync_origin_node"
+
+# Hybrid logical clock versions: "<physical µs>.<counter>.<node id>", zero-padded so that
+# comparing the strings compares the versions
+HLC_VARIABLE = "@sync_hlc"
+HLC_PHYSICAL_DIGITS = 16
+HLC_COUNTER_DIGITS = 6
+SYNC_CLOCK_TABLE = "sync_clock"
+
+# Per database floor for the trigger clocks: the physical part of the newest version the
+# sync agent applied there
+CREATE_SYNC_CLOCK_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{SYNC_CLOCK_TABLE}` (
+    node_id VARCHAR(64) NOT NULL PRIMARY KEY,
+    physical BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+"""
+
+ROW_VERSION_TABLE = "row_version"
+
+# Current version of every captured row: written by the triggers for local edits and by
+# the sync agent for the changes it applies, so conflict checks are keyed lookups
+CREATE_ROW_VERSION_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{ROW_VERSION_TABLE}` (
+    table_name VARCHAR(255) NOT NULL,
+    row_pk VARCHAR(255) NOT NULL,
+    version VARCHAR(96) NOT NULL,
+    node VARCHAR(64) NOT NULL,
+    PRIMARY KEY (table_name, row_pk)
+);
+"""
+
+SYNC_CURSOR_TABLE = "sync_cursor"
+
+# Per (source, target, table) high-water mark into the source change_log
+CREATE_SYNC_CURSOR_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{SYNC_CURSOR_TABLE}` (
+    source_node VARCHAR(64) NOT NULL,
+    target_node VARCHAR(64) NOT NULL,
+    table_name VARCHAR(255) NOT NULL,
+    last_change_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (source_node, target_node, table_name)
+);
+"""
+
+SYNC_FAILED_CHANGE_TABLE = "sync_failed_change"
+
+# Changes that failed to apply, next to the cursors they hold back: attempts so far and the
+# last error. Once a change reaches max_change_attempts it is dead-lettered here (with its
+# row data, as retention may purge it from change_log) and the cursor moves past it
+CREATE_SYNC_FAILED_CHANGE_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{SYNC_FAILED_CHANGE_TABLE}` (
+    source_node VARCHAR(64) NOT NULL,
+    target_node VARCHAR(64) NOT NULL,
+    change_id BIGINT NOT NULL,
+    table_name VARCHAR(255) NOT NULL,
+    operation VARCHAR(10) NOT NULL,
+    row_pk VARCHAR(255) NOT NULL,
+    row_data JSON NULL,
+    attempts INT UNSIGNED NOT NULL DEFAULT 1,
+    last_error TEXT NULL,
+    first_failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    dead_lettered_at TIMESTAMP NULL,
+    PRIMARY KEY (source_node, target_node, change_id),
+    INDEX idx_dead_lettered (dead_lettered_at)
+);
+"""
+
+BINLOG_CHECKPOINT_TABLE = "binlog_checkpoint"
+SYNC_AGENT_SESSION_TABLE = "sync_agent_session"
+
+# Binlog capture: last fully materialised transaction per capturing node
+CREATE_BINLOG_CHECKPOINT_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{BINLOG_CHECKPOINT_TABLE}` (
+    node_id VARCHAR(64) NOT NULL PRIMARY KEY,
+    log_file VARCHAR(255) NOT NULL,
+    log_pos BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+"""
+
+# Binlog capture: connections the sync agent applies changes on. Binlog events carry no
+# session variables, so the agent announces its connection id here and the reader skips
+# (or tags) transactions issued by those threads. Connection ids restart with the server,
+# so each marker also records when the server started (see SERVER_STARTED_SQL)
+CREATE_SYNC_AGENT_SESSION_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{SYNC_AGENT_SESSION_TABLE}` (
+    connection_id BIGINT UNSIGNED NOT NULL PRIMARY KEY,
+    origin_node VARCHAR(64) NOT NULL,
+    server_started BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+"""
+
+# Unix time the server started, which tells connection ids of different server runs apart
+SERVER_STARTED_SQL = ("UNIX_TIMESTAMP() - (SELECT VARIABLE_VALUE FROM performance_schema.global_status "
+                      "WHERE VARIABLE_NAME = 'Uptime')")
+
+
+CONFLICT_LOG_TABLE = "conflict_log"
+
+# Conflicts detected and how they were resolved, written on the target of each direction
+CREATE_CONFLICT_LOG_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{CONFLICT_LOG_TABLE}` (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    change_id BIGINT NOT NULL,
+    table_name VARCHAR(255) NOT NULL,
+    record_pk VARCHAR(255) NOT NULL,
+    conflict_type VARCHAR(50) NOT NULL,
+    source_data JSON,
+    target_data JSON,
+    conflict_details JSON,
+    resolution VARCHAR(50) NOT NULL,
+    resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_table_pk (table_name, record_pk),
+    INDEX idx_resolved_at (resolved_at),
+    INDEX idx_resolution (resolution)
+);
+"""
+
+CONFLICT_STATS_TABLE = "conflict_stats"
+
+# Hourly rollup of conflict_log, maintained as conflicts are written so summaries and
+# trends never scan the detail table (which retention may purge)
+CREATE_CONFLICT_STATS_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{CONFLICT_STATS_TABLE}` (
+    table_name VARCHAR(255) NOT NULL,
+    conflict_type VARCHAR(50) NOT NULL,
+    resolution VARCHAR(50) NOT NULL,
+    hour_start DATETIME NOT NULL,
+    conflict_count BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    last_conflict_at TIMESTAMP NULL,
+    PRIMARY KEY (table_name, conflict_type, resolution, hour_start),
+    INDEX idx_hour (hour_start)
 );
 """
 
 
-def ensure_change_log_table(conn: Connection):
-    """Create change_log table and ensure required fields exist."""
+def hour_bucket_sql(expression):
+    """SQL truncating a DATETIME/TIMESTAMP expression to the start of its hour"""
+    return f"TIMESTAMP(DATE({expression}), MAKETIME(HOUR({expression}), 0, 0))"
+
+
+# Connections conflict_log has been ensured on; the DDL takes a metadata lock, so it runs
+# once per connection instead of once per conflict
+_conflict_log_ensured = weakref.WeakSet()
+
+
+def change_log_partition_name(day: date):
+    """Name of the partition holding rows created on `day`."""
+    return f"p{day:%Y%m%d}"
+
+
+def build_change_log_partition_defs(first_day: date, days: int):
+    """PARTITION clauses for `days` daily partitions starting at `first_day`."""
+    return [
+        f"PARTITION {change_log_partition_name(day)} VALUES LESS THAN "
+        f"(UNIX_TIMESTAMP('{day + timedelta(days=1):%Y-%m-%d}'))"
+        for day in (first_day + timedelta(days=offset) for offset in range(days))
+    ]
+
+
+def is_change_log_partitioned(conn: Connection):
+    with conn.cursor() as cur:
+        cur.execute("""
+                    SELECT COUNT(*) AS partitions
+                    FROM INFORMATION_SCHEMA.PARTITIONS
+                    WHERE TABLE_SCHEMA = DATABASE()
+                      AND TABLE_NAME = 'change_log'
+                      AND PARTITION_NAME IS NOT NULL
+                    """)
+        return cur.fetchone()["partitions"] > 0
+
+TRIGGER_STATE_TABLE = "sync_trigger_state"
+
+# Fingerprint of the triggers deployed on each table, so unchanged tables are not redeployed
+CREATE_TRIGGER_STATE_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{TRIGGER_STATE_TABLE}` (
+    table_name VARCHAR(255) NOT NULL PRIMARY KEY,
+    fingerprint CHAR(64) NOT NULL,
+    deployed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+"""
+
+TRIGGER_OPERATIONS = ("INSERT", "UPDATE", "DELETE")
+
+COLUMN_VERSION_TABLE = "sync_column_version"
+COMPACT_ROW_FORMAT = "compact"
+
+# Column lists referenced by compact row_data (positional arrays), keyed by a hash of the list
+CREATE_COLUMN_VERSION_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{COLUMN_VERSION_TABLE}` (
+    table_name VARCHAR(255) NOT NULL,
+    version CHAR(12) NOT NULL,
+    columns JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, version)
+);
+"""
+
+# Registered column lists never change, so lookups are cached for the life of the process
+_column_version_cache = {}
+
+
+def ensure_change_log_table(conn: Connection, partitioned: bool = False):
+    """Create change_log table and ensure required fields exist.
+
+    With `partitioned`, a new change_log is created RANGE-partitioned by day so retention
+    can drop whole partitions (see core.retention). An existing unpartitioned table is
+    left as it is.
+    """
     with conn.cursor() as cur:
         # Create table if it doesn't exist
-        cur.execute(CREATE_CHANGE_LOG_SQL)
+        if partitioned:
+            partitions = build_change_log_partition_defs(date.today(), CHANGE_LOG_PARTITION_DAYS_AHEAD)
+            partitions.append(f"PARTITION {CHANGE_LOG_FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+            cur.execute(CREATE_PARTITIONED_CHANGE_LOG_SQL.format(partitions=",\n".join(partitions)))
+            if not is_change_log_partitioned(conn):
+                print("    ⚠️ change_log already exists unpartitioned; retention will purge it in chunks. "
+                      "Rebuild it (empty) to switch to the partitioned layout")
+        else:
+            cur.execute(CREATE_CHANGE_LOG_SQL)
         print("    ✅ change_log table ensured")
 
-        # Check if `applied_nodes` column exists (for legacy compatibility)
-        cur.execute("""
+        # Check that columns added in later versions exist (for legacy compatibility)
+        for column, definition in CHANGE_LOG_UPGRADE_COLUMNS:
+            cur.execute("""
+                        SELECT COLUMN_NAME
+                        FROM INFORMATION_SCHEMA.COLUMNS
+                        WHERE TABLE_SCHEMA = DATABASE()
+                          AND TABLE_NAME = 'change_log'
+                          AND COLUMN_NAME = %s
+                        """, (column,))
+
+            if not cur.fetchone():
+                print(f"    🔧 Adding missing `{column}` column...")
+                cur.execute(f"""
+                            ALTER TABLE change_log
+                                ADD COLUMN {column} {definition}
+                            """)
+                print(f"    ✅ {column} column added")
+
+        for index, index_columns in CHANGE_LOG_UPGRADE_INDEXES:
+            cur.execute("""
+                        SELECT INDEX_NAME
+                        FROM INFORMATION_SCHEMA.STATISTICS
+                        WHERE TABLE_SCHEMA = DATABASE()
+                          AND TABLE_NAME = 'change_log'
+                          AND INDEX_NAME = %s
+                        LIMIT 1
+                        """, (index,))
+
+            if not cur.fetchone():
+                print(f"    🔧 Adding `{index}` index to change_log...")
+                cur.execute(f"ALTER TABLE change_log ADD INDEX {index} ({index_columns})")
+                print(f"    ✅ {index} index added")
+
+        cur.execute(CREATE_SYNC_CURSOR_SQL)
+        cur.execute(CREATE_SYNC_FAILED_CHANGE_SQL)
+        print("    ✅ sync_cursor table ensured")
+
+        cur.execute(CREATE_SYNC_CLOCK_SQL)
+        cur.execute(CREATE_ROW_VERSION_SQL)
+
+
+def ensure_conflict_log_table(conn: Connection):
+    """
+    Create conflict_log and its conflict_stats rollup if needed, at most once per connection.
+    A newly created conflict_stats is backfilled from the conflict_log rows already there.
+    """
+    if conn in _conflict_log_ensured:
+        return
+    with conn.cursor() as cur:
+        cur.execute(CREATE_CONFLICT_LOG_SQL)
+
+        cur.execute(f"SHOW TABLES LIKE '{CONFLICT_STATS_TABLE}'")
+        if not cur.fetchone():
+            cur.execute(CREATE_CONFLICT_STATS_SQL)
+            backfilled = cur.execute(f"""
+                        INSERT INTO `{CONFLICT_STATS_TABLE}`
+                        (table_name, conflict_type, resolution, hour_start, conflict_count, last_conflict_at)
+                        SELECT table_name, conflict_type, resolution, {hour_bucket_sql("resolved_at")},
+                               COUNT(*), MAX(resolved_at)
+                        FROM `{CONFLICT_LOG_TABLE}`
+                        GROUP BY table_name, conflict_type, resolution, {hour_bucket_sql("resolved_at")}
+                        """)
+            print(f"    ✅ conflict_stats table created ({backfilled} hourly rows backfilled)")
+    _conflict_log_ensured.add(conn)
+
+
+def ensure_binlog_capture_tables(conn: Connection):
+    """Create the bookkeeping tables used by binlog capture."""
+    with conn.cursor() as cur:
+        cur.execute(CREATE_BINLOG_CHECKPOINT_SQL)
+        cur.execute(CREATE_SYNC_AGENT_SESSION_SQL)
+
+        # server_started was added later
+        cur.execute(f"""
                     SELECT COLUMN_NAME
                     FROM INFORMATION_SCHEMA.COLUMNS
                     WHERE TABLE_SCHEMA = DATABASE()
-                      AND TABLE_NAME = 'change_log'
-                      AND COLUMN_NAME = 'applied_nodes'
+                      AND TABLE_NAME = '{SYNC_AGENT_SESSION_TABLE}'
+                      AND COLUMN_NAME = 'server_started'
                     """)
-
         if not cur.fetchone():
-            print("    🔧 Adding missing `applied_nodes` column...")
-            cur.execute("""
-                        ALTER TABLE change_log
-                            ADD COLUMN applied_nodes JSON DEFAULT (JSON_ARRAY())
-                        """)
-            print("    ✅ applied_nodes column added")
+            cur.execute(f"ALTER TABLE `{SYNC_AGENT_SESSION_TABLE}` "
+                        f"ADD COLUMN server_started BIGINT NOT NULL DEFAULT 0 AFTER origin_node")
+    print("    ✅ binlog capture tables ensured")
+
+
+def migrate_applied_nodes_to_cursors(conn: Connection, source_node: str, target_node: str, tables=None):
+    """
+    Derive initial sync_cursor rows from existing applied_nodes data.
+
+    For each table the cursor is placed just below the oldest change not yet applied to
+    `target_node` (or at the newest change when everything is applied). Only tables that
+    have no cursor for this source and target are scanned, and existing cursors are never
+    moved. The scan is a plain (non-locking) SELECT, so it does not block trigger inserts
+    into change_log. Returns the number of cursors created.
+    """
+    sql = """
+          SELECT table_name,
+                 COALESCE(
+                         MIN(CASE
+                                 WHEN applied_nodes IS NULL OR JSON_SEARCH(applied_nodes, 'one', %s) IS NULL
+                                     THEN id END) - 1,
+                         MAX(id)
+                 ) AS last_change_id
+          FROM change_log
+          WHERE table_name NOT IN (SELECT table_name
+                                   FROM sync_cursor
+                                   WHERE source_node = %s
+                                     AND target_node = %s)
+          """
+    args = [target_node, source_node, target_node]
+
+    if tables:
+        placeholders = ", ".join(["%s"] * len(tables))
+        sql += f" AND table_name IN ({placeholders})"
+        args.extend(tables)
+
+    sql += " GROUP BY table_name"
+
+    with conn.cursor() as cur:
+        cur.execute(sql, args)
+        rows = cur.fetchall()
+        if not rows:
+            return 0
+
+        placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(rows))
+        cur.execute(f"""
+                    INSERT IGNORE INTO sync_cursor (source_node, target_node, table_name, last_change_id)
+                    VALUES {placeholders}
+                    """, [value for row in rows
+                          for value in (source_node, target_node, row["table_name"], row["last_change_id"])])
+        return cur.rowcount
 
 
 def get_table_list(conn: Connection, db_name: str, tables_spec):
-    """Get list of tables to sync, excluding change_log."""
+    """Get list of tables to sync, excluding the sync agent's own tables."""
     with conn.cursor() as cur:
         if tables_spec == "all":
             cur.execute("SHOW TABLES")
             result = cur.fetchall()
-            # Extract table names from result and exclude change_log
+            # Extract table names from result and exclude the sync agent's own tables
             all_tables = [list(row.values())[0] for row in result]
-            return [t for t in all_tables if t != "change_log"]
+            return [t for t in all_tables if t not in SYNC_INTERNAL_TABLES]
         elif isinstance(tables_spec, list):
-            return [t for t in tables_spec if t != "change_log"]
+            return [t for t in tables_spec if t not in SYNC_INTERNAL_TABLES]
         else:
             raise ValueError("Invalid `tables` field. Use 'all' or list of table names.")
 
 
-def get_primary_key_column(conn: Connection, db_name: str, table_name: str):
-    """Get the primary key column name for a table."""
+@dataclass
+class TableMeta:
+    """Cached schema metadata for one table on one connection target."""
+    table_name: str
+    pk_columns: list
+    columns: list
+    column_types: dict
+    timestamp_column: str = None
+    ddl_signature: tuple = None
+    checked_at: float = field(default=0.0, compare=False)
+
+    @property
+    def pk_column(self):
+        return self.pk_columns[0] if self.pk_columns else None
+
+
+# (host, port, db_name, table_name) -> TableMeta
+_table_meta_cache = {}
+
+
+def _meta_cache_key(conn: Connection, db_name: str, table_name: str):
+    return getattr(conn, "host", None), getattr(conn, "port", None), db_name, table_name
+
+
+def _fetch_column_rows(conn: Connection, db_name: str, table_name: str):
+    """Name, types, key and position of every column of a table, in one query."""
     with conn.cursor() as cur:
         cur.execute("""
-                    SELECT COLUMN_NAME
+                    SELECT COLUMN_NAME, DATA_TYPE, COLUMN_TYPE, COLUMN_KEY, ORDINAL_POSITION
                     FROM INFORMATION_SCHEMA.COLUMNS
                     WHERE TABLE_SCHEMA = %s
                       AND TABLE_NAME = %s
-                      AND COLUMN_KEY = 'PRI'
-                    ORDER BY ORDINAL_POSITION LIMIT 1
+                    ORDER BY ORDINAL_POSITION
                     """, (db_name, table_name))
+        return cur.fetchall()
+
+
+def _ddl_signature(rows):
+    """Fingerprint of a table's definition, so renames, type changes and reorders are noticed."""
+    return tuple((row["ORDINAL_POSITION"], row["COLUMN_NAME"], row["COLUMN_TYPE"], row["COLUMN_KEY"])
+                 for row in rows)
+
+
+def _build_table_meta(table_name: str, rows):
+    """TableMeta (PK, ordered columns, column types) from the table's column rows."""
+    columns = [row["COLUMN_NAME"] for row in rows]
+    timestamp_column = next((c for c in TIMESTAMP_COLUMN_CANDIDATES if c in columns), None)
+
+    return TableMeta(
+        table_name=table_name,
+        pk_columns=[row["COLUMN_NAME"] for row in rows if row["COLUMN_KEY"] == "PRI"],
+        columns=columns,
+        column_types={row["COLUMN_NAME"]: row["DATA_TYPE"].lower() for row in rows},
+        timestamp_column=timestamp_column,
+        ddl_signature=_ddl_signature(rows),
+    )
+
+
+def get_table_meta(conn: Connection, db_name: str, table_name: str, max_age=TABLE_META_RECHECK_SECONDS):
+    """
+    Return cached TableMeta for a table, loading it on first use.
+
+    Entries older than `max_age` seconds are revalidated against the per-column DDL
+    signature and rebuilt only when the table definition changed. Returns None for
+    unknown tables.
+    """
+    key = _meta_cache_key(conn, db_name, table_name)
+    meta = _table_meta_cache.get(key)
+    now = time.monotonic()
+
+    if meta and now - meta.checked_at < max_age:
+        return meta
+
+    rows = _fetch_column_rows(conn, db_name, table_name)
+    if meta and rows and _ddl_signature(rows) == meta.ddl_signature:
+        meta.checked_at = now
+        return meta
+
+    if not rows:
+        _table_meta_cache.pop(key, None)
+        return None
+
+    meta = _build_table_meta(table_name, rows)
+    meta.checked_at = now
+    _table_meta_cache[key] = meta
+    return meta
+
+
+def invalidate_table_meta(conn: Connection = None, db_name: str = None, table_name: str = None):
+    """Drop cached metadata. With no arguments everything is cleared; otherwise only matching entries."""
+    if conn is None and db_name is None and table_name is None:
+        _table_meta_cache.clear()
+        return
+
+    host, port = (getattr(conn, "host", None), getattr(conn, "port", None)) if conn is not None else (None, None)
+    for key in list(_table_meta_cache):
+        key_host, key_port, key_db, key_table = key
+        if conn is not None and (key_host, key_port) != (host, port):
+            continue
+        if db_name is not None and key_db != db_name:
+            continue
+        if table_name is not None and key_table != table_name:
+            continue
+        del _table_meta_cache[key]
+
 
-        row = cur.fetchone()
-        return row['COLUMN_NAME'] if row else None
+def get_primary_key_column(conn: Connection, db_name: str, table_name: str):
+    """Get the primary key column name for a table."""
+    meta = get_table_meta(conn, db_name, table_name)
+    return meta.pk_column if meta else None
 
 
 def get_table_columns(conn: Connection, db_name: str, table_name: str):
     """Get all column names for a table."""
+    meta = get_table_meta(conn, db_name, table_name)
+    return list(meta.columns) if meta else []
+
+
+def get_timestamp_column(conn: Connection, db_name: str, table_name: str):
+    """Get the table's updated_at/modified_at/last_modified column, if it has one."""
+    meta = get_table_meta(conn, db_name, table_name)
+    return meta.timestamp_column if meta else None
+
+
+def columns_version(columns):
+    """Short stable id of an ordered column list, stored with every compact row."""
+    return hashlib.sha1(",".join(columns).encode()).hexdigest()[:12]
+
+
+def register_columns_version(conn: Connection, table_name: str, columns):
+    """Record the column list compact rows of `table_name` are encoded against; returns its version."""
+    version = columns_version(columns)
+    with conn.cursor() as cur:
+        cur.execute(CREATE_COLUMN_VERSION_SQL)
+        cur.execute(f"INSERT IGNORE INTO `{COLUMN_VERSION_TABLE}` (table_name, version, columns) VALUES (%s, %s, %s)",
+                    (table_name, version, json.dumps(list(columns))))
+    return version
+
+
+def get_versioned_columns(conn: Connection, db_name: str, table_name: str, version: str):
+    """Column list a compact row was encoded against (the current columns when nothing changed since)."""
+    key = (_meta_cache_key(conn, db_name, table_name), version)
+    if key not in _column_version_cache:
+        current = get_table_columns(conn, db_name, table_name)
+        if current and columns_version(current) == version:
+            _column_version_cache[key] = list(current)
+        else:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT columns FROM `{COLUMN_VERSION_TABLE}` WHERE table_name = %s AND version = %s",
+                            (table_name, version))
+                row = cur.fetchone()
+            if not row:
+                raise ValueError(f"Unknown column list version {version} for table {table_name}")
+            _column_version_cache[key] = json.loads(row["columns"])
+    return _column_version_cache[key]
+
+
+def format_hlc(physical: int, counter: int, node_id: str):
+    """Version string for a hybrid logical clock reading (see build_hlc_statements)."""
+    return f"{physical:0{HLC_PHYSICAL_DIGITS}d}.{counter:0{HLC_COUNTER_DIGITS}d}.{node_id}"
+
+
+def parse_hlc(hlc: str):
+    """Split a version string into (physical, counter, node_id)."""
+    physical, counter, node_id = hlc.split(".", 2)
+    return int(physical), int(counter), node_id
+
+
+def resolve_capture_options(capture, table_name):
+    """Merge defaults, pair-level capture options and the table's own overrides."""
+    resolved = dict(DEFAULT_CAPTURE_OPTIONS)
+    if capture:
+        resolved.update({k: v for k, v in capture.items() if k != "tables"})
+        resolved.update(capture.get("tables", {}).get(table_name, {}))
+    return resolved
+
+
+def build_hlc_statements(node_id: str):
+    """
+    Trigger statements that advance this connection's hybrid logical clock and leave the
+    next version string in @sync_hlc.
+
+    Physical time is NOW(6) in microseconds, never below the floor the sync agent keeps in
+    sync_clock (the newest version it applied here), so a local edit made after a sync always
+    sorts after the change it overwrote. The counter orders rows written within the same
+    microsecond. The clock lives in session variables, so capturing takes no locks.
+    """
+    return [
+        f"SET {HLC_VARIABLE}_now = GREATEST(CAST(UNIX_TIMESTAMP(NOW(6)) * 1000000 AS UNSIGNED),",
+        f"    IFNULL((SELECT physical FROM `{SYNC_CLOCK_TABLE}` WHERE node_id = '{node_id}'), 0));",
+        f"SET {HLC_VARIABLE}_counter = IF({HLC_VARIABLE}_now <= IFNULL({HLC_VARIABLE}_physical, 0), "
+        f"{HLC_VARIABLE}_counter + 1, 0);",
+        f"SET {HLC_VARIABLE}_physical = GREATEST({HLC_VARIABLE}_now, IFNULL({HLC_VARIABLE}_physical, 0));",
+        f"SET {HLC_VARIABLE} = CONCAT(LPAD({HLC_VARIABLE}_physical, {HLC_PHYSICAL_DIGITS}, '0'), '.', "
+        f"LPAD({HLC_VARIABLE}_counter, {HLC_COUNTER_DIGITS}, '0'), '.', '{node_id}');",
+    ]
+
+
+def build_trigger_sql(table: str, op: str, pk: str, columns, node_id: str, capture=None):
+    """Build the CREATE TRIGGER statement that records `op` on `table` into change_log."""
+    capture = capture or dict(DEFAULT_CAPTURE_OPTIONS)
+    trig_name = f"trg_{table}_{op.lower()}"
+    row = "OLD" if op == "DELETE" else "NEW"
+    row_data_expr = "JSON_OBJECT(" + ", ".join(f"'{col}', {row}.`{col}`" for col in columns) + ")"
+
+    delta = op == "UPDATE" and capture["update_capture"] == "delta"
+    skip_noop = op == "UPDATE" and capture.get("skip_noop_updates")
+    echo = capture.get("echo", "suppress")
+    hlc = capture.get("hlc", False)
+    row_versions = hlc and capture.get("row_versions")
+
+    format_columns = format_values = ""
+    if capture.get("row_encoding") == "compact" and not delta:
+        # Values only, in column order; the column list is registered under its version
+        row_data_expr = "JSON_ARRAY(" + ", ".join(f"{row}.`{col}`" for col in columns) + ")"
+        format_columns = ", row_format, columns_version"
+        format_values = f", '{COMPACT_ROW_FORMAT}', '{columns_version(columns)}'"
+
+    hlc_column, hlc_value = (", hlc", f", {HLC_VARIABLE}") if hlc else ("", "")
+
+    # Writes made by the sync agent are either skipped or tagged with the node they came from
+    source_expr = f"COALESCE({SYNC_ORIGIN_VARIABLE}, '{node_id}')" if echo == "tag" else f"'{node_id}'"
+    suppress_echo = f"{SYNC_ORIGIN_VARIABLE} IS NULL" if echo == "suppress" else None
+
+    if not delta and not skip_noop and not hlc:
+        if suppress_echo:
+            return f"""
+            CREATE TRIGGER `{trig_name}` 
+            AFTER {op} ON `{table}`
+            FOR EACH ROW
+            INSERT INTO change_log (table_name, operation, row_pk, row_data, source_node{format_columns})
+            SELECT
+                '{table}',
+                '{op}',
+                {row}.`{pk}`,
+                {row_data_expr},
+                {source_expr}{format_values}
+            FROM DUAL
+            WHERE {suppress_echo}
+            """
+
+        return f"""
+            CREATE TRIGGER `{trig_name}` 
+            AFTER {op} ON `{table}`
+            FOR EACH ROW
+            INSERT INTO change_log (table_name, operation, row_pk, row_data, source_node{format_columns})
+            VALUES (
+                '{table}',
+                '{op}',
+                {row}.`{pk}`,
+                {row_data_expr},
+                {source_expr}{format_values}
+            )
+            """
+
+    declarations = []
+    statements = build_hlc_statements(node_id) if hlc else []
+    if delta:
+        # Record only the columns that actually changed, plus the PK. A PK change is
+        # captured as a full row so the target can still locate the row.
+        declarations = [
+            "DECLARE row_delta JSON;",
+            "DECLARE delta_format VARCHAR(16) DEFAULT 'delta';",
+        ]
+        statements += [
+            f"IF NOT (OLD.`{pk}` <=> NEW.`{pk}`) THEN",
+            f"    SET row_delta = {row_data_expr};",
+            "    SET delta_format = 'full';",
+            "ELSE",
+            f"    SET row_delta = JSON_OBJECT('{pk}', NEW.`{pk}`);",
+        ]
+        statements += [
+            f"    IF NOT (OLD.`{col}` <=> NEW.`{col}`) THEN "
+            f"SET row_delta = JSON_SET(row_delta, '$.\"{col}\"', NEW.`{col}`); END IF;"
+            for col in columns if col != pk
+        ]
+        statements += [
+            "END IF;",
+            f"INSERT INTO change_log (table_name, operation, row_pk, row_data, source_node, row_format{hlc_column})",
+            f"VALUES ('{table}', 'UPDATE', NEW.`{pk}`, row_delta, {source_expr}, delta_format{hlc_value});",
+        ]
+    else:
+        statements += [
+            f"INSERT INTO change_log (table_name, operation, row_pk, row_data, source_node{format_columns}{hlc_column})",
+            f"VALUES ('{table}', '{op}', {row}.`{pk}`, {row_data_expr}, {source_expr}{format_values}{hlc_value});",
+        ]
+
+    if row_versions:
+        statements += [
+            f"INSERT INTO `{ROW_VERSION_TABLE}` (table_name, row_pk, version, node)",
+            f"VALUES ('{table}', {row}.`{pk}`, {HLC_VARIABLE}, '{node_id}')",
+            "ON DUPLICATE KEY UPDATE version = VALUES(version), node = VALUES(node);",
+        ]
+
+    conditions = [suppress_echo] if suppress_echo else []
+    if skip_noop:
+        # Statements that leave every tracked column as it was are not captured at all
+        unchanged = " AND ".join(f"OLD.`{col}` <=> NEW.`{col}`" for col in columns)
+        conditions.append(f"NOT ({unchanged})")
+    if conditions:
+        statements = [f"IF {' AND '.join(conditions)} THEN"] + ["    " + line for line in statements] + ["END IF;"]
+
+    body = "\n".join("                " + line for line in declarations + statements)
+    return f"""
+            CREATE TRIGGER `{trig_name}` 
+            AFTER {op} ON `{table}`
+            FOR EACH ROW
+            BEGIN
+{body}
+            END
+            """
+
+
+def trigger_fingerprint(create_statements):
+    """Hash of a table's generated trigger SQL; it covers columns, PK, node id and capture options."""
+    digest = hashlib.sha256()
+    for sql in create_statements:
+        digest.update(" ".join(sql.split()).encode())
+    return digest.hexdigest()
+
+
+def load_trigger_state(conn: Connection, db_name: str):
+    """Return ({table: stored fingerprint}, set of existing trg_* trigger names)."""
     with conn.cursor() as cur:
+        cur.execute(CREATE_TRIGGER_STATE_SQL)
+        # Used by the generated triggers
+        cur.execute(CREATE_SYNC_CLOCK_SQL)
+        cur.execute(CREATE_ROW_VERSION_SQL)
+        cur.execute(f"SELECT table_name, fingerprint FROM `{TRIGGER_STATE_TABLE}`")
+        fingerprints = {row["table_name"]: row["fingerprint"] for row in cur.fetchall()}
+
         cur.execute("""
-                    SELECT COLUMN_NAME
-                    FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE TABLE_SCHEMA = %s
-                      AND TABLE_NAME = %s
-                    ORDER BY ORDINAL_POSITION
-                    """, (db_name, table_name))
-        return [row["COLUMN_NAME"] for row in cur.fetchall()]
+                    SELECT TRIGGER_NAME
+                    FROM INFORMATION_SCHEMA.TRIGGERS
+                    WHERE TRIGGER_SCHEMA = %s
+                      AND TRIGGER_NAME LIKE 'trg\\_%%'
+                    """, (db_name,))
+        existing = {row["TRIGGER_NAME"] for row in cur.fetchall()}
+
+    return fingerprints, existing
+
+
+def setup_triggers(conn: Connection, db_name: str, tables, node_id, capture=None, force=False):
+    """Create change_log triggers on specified tables.
 
+    `capture` holds trigger options (see DEFAULT_CAPTURE_OPTIONS), optionally with
+    per-table overrides under "tables".
 
-def setup_triggers(conn: Connection, db_name: str, tables, node_id):
-    """Create change_log triggers on specified tables."""
+    Deployment is incremental: each table's generated triggers are fingerprinted in
+    sync_trigger_state and only tables whose fingerprint changed (or whose triggers are
+    missing) are redeployed. Triggers of tables no longer captured are removed, found from
+    both sync_trigger_state and the trg_* trigger names (databases set up before the state
+    table existed have no state rows). Pass `force` to redeploy everything.
+    """
+    # Triggers are generated from the column list: never from metadata cached before a DDL change
+    invalidate_table_meta(conn, db_name)
     table_list = get_table_list(conn, db_name, tables)
+    wanted = {}  # table -> (create statements, description)
 
-    if not table_list:
+    if table_list:
+        print(f"    📋 Setting up triggers for {len(table_list)} tables...")
+    else:
         print(f"    ⚠️ No tables found to setup triggers for")
-        return
-
-    print(f"    📋 Setting up triggers for {len(table_list)} tables...")
 
-    for table in table_list:
+    for table in table_list or []:
         pk = get_primary_key_column(conn, db_name, table)
         if not pk:
             print(f"    ⚠️ Skipping table `{table}` (no primary key)")
@@ -109,49 +852,65 @@ def setup_triggers(conn: Connection, db_name: str, tables, node_id):
             print(f"    ⚠️ Skipping table `{table}` (no columns found)")
             continue
 
-        # Build JSON_OBJECT expressions for row data
-        new_row_pairs = []
-        old_row_pairs = []
+        table_capture = resolve_capture_options(capture, table)
+        if table_capture["row_encoding"] == "compact":
+            register_columns_version(conn, table, columns)
+        statements = [build_trigger_sql(table, op, pk, columns, node_id, table_capture) for op in TRIGGER_OPERATIONS]
+        noop_note = ", no-op updates skipped" if table_capture["skip_noop_updates"] else ""
+        wanted[table] = (statements, f"PK: {pk}, updates: {table_capture['update_capture']}{noop_note}")
 
-        for col in columns:
-            new_row_pairs.append(f"'{col}', NEW.`{col}`")
-            old_row_pairs.append(f"'{col}', OLD.`{col}`")
+    if table_list and not wanted:
+        print(f"    ⚠️ No tables with a primary key to capture")
 
-        new_row_expr = ", ".join(new_row_pairs)
-        old_row_expr = ", ".join(old_row_pairs)
+    fingerprints, existing = load_trigger_state(conn, db_name)
+    deployed = unchanged = 0
+
+    for table, (statements, description) in wanted.items():
+        fingerprint = trigger_fingerprint(statements)
+        trig_names = [f"trg_{table}_{op.lower()}" for op in TRIGGER_OPERATIONS]
+
+        if not force and fingerprints.get(table) == fingerprint and all(name in existing for name in trig_names):
+            unchanged += 1
+            continue
 
         # Create triggers for INSERT, UPDATE, DELETE
-        triggers = [
-            ("INSERT", f"NEW.`{pk}`", f"JSON_OBJECT({new_row_expr})"),
-            ("UPDATE", f"NEW.`{pk}`", f"JSON_OBJECT({new_row_expr})"),
-            ("DELETE", f"OLD.`{pk}`", f"JSON_OBJECT({old_row_expr})")
-        ]
+        with conn.cursor() as cur:
+            for trig_name, create_sql in zip(trig_names, statements):
+                cur.execute(f"DROP TRIGGER IF EXISTS `{trig_name}`")
+                cur.execute(create_sql)
 
-        for op, pk_expr, row_data_expr in triggers:
-            trig_name = f"trg_{table}_{op.lower()}"
+            cur.execute(f"""
+                        INSERT INTO `{TRIGGER_STATE_TABLE}` (table_name, fingerprint)
+                        VALUES (%s, %s)
+                        ON DUPLICATE KEY UPDATE fingerprint = VALUES(fingerprint)
+                        """, (table, fingerprint))
 
-            # Drop existing trigger
-            drop_sql = f"DROP TRIGGER IF EXISTS `{trig_name}`"
+        deployed += 1
+        print(f"    ✅ Triggers created for `{table}` ({description})")
 
-            # Create new trigger
-            create_sql = f"""
-            CREATE TRIGGER `{trig_name}` 
-            AFTER {op} ON `{table}`
-            FOR EACH ROW
-            INSERT INTO change_log (table_name, operation, row_pk, row_data, source_node)
-            VALUES (
-                '{table}',
-                '{op}',
-                {pk_expr},
-                {row_data_expr},
-                '{node_id}'
-            )
-            """
+    # Tables that were captured before but are no longer configured (or lost their PK)
+    captured = set(fingerprints)
+    for name in existing:
+        for op in TRIGGER_OPERATIONS:
+            suffix = f"_{op.lower()}"
+            if name.endswith(suffix):
+                captured.add(name[len("trg_"):-len(suffix)])
+    removed = sorted(table for table in captured if table not in wanted)
+    with conn.cursor() as cur:
+        for table in removed:
+            for op in TRIGGER_OPERATIONS:
+                cur.execute(f"DROP TRIGGER IF EXISTS `trg_{table}_{op.lower()}`")
+            cur.execute(f"DELETE FROM `{TRIGGER_STATE_TABLE}` WHERE table_name = %s", (table,))
+            print(f"    🗑️ Triggers removed from `{table}` (no longer captured)")
 
-            with conn.cursor() as cur:
-                cur.execute(drop_sql)
-                cur.execute(create_sql)
+    print(f"    🎯 Triggers up to date for {len(wanted)} tables "
+          f"({deployed} deployed, {unchanged} unchanged, {len(removed)} removed)")
 
-        print(f"    ✅ Triggers created for `{table}` (PK: {pk})")
 
-    print(f"    🎯 All triggers setup complete for {len(table_list)} tables")
\ No newline at end of file
+def setup_change_capture(conn: Connection, db_name: str, tables, node_id, capture=None):
+    """Set up change capture for a database using the pair's capture mode (triggers or binlog)."""
+    if (capture or {}).get("mode", DEFAULT_CAPTURE_OPTIONS["mode"]) == "binlog":
+        from core.binlog_capture import setup_binlog_capture
+        setup_binlog_capture(conn, db_name, tables, node_id)
+    else:
+        setup_triggers(conn, db_name, tables, node_id, capture)
@@ -1,8 +1,19 @@
 import json
+import queue
+import threading
+import time
 import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 
-from core.schema import get_primary_key_column, get_table_list
+from core.comparator import get_table_comparator
+from core.conflict_policy import compile_conflict_policy
+from core.schema import (COMPACT_ROW_FORMAT, CONFLICT_STATS_TABLE, ROW_VERSION_TABLE, SERVER_STARTED_SQL,
+                         SYNC_AGENT_SESSION_TABLE, SYNC_CLOCK_TABLE, SYNC_CURSOR_TABLE, SYNC_FAILED_CHANGE_TABLE, SYNC_ORIGIN_VARIABLE,
+                         ensure_conflict_log_table,
+                         get_primary_key_column, get_table_list, get_timestamp_column, get_versioned_columns,
+                         hour_bucket_sql, migrate_applied_nodes_to_cursors, parse_hlc)
 
 
 class DateTimeEncoder(json.JSONEncoder):
@@ -13,6 +24,101 @@ class DateTimeEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
+# Engine tuning knobs, overridable per sync pair through "sync_options" in config.json
+DEFAULT_SYNC_OPTIONS = {
+    "apply_mode": "row",  # 'row' (one statement per change) or 'batch' (multi-row upserts)
+    "batch_max_rows": 500,  # Max rows per multi-row upsert statement
+    "batch_max_bytes": 1024 * 1024,  # Approximate payload cap per statement, keep below max_allowed_packet
+    "conflict_chunk_size": 500,  # Keys per `pk IN (...)` probe when prefetching target rows
+    "coalesce": True,  # Collapse each (table, pk) in a batch to its net effect before applying
+    "ack_chunk_size": 500,  # Change ids per bulk acknowledgement statement
+    "change_tracking": "cursor",  # 'cursor' (sync_cursor watermark) or 'applied_nodes' (legacy JSON scan)
+    # Leave changes newer than this, or than the oldest open transaction, for the next run so
+    # late commits are not skipped (see settled_changes_filter)
+    "cursor_lag_seconds": 5,
+    "cursor_guard_max_seconds": 300,  # Longest an open transaction may hold the cursor back
+    "fetch_limit": 100,  # Changes fetched per batch
+    "max_run_seconds": 300,  # Time budget per direction per run; keep paging until drained or spent
+    "max_run_rows": 0,  # Change budget per direction per run (0 = unlimited)
+    "fetch_mode": "per_table",  # 'per_table' (one query per table) or 'stream' (one ordered query for all tables)
+    "transactional": False,  # One target transaction per batch with a savepoint per change
+    "pipeline": False,  # Fetch the next batch on a worker thread while the current one is applied
+    "pipeline_depth": 2,  # Max fetched-but-unapplied batches held in memory
+    "binlog_session_marker": False,  # Announce apply sessions in sync_agent_session (binlog capture)
+    # 'row' (compare target rows), 'hlc' (change_log versions), 'version' (row_version registry)
+    # or 'change_log' (only rows with unacknowledged local edits are compared)
+    "conflict_detection": "row",
+    # Runs a failing change is retried before it is dead-lettered in sync_failed_change and the
+    # cursor moves past it (0 = retry forever)
+    "max_change_attempts": 5,
+}
+
+
+def resolve_sync_options(options=None):
+    """Merge per-pair sync options over the engine defaults"""
+    resolved = dict(DEFAULT_SYNC_OPTIONS)
+    if options:
+        resolved.update(options)
+    return resolved
+
+
+class BatchAborted(Exception):
+    """The server rolled back the whole batch transaction (e.g. deadlock); nothing in it was applied."""
+
+
+def set_sync_origin(conn, origin_node_id, binlog_marker=False):
+    """
+    Mark (or with None, unmark) a connection's session as the sync agent applying changes
+    from `origin_node_id`. The generated triggers check this variable so the agent's own
+    writes are not captured again, or are tagged with the origin node (capture "echo" option).
+
+    Binlog capture cannot see session variables, so with `binlog_marker` the connection id
+    (and the server's start time, as ids restart with the server) is also recorded in
+    sync_agent_session, where the binlog reader picks it up. Unmarking deletes the row
+    again; the reader sees that delete in the binlog after this session's writes, so it
+    still recognises them however late it gets there.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"SET {SYNC_ORIGIN_VARIABLE} = %s", (origin_node_id,))
+        if binlog_marker and origin_node_id:
+            cur.execute(f"""
+                        INSERT INTO `{SYNC_AGENT_SESSION_TABLE}` (connection_id, origin_node, server_started)
+                        VALUES (CONNECTION_ID(), %s, {SERVER_STARTED_SQL})
+                        ON DUPLICATE KEY UPDATE origin_node = VALUES(origin_node),
+                                                server_started = VALUES(server_started),
+                                                updated_at = CURRENT_TIMESTAMP
+                        """, (origin_node_id,))
+        elif binlog_marker:
+            cur.execute(f"DELETE FROM `{SYNC_AGENT_SESSION_TABLE}` WHERE connection_id = CONNECTION_ID()")
+
+
+@contextmanager
+def change_savepoint(conn, enabled=True):
+    """
+    Run one change under a savepoint so a failure rolls back only that change.
+
+    Re-using one savepoint name lets MySQL replace the previous savepoint, so no RELEASE
+    round trip is needed. If the savepoint is gone because the server already rolled back
+    the whole transaction, BatchAborted is raised instead of the original error.
+    """
+    if not enabled:
+        yield
+        return
+
+    with conn.cursor() as cur:
+        cur.execute("SAVEPOINT sync_change")
+
+    try:
+        yield
+    except Exception as e:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("ROLLBACK TO SAVEPOINT sync_change")
+        except Exception:
+            raise BatchAborted(str(e)) from e
+        raise
+
+
 def generate_database_node_id(sync_pair_name, db_type):
     """Generate a unique node ID for each database in the sync pair"""
     base_string = f"{sync_pair_name}_{db_type}"
@@ -21,22 +127,11 @@ def generate_database_node_id(sync_pair_name, db_type):
 
 def get_record_last_modified(conn, table_name, pk_col, pk_value):
     """Get the last modified timestamp for a record if it has updated_at column"""
-    with conn.cursor() as cur:
-        # Check if the table has an updated_at or modified_at column
-        cur.execute("""
-                    SELECT COLUMN_NAME
-                    FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE TABLE_SCHEMA = DATABASE()
-                      AND TABLE_NAME = %s
-                      AND COLUMN_NAME IN ('updated_at', 'modified_at', 'last_modified') LIMIT 1
-                    """, (table_name,))
-
-        timestamp_col = cur.fetchone()
-        if not timestamp_col:
-            return None
-
-        timestamp_col_name = timestamp_col['COLUMN_NAME']
+    timestamp_col_name = get_timestamp_column(conn, conn.db.decode(), table_name)
+    if not timestamp_col_name:
+        return None
 
+    with conn.cursor() as cur:
         # Get the record's timestamp
         cur.execute(f"""
             SELECT `{timestamp_col_name}` 
@@ -48,32 +143,33 @@ def get_record_last_modified(conn, table_name, pk_col, pk_value):
         return result[timestamp_col_name] if result else None
 
 
-def detect_conflict(source_change, target_conn, table_name, pk_col, pk_value):
-    """Detect if applying a change would cause a conflict"""
-    with target_conn.cursor() as cur:
-        # Check if record exists in target
-        cur.execute(f"SELECT * FROM `{table_name}` WHERE `{pk_col}` = %s", (pk_value,))
-        target_record = cur.fetchone()
+def compare_with_target(source_change, target_record, target_timestamp, comparator=None):
+    """Decide whether a source change conflicts with the current target record (no I/O)
 
-        if not target_record:
-            return False, None  # No conflict if record doesn't exist
+    With a `comparator` (see core.comparator) fields are compared as typed values;
+    without one, by their str() forms.
+    """
+    if not target_record:
+        return False, None  # No conflict if record doesn't exist
 
-        # Check if target record was modified after the source change
-        target_timestamp = get_record_last_modified(target_conn, table_name, pk_col, pk_value)
-        source_timestamp = source_change.get('created_at')
+    # Check if target record was modified after the source change
+    source_timestamp = source_change.get('created_at')
 
-        if target_timestamp and source_timestamp:
-            if target_timestamp > source_timestamp:
-                return True, {
-                    'type': 'timestamp_conflict',
-                    'source_time': source_timestamp,
-                    'target_time': target_timestamp,
-                    'target_record': target_record
-                }
+    if target_timestamp and source_timestamp:
+        if target_timestamp > source_timestamp:
+            return True, {
+                'type': 'timestamp_conflict',
+                'source_time': source_timestamp,
+                'target_time': target_timestamp,
+                'target_record': target_record
+            }
 
-        # Check for field-level conflicts by comparing data
-        source_data = json.loads(source_change.get('row_data', '{}'))
+    # Check for field-level conflicts by comparing data
+    source_data = json.loads(source_change.get('row_data') or '{}')
 
+    if comparator:
+        conflicts = comparator.diff(source_data, target_record)
+    else:
         conflicts = []
         for field, source_value in source_data.items():
             if field in target_record:
@@ -85,177 +181,447 @@ def detect_conflict(source_change, target_conn, table_name, pk_col, pk_value):
                         'target_value': target_value
                     })
 
-        if conflicts:
-            return True, {
-                'type': 'field_conflict',
-                'conflicts': conflicts,
-                'target_record': target_record
-            }
+    if conflicts:
+        return True, {
+            'type': 'field_conflict',
+            'conflicts': conflicts,
+            'target_record': target_record
+        }
 
+    return False, None
+
+
+def detect_conflict(source_change, target_conn, table_name, pk_col, pk_value):
+    """Detect if applying a change would cause a conflict"""
+    with target_conn.cursor() as cur:
+        # Check if record exists in target
+        cur.execute(f"SELECT * FROM `{table_name}` WHERE `{pk_col}` = %s", (pk_value,))
+        target_record = cur.fetchone()
+
+    if not target_record:
         return False, None
 
+    # The row is already in hand, so read its timestamp column instead of querying again
+    target_db = target_conn.db.decode()
+    timestamp_col = get_timestamp_column(target_conn, target_db, table_name)
+    target_timestamp = target_record.get(timestamp_col) if timestamp_col else None
+    comparator = get_table_comparator(target_conn, target_db, table_name)
+    return compare_with_target(source_change, target_record, target_timestamp, comparator)
 
-def log_conflict(conn, source_change, conflict_info, resolution):
-    """Log a conflict to the conflict_log table"""
+
+def compare_versions(source_change, target_version):
+    """
+    Version-based conflict check (no I/O): the change conflicts when the target row was
+    edited locally at a later hybrid logical clock version than the change itself.
+    """
+    source_version = source_change.get('hlc')
+    if not target_version or target_version <= source_version:
+        return False, None
+
+    return True, {
+        'type': 'version_conflict',
+        'source_time': source_version,
+        'target_time': target_version,
+        'target_record': None
+    }
+
+
+def fetch_row_versions(conn, node_id, changes, chunk_size=500):
+    """
+    Newest version of each INSERT/UPDATE row of a batch as written locally on `conn`
+    (its own change_log, rows captured for `node_id`), keyed by (table_name, str(pk)).
+
+    One `row_pk IN (...)` query per table and chunk, answered from idx_row_hlc.
+    """
+    keys_by_table = {}
+    for change in changes:
+        if change["operation"] in ("INSERT", "UPDATE"):
+            keys_by_table.setdefault(change["table_name"], set()).add(str(change["row_pk"]))
+
+    versions = {}
     with conn.cursor() as cur:
-        # Create conflict_log table if it doesn't exist
-        cur.execute("""
-                    CREATE TABLE IF NOT EXISTS conflict_log
-                    (
-                        id
-                        BIGINT
-                        AUTO_INCREMENT
-                        PRIMARY
-                        KEY,
-                        change_id
-                        BIGINT
-                        NOT
-                        NULL,
-                        table_name
-                        VARCHAR
-                    (
-                        255
-                    ) NOT NULL,
-                        record_pk VARCHAR
-                    (
-                        255
-                    ) NOT NULL,
-                        conflict_type VARCHAR
-                    (
-                        50
-                    ) NOT NULL,
-                        source_data JSON,
-                        target_data JSON,
-                        conflict_details JSON,
-                        resolution VARCHAR
-                    (
-                        50
-                    ) NOT NULL,
-                        resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        INDEX idx_table_pk
-                    (
-                        table_name,
-                        record_pk
-                    ),
-                        INDEX idx_resolved_at
-                    (
-                        resolved_at
-                    )
-                        )
-                    """)
+        for table, pks in keys_by_table.items():
+            pks = list(pks)
+            for start in range(0, len(pks), chunk_size):
+                chunk = pks[start:start + chunk_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cur.execute(f"""
+                            SELECT row_pk, MAX(hlc) AS hlc
+                            FROM change_log
+                            WHERE table_name = %s
+                              AND row_pk IN ({placeholders})
+                              AND source_node = %s
+                            GROUP BY row_pk
+                            """, [table, *chunk, node_id])
+                for row in cur.fetchall():
+                    if row["hlc"]:
+                        versions[(table, row["row_pk"])] = row["hlc"]
+
+    return versions
+
+
+def fetch_registered_versions(conn, changes, chunk_size=500):
+    """
+    Current version of each INSERT/UPDATE row of a batch from the row_version registry on
+    `conn`, keyed by (table_name, str(pk)). One primary key `IN (...)` lookup per table and chunk.
+    """
+    keys_by_table = {}
+    for change in changes:
+        if change["operation"] in ("INSERT", "UPDATE"):
+            keys_by_table.setdefault(change["table_name"], set()).add(str(change["row_pk"]))
 
-        # Insert conflict log
-        cur.execute("""
-                    INSERT INTO conflict_log
-                    (change_id, table_name, record_pk, conflict_type, source_data, target_data, conflict_details,
-                     resolution)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        source_change['id'],
-                        source_change['table_name'],
-                        source_change['row_pk'],
-                        conflict_info['type'],
-                        source_change.get('row_data'),
-                        json.dumps(conflict_info.get('target_record', {}), cls=DateTimeEncoder),
-                        json.dumps(conflict_info, cls=DateTimeEncoder),
-                        resolution
-                    ))
-
-
-def resolve_conflict(source_change, target_conn, conflict_info, resolution_strategy='timestamp_wins'):
-    """
-    Resolve a conflict based on the specified strategy
-
-    Strategies:
-    - 'timestamp_wins': Most recent change wins (default)
-    - 'source_wins': Source always wins
-    - 'target_wins': Target always wins
-    - 'merge_fields': Attempt to merge non-conflicting fields
-    - 'manual': Log for manual resolution (don't apply)
-    """
-
-    if resolution_strategy == 'manual':
-        print(f"    📝 Conflict logged for manual resolution")
-        log_conflict(target_conn, source_change, conflict_info, 'manual')
-        return False
+    versions = {}
+    with conn.cursor() as cur:
+        for table, pks in keys_by_table.items():
+            pks = list(pks)
+            for start in range(0, len(pks), chunk_size):
+                chunk = pks[start:start + chunk_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cur.execute(f"SELECT row_pk, version FROM `{ROW_VERSION_TABLE}` "
+                            f"WHERE table_name = %s AND row_pk IN ({placeholders})", [table, *chunk])
+                for row in cur.fetchall():
+                    versions[(table, row["row_pk"])] = row["version"]
 
-    elif resolution_strategy == 'target_wins':
-        print(f"    🎯 Target wins - skipping source change")
-        log_conflict(target_conn, source_change, conflict_info, 'target_wins')
-        return False
+    return versions
 
-    elif resolution_strategy == 'source_wins':
-        print(f"    📤 Source wins - applying source change")
-        log_conflict(target_conn, source_change, conflict_info, 'source_wins')
-        return True
 
-    elif resolution_strategy == 'timestamp_wins':
-        if conflict_info['type'] == 'timestamp_conflict':
-            if conflict_info['source_time'] > conflict_info['target_time']:
-                print(f"    ⏰ Source is newer - applying change")
-                log_conflict(target_conn, source_change, conflict_info, 'timestamp_wins_source')
-                return True
+def fetch_locally_modified_keys(conn, local_node_id, peer_node_id, changes, chunk_size=500, use_cursor=True):
+    """
+    Keys (table_name, str(pk)) of a batch's INSERT/UPDATE rows that have local edits on
+    `conn` not yet acknowledged by `peer_node_id`: change_log rows written there by
+    `local_node_id` past the peer's sync_cursor (or, with `use_cursor=False`, missing the
+    peer in applied_nodes). Rows that are not returned cannot conflict.
+
+    One `(table_name, row_pk) IN (...)` query per chunk, answered from idx_row_source_id.
+    """
+    keys = list(dict.fromkeys((change["table_name"], str(change["row_pk"])) for change in changes
+                              if change["operation"] in ("INSERT", "UPDATE")))
+
+    if use_cursor:
+        pending_sql = f"""
+            SELECT DISTINCT c.table_name, c.row_pk
+            FROM change_log c
+            LEFT JOIN `{SYNC_CURSOR_TABLE}` s
+                ON s.source_node = c.source_node AND s.target_node = %s AND s.table_name = c.table_name
+            WHERE (c.table_name, c.row_pk) IN ({{keys}})
+              AND c.source_node = %s
+              AND c.id > COALESCE(s.last_change_id, 0)
+            """
+    else:
+        pending_sql = """
+            SELECT DISTINCT c.table_name, c.row_pk
+            FROM change_log c
+            WHERE (c.table_name, c.row_pk) IN ({keys})
+              AND c.source_node = %s
+              AND (c.applied_nodes IS NULL OR JSON_SEARCH(c.applied_nodes, 'one', %s) IS NULL)
+            """
+
+    modified = set()
+    with conn.cursor() as cur:
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            key_args = [value for key in chunk for value in key]
+            sql = pending_sql.format(keys=", ".join(["(%s, %s)"] * len(chunk)))
+            if use_cursor:
+                cur.execute(sql, [peer_node_id, *key_args, local_node_id])
             else:
-                print(f"    ⏰ Target is newer - skipping change")
-                log_conflict(target_conn, source_change, conflict_info, 'timestamp_wins_target')
-                return False
-        else:
-            # Fall back to source wins for non-timestamp conflicts
-            print(f"    📤 No timestamp info - source wins")
-            log_conflict(target_conn, source_change, conflict_info, 'timestamp_wins_source')
-            return True
+                cur.execute(sql, [*key_args, local_node_id, peer_node_id])
+            modified.update((row["table_name"], row["row_pk"]) for row in cur.fetchall())
+
+    return modified
+
+
+def record_row_versions(conn, changes):
+    """Store the versions of changes just applied on `conn` in its row_version registry."""
+    rows = [(change["table_name"], str(change["row_pk"]), change["hlc"], change["source_node"])
+            for change in changes if change.get("hlc")]
+    if not rows:
+        return
+
+    with conn.cursor() as cur:
+        cur.executemany(f"""
+                        INSERT INTO `{ROW_VERSION_TABLE}` (table_name, row_pk, version, node)
+                        VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE version = VALUES(version), node = VALUES(node)
+                        """, rows)
+
+
+def advance_sync_clock(conn, node_id, changes):
+    """
+    Raise the floor of `node_id`'s trigger clocks to the newest version among `changes`,
+    so local edits made after this sync get later versions than the changes they overwrite.
+    """
+    versions = [change["hlc"] for change in changes if change.get("hlc")]
+    physical = max(parse_hlc(version)[0] for version in versions)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+                    INSERT INTO `{SYNC_CLOCK_TABLE}` (node_id, physical)
+                    VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE physical = GREATEST(physical, VALUES(physical))
+                    """, (node_id, physical))
 
-    elif resolution_strategy == 'merge_fields':
-        return resolve_merge_fields(source_change, target_conn, conflict_info)
 
-    # Default: source wins
-    log_conflict(target_conn, source_change, conflict_info, 'source_wins')
+def fetch_rows_by_pk(conn, table_name, pk_col, pk_values, chunk_size=500):
+    """Fetch rows keyed by str(pk) with one `WHERE pk IN (...)` query per chunk"""
+    rows = {}
+    unique_pks = list(dict.fromkeys(str(pk) for pk in pk_values))
+
+    with conn.cursor() as cur:
+        for start in range(0, len(unique_pks), chunk_size):
+            chunk = unique_pks[start:start + chunk_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cur.execute(f"SELECT * FROM `{table_name}` WHERE `{pk_col}` IN ({placeholders})", chunk)
+            for row in cur.fetchall():
+                rows[str(row[pk_col])] = row
+
+    return rows
+
+
+def needs_target_row(change, versions=None, local_edits=None):
+    """True if the conflict check for a change has to read the target row"""
+    if versions is not None and change.get("hlc"):
+        return False
+    if local_edits is not None and (change["table_name"], str(change["row_pk"])) not in local_edits:
+        return False
     return True
 
 
-def resolve_merge_fields(source_change, target_conn, conflict_info):
-    """Attempt to merge fields, only updating non-conflicting ones"""
-    source_data = json.loads(source_change.get('row_data', '{}'))
-    target_record = conflict_info['target_record']
-    table_name = source_change['table_name']
-    pk_col = None
+def flag_target_edit(conflict_info, change, target_edits):
+    """
+    Record on a conflict whether the target row has an unsynced edit of its own (see
+    fetch_locally_modified_keys); merge_fields only protects target fields in that case.
+    """
+    if target_edits is not None:
+        conflict_info['target_edited'] = (change["table_name"], str(change["row_pk"])) in target_edits
 
-    # Get primary key column
-    with target_conn.cursor() as cur:
-        pk_col = get_primary_key_column(target_conn, target_conn.db.decode(), table_name)
+
+def prefetch_target_snapshot(target_conn, changes, chunk_size=500, versions=None, local_edits=None):
+    """
+    Load the current target rows for every INSERT/UPDATE key in a batch.
+
+    Returns {table: {"pk_col", "timestamp_col", "comparator", "rows": {str(pk): row}}}; tables without
+    a primary key are left out. With `versions` or `local_edits` rows are only read for
+    changes whose conflict check needs them (see needs_target_row).
+    """
+    keys_by_table = {}
+    for change in changes:
+        if change["operation"] in ("INSERT", "UPDATE"):
+            pk_values = keys_by_table.setdefault(change["table_name"], [])
+            if needs_target_row(change, versions, local_edits):
+                pk_values.append(change["row_pk"])
+
+    target_db = target_conn.db.decode()
+    snapshot = {}
+    for table, pk_values in keys_by_table.items():
+        pk_col = get_primary_key_column(target_conn, target_db, table)
         if not pk_col:
-            print(f"    ❌ No primary key found for merge")
-            return False
+            continue
 
-    # Identify non-conflicting fields
-    conflicting_fields = {c['field'] for c in conflict_info.get('conflicts', [])}
-    safe_fields = {k: v for k, v in source_data.items()
-                   if k not in conflicting_fields and k != pk_col}
+        snapshot[table] = {
+            "pk_col": pk_col,
+            "timestamp_col": get_timestamp_column(target_conn, target_db, table),
+            "comparator": get_table_comparator(target_conn, target_db, table),
+            "rows": fetch_rows_by_pk(target_conn, table, pk_col, pk_values, chunk_size),
+        }
 
-    if not safe_fields:
-        print(f"    ⚠️ No safe fields to merge - skipping")
-        log_conflict(target_conn, source_change, conflict_info, 'merge_no_safe_fields')
-        return False
+    return snapshot
 
-    # Update only safe fields
-    with target_conn.cursor() as cur:
-        set_clause = ", ".join(f"`{k}` = %s" for k in safe_fields.keys())
-        sql = f"UPDATE `{table_name}` SET {set_clause} WHERE `{pk_col}` = %s"
-        values = list(safe_fields.values()) + [source_change['row_pk']]
 
-        cur.execute(sql, values)
-        print(f"    🔀 Merged {len(safe_fields)} non-conflicting fields")
+def detect_conflict_in_snapshot(source_change, table_snapshot):
+    """Snapshot-backed equivalent of detect_conflict, returning the same conflict_info"""
+    target_record = table_snapshot["rows"].get(str(source_change["row_pk"]))
+    if not target_record:
+        return False, None
 
-    log_conflict(target_conn, source_change, conflict_info, 'merge_fields')
-    return True
+    timestamp_col = table_snapshot["timestamp_col"]
+    target_timestamp = target_record.get(timestamp_col) if timestamp_col else None
+    return compare_with_target(source_change, target_record, target_timestamp, table_snapshot.get("comparator"))
+
+
+# Conflict records buffered per target connection while a batch is applied (see buffer_conflict_log)
+_conflict_buffers = {}
+
+# Rows per multi-row conflict_log INSERT
+CONFLICT_LOG_INSERT_ROWS = 500
+
+
+def build_conflict_record(source_change, conflict_info, resolution):
+    """Values of one conflict_log row"""
+    return (
+        source_change['id'],
+        source_change['table_name'],
+        source_change['row_pk'],
+        conflict_info['type'],
+        source_change.get('row_data'),
+        json.dumps(conflict_info.get('target_record', {}), cls=DateTimeEncoder),
+        json.dumps(conflict_info, cls=DateTimeEncoder),
+        resolution
+    )
+
+
+def write_conflict_records(conn, records):
+    """Insert conflict_log rows with one multi-row INSERT per chunk"""
+    if not records:
+        return
+
+    ensure_conflict_log_table(conn)
+    with conn.cursor() as cur:
+        for start in range(0, len(records), CONFLICT_LOG_INSERT_ROWS):
+            chunk = records[start:start + CONFLICT_LOG_INSERT_ROWS]
+            placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(chunk))
+            cur.execute(f"""
+                        INSERT INTO conflict_log
+                        (change_id, table_name, record_pk, conflict_type, source_data, target_data, conflict_details,
+                         resolution)
+                        VALUES {placeholders}
+                        """, [value for record in chunk for value in record])
+
+        update_conflict_stats(cur, records)
+
+
+def update_conflict_stats(cur, records):
+    """Add conflict_log records to the hourly conflict_stats rollup, one upsert per call"""
+    counts = Counter((record[1], record[3], record[7]) for record in records)
+    hour = hour_bucket_sql("NOW()")
+    placeholders = ", ".join([f"(%s, %s, %s, {hour}, %s, NOW())"] * len(counts))
+    cur.execute(f"""
+                INSERT INTO `{CONFLICT_STATS_TABLE}`
+                (table_name, conflict_type, resolution, hour_start, conflict_count, last_conflict_at)
+                VALUES {placeholders}
+                ON DUPLICATE KEY UPDATE conflict_count = conflict_count + VALUES(conflict_count),
+                                        last_conflict_at = VALUES(last_conflict_at)
+                """, [value for key, count in counts.items() for value in (*key, count)])
+
+
+@contextmanager
+def buffer_conflict_log(conn):
+    """
+    Collect the conflicts logged on `conn` inside the block and write them in one go when
+    it completes. If the block raises, the buffered records are discarded with it.
+    """
+    records = _conflict_buffers[id(conn)] = []
+    try:
+        yield records
+    finally:
+        _conflict_buffers.pop(id(conn), None)
+
+    try:
+        write_conflict_records(conn, records)
+    except Exception as e:
+        print(f"    ⚠️ Failed to write {len(records)} conflict_log rows: {e}")
+
+
+def log_conflict(conn, source_change, conflict_info, resolution):
+    """Log a conflict to the conflict_log table (buffered while a batch is being applied)"""
+    record = build_conflict_record(source_change, conflict_info, resolution)
+    buffered = _conflict_buffers.get(id(conn))
+    if buffered is not None:
+        buffered.append(record)
+    else:
+        write_conflict_records(conn, [record])
+
+
+def report_conflict(target_conn, change, conflict_info, decision):
+    """Print a resolved conflict and log it to conflict_log"""
+    if decision.resolution == 'manual':
+        print(f"    📝 Conflict logged for manual resolution")
+    elif not decision.apply:
+        print(f"    🎯 {decision.resolution}: target keeps its values, skipping source change")
+    elif decision.kept_target:
+        print(f"    🔀 {decision.resolution}: applying source values, keeping target "
+              f"{', '.join(decision.kept_target)}")
+    else:
+        print(f"    📤 {decision.resolution}: applying source change")
+    log_conflict(target_conn, change, conflict_info, decision.resolution)
+
+
+def serialize_row_value(value):
+    """Serialize nested dictionaries, lists and datetimes so pymysql can bind them"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DateTimeEncoder)
+    elif isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def build_upsert_sql(table, columns, row_count=1):
+    """Build an INSERT ... ON DUPLICATE KEY UPDATE statement for one or more rows"""
+    cols = ", ".join(f"`{c}`" for c in columns)
+    row_placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    values = ", ".join([row_placeholders] * row_count)
+    updates = ", ".join(f"`{c}`=VALUES(`{c}`)" for c in columns)
+
+    return f"""
+            INSERT INTO `{table}` ({cols}) VALUES {values}
+            ON DUPLICATE KEY UPDATE {updates}
+            """
+
+
+def build_partial_update_sql(table, columns, pk_col):
+    """Build an UPDATE touching only `columns` of the row identified by `pk_col`"""
+    assignments = ", ".join(f"`{c}`=%s" for c in columns)
+    return f"UPDATE `{table}` SET {assignments} WHERE `{pk_col}` = %s"
 
 
-def apply_change_with_conflict_detection(target_conn, change, resolution_strategy='timestamp_wins'):
-    """Apply a single change to the target database with conflict detection."""
+def apply_partial_update(conn, cur, change, table, columns, pk_col, values):
+    """
+    Run a partial UPDATE (`values` ends with the primary key) on `cur`, a cursor of `conn`.
+
+    If it matches no target row (deleted there, or never synced), a change that captured
+    the full row is upserted with all of it. A delta change only carries the changed
+    columns, and inserting those would leave a skeleton row (or fail on NOT NULL columns),
+    so it is skipped and logged to conflict_log as 'missing_row'. Returns the number of
+    statements executed.
+    """
+    cur.execute(build_partial_update_sql(table, list(columns), pk_col), values)
+    if cur.rowcount:
+        return 1
+
+    # 0 affected rows: either the row is missing or it already holds these values
+    cur.execute(f"SELECT 1 FROM `{table}` WHERE `{pk_col}` = %s", (values[-1],))
+    if cur.fetchone():
+        return 2
+
+    if is_delta_change(change):
+        print(f"    ⚠️ {table} [pk={values[-1]}] is missing on the target and the change only carries "
+              f"the changed columns, skipping it")
+        log_conflict(conn, change, {'type': 'missing_row', 'target_record': None}, 'skipped_missing_row')
+        return 2
+
+    row_data = json.loads(change["row_data"] or "{}")
+    print(f"    ⚠️ {table} [pk={values[-1]}] is missing on the target, inserting the full captured row")
+    cur.execute(build_upsert_sql(table, list(row_data.keys())),
+                [serialize_row_value(value) for value in row_data.values()])
+    return 3
+
+
+def is_delta_change(change):
+    """True if the change carries only the changed columns (delta UPDATE capture)"""
+    return change.get("row_format") == "delta"
+
+
+def apply_change_with_conflict_detection(target_conn, change, resolution_strategy='timestamp_wins', versions=None,
+                                         local_edits=None, target_edits=None, snapshot=None):
+    """Apply a single change to the target database with conflict detection.
+
+    `resolution_strategy` is a strategy name, a per-table/column policy or a compiled
+    ConflictPolicy (see core.conflict_policy).
+
+    With `versions` (see fetch_row_versions) a change carrying an HLC version is checked
+    by comparing versions instead of reading the target row. With `local_edits` (see
+    fetch_locally_modified_keys) rows without pending target edits are not checked at all.
+    `target_edits` (the same kind of key set) tells merge_fields which conflicting rows
+    were also edited on the target.
+
+    With `snapshot` (see prefetch_target_snapshot) the target row is looked up there
+    instead of with its own SELECT, and the snapshot is kept up to date with what was
+    written, so a later change to the same row compares against this one.
+    """
     op = change["operation"]
     table = change["table_name"]
     pk_value = change["row_pk"]
     row_data = json.loads(change["row_data"] or "{}")
+    table_snapshot = snapshot.get(table) if snapshot is not None else None
 
     print(f"    🔧 Applying {op} to {table} [pk={pk_value}]")
 
@@ -270,6 +636,8 @@ def apply_change_with_conflict_detection(target_conn, change, resolution_strateg
             sql = f"DELETE FROM `{table}` WHERE `{pk_col}` = %s"
             cur.execute(sql, (pk_value,))
             print(f"    ✅ DELETE applied successfully")
+        if table_snapshot:
+            table_snapshot["rows"].pop(str(pk_value), None)
         return True
 
     elif op in ["INSERT", "UPDATE"]:
@@ -284,9 +652,18 @@ def apply_change_with_conflict_detection(target_conn, change, resolution_strateg
             return False
 
         # Detect conflicts
-        has_conflict, conflict_info = detect_conflict(change, target_conn, table, pk_col, pk_value)
+        versioned = versions is not None and change.get("hlc")
+        if versioned:
+            has_conflict, conflict_info = compare_versions(change, versions.get((table, str(pk_value))))
+        elif not needs_target_row(change, local_edits=local_edits):
+            has_conflict, conflict_info = False, None
+        elif table_snapshot:
+            has_conflict, conflict_info = detect_conflict_in_snapshot(change, table_snapshot)
+        else:
+            has_conflict, conflict_info = detect_conflict(change, target_conn, table, pk_col, pk_value)
 
         if has_conflict:
+            flag_target_edit(conflict_info, change, target_edits)
             print(f"    ⚠️ CONFLICT DETECTED: {conflict_info['type']}")
 
             # Show conflict details
@@ -294,47 +671,349 @@ def apply_change_with_conflict_detection(target_conn, change, resolution_strateg
                 for conflict in conflict_info.get('conflicts', []):
                     print(
                         f"      🔥 {conflict['field']}: source={conflict['source_value']}, target={conflict['target_value']}")
-            elif conflict_info['type'] == 'timestamp_conflict':
+            elif conflict_info['type'] in ('timestamp_conflict', 'version_conflict'):
                 print(f"      ⏰ Source: {conflict_info['source_time']}, Target: {conflict_info['target_time']}")
 
             # Resolve the conflict
-            should_apply = resolve_conflict(change, target_conn, conflict_info, resolution_strategy)
+            decision = compile_conflict_policy(resolution_strategy).resolve(change, conflict_info, pk_col)
+            report_conflict(target_conn, change, conflict_info, decision)
 
-            if not should_apply:
+            if not decision.apply:
                 return False
+            row_data = decision.row
+            partial = decision.partial
+        else:
+            partial = False
 
         # Apply the change
         with target_conn.cursor() as cur:
-            cols = ", ".join(f"`{k}`" for k in row_data.keys())
-            placeholders = ", ".join(["%s"] * len(row_data))
-            updates = ", ".join(f"`{k}`=VALUES(`{k}`)" for k in row_data.keys())
-
-            sql = f"""
-            INSERT INTO `{table}` ({cols}) VALUES ({placeholders})
-            ON DUPLICATE KEY UPDATE {updates}
-            """
-
-            # Serialize any nested dictionaries or complex objects to JSON
-            values = []
-            for value in row_data.values():
-                if isinstance(value, (dict, list)):
-                    values.append(json.dumps(value, cls=DateTimeEncoder))
-                elif isinstance(value, datetime):
-                    values.append(value.isoformat())
-                else:
-                    values.append(value)
-
-            cur.execute(sql, values)
+            if is_delta_change(change) or partial:
+                # Only the changed columns were captured: update them in place
+                columns = [col for col in row_data if col != pk_col]
+                if not columns:
+                    print(f"    ⏭️ Delta UPDATE on {table} has no changed columns, nothing to apply")
+                    return True
+                values = [serialize_row_value(row_data[col]) for col in columns] + [pk_value]
+                apply_partial_update(target_conn, cur, change, table, columns, pk_col, values)
+            else:
+                sql = build_upsert_sql(table, list(row_data.keys()))
+                values = [serialize_row_value(value) for value in row_data.values()]
+                cur.execute(sql, values)
             action = "CONFLICT RESOLVED + APPLIED" if has_conflict else "APPLIED"
             print(f"    ✅ {op} {action} successfully")
 
+        if versioned:
+            versions[(table, str(pk_value))] = change["hlc"]
+        elif table_snapshot:
+            current = table_snapshot["rows"].get(str(pk_value)) or {}
+            table_snapshot["rows"][str(pk_value)] = {**current, **row_data}
+
         return True
 
     return False
 
 
-def fetch_unapplied_changes(conn, target_node_id, table_name=None, limit=100):
-    """Fetch changes that haven't been applied to the target node yet."""
+def estimate_row_bytes(values):
+    """Rough wire size of a row of bound values, used to keep statements under the packet cap"""
+    return sum(len(str(v)) + 4 for v in values) + 4
+
+
+def apply_changes_batched(target_conn, changes, resolution_strategy='timestamp_wins',
+                          max_rows=500, max_bytes=1024 * 1024, conflict_chunk_size=500, savepoints=False,
+                          versions=None, local_edits=None, target_edits=None):
+    """
+    Apply a batch of changes, grouping consecutive INSERT/UPDATE changes for the same
+    table and column set into multi-row upserts.
+
+    Target rows for the whole batch are prefetched once (see prefetch_target_snapshot) and
+    conflicts are detected in memory for the whole batch first; the snapshot is updated as
+    changes go by so a later change to the same row sees the earlier one. The detected
+    conflicts are then settled together by the conflict policy (see core.conflict_policy),
+    and merged rows are written along with everything else. Delta UPDATEs (only the changed
+    columns captured) and merged rows that keep some target columns are grouped the same
+    way but written as partial UPDATEs. DELETEs
+    flush the pending group and are applied in order. If a multi-row statement fails, its rows are retried one by one
+    so a single bad row does not take the rest of the group down with it.
+
+    With `savepoints` (inside a batch transaction) every statement runs under a savepoint,
+    so a failed statement or row is rolled back on its own.
+
+    With `versions` (see fetch_row_versions) changes carrying an HLC version are checked
+    by comparing versions and their target rows are not prefetched. With `local_edits`
+    (see fetch_locally_modified_keys) only rows with pending target edits are checked.
+    `target_edits` marks the conflicting rows also edited on the target, for merge_fields.
+
+    Returns (applied_change_ids, stats).
+    """
+    applied_ids = []
+    stats = {"rows": 0, "statements": 0, "conflicts": 0, "fallbacks": 0, "failed_ids": [], "errors": {}}
+
+    pending = []  # (change, values) for the current group
+    pending_key = None
+    pending_bytes = 0
+
+    snapshot = prefetch_target_snapshot(target_conn, changes, conflict_chunk_size, versions, local_edits)
+
+    def flush():
+        nonlocal pending_key, pending_bytes
+        if not pending:
+            return
+
+        table, columns, delta_pk_col = pending_key
+
+        try:
+            with change_savepoint(target_conn, savepoints), target_conn.cursor() as cur:
+                if delta_pk_col:
+                    # Partial UPDATEs cannot share a statement; each row's match is checked
+                    statements = sum(apply_partial_update(target_conn, cur, change, table, columns, delta_pk_col,
+                                                          values)
+                                     for change, values in pending)
+                else:
+                    cur.execute(build_upsert_sql(table, list(columns), len(pending)),
+                                [value for _, values in pending for value in values])
+                    statements = 1
+            stats["statements"] += statements
+            stats["rows"] += len(pending)
+            applied_ids.extend(change["id"] for change, _ in pending)
+            if delta_pk_col:
+                print(f"    ✅ Updated {len(pending)} rows in {table} ({statements} statements)")
+            else:
+                print(f"    ✅ Upserted {len(pending)} rows in {table} in one statement")
+        except BatchAborted:
+            raise
+        except Exception as e:
+            print(f"    ⚠️ Multi-row write to {table} failed ({e}), retrying row by row")
+            stats["fallbacks"] += 1
+            single_sql = None if delta_pk_col else build_upsert_sql(table, list(columns))
+            for change, values in pending:
+                try:
+                    with change_savepoint(target_conn, savepoints), target_conn.cursor() as cur:
+                        if delta_pk_col:
+                            stats["statements"] += apply_partial_update(target_conn, cur, change, table, columns,
+                                                                        delta_pk_col, values)
+                        else:
+                            cur.execute(single_sql, values)
+                            stats["statements"] += 1
+                    stats["rows"] += 1
+                    applied_ids.append(change["id"])
+                except BatchAborted:
+                    raise
+                except Exception as row_error:
+                    print(f"    ❌ Error applying change {change['id']}: {row_error}")
+                    stats["failed_ids"].append(change["id"])
+                    stats["errors"][change["id"]] = str(row_error)
+
+        pending.clear()
+        pending_key = None
+        pending_bytes = 0
+
+    # Pass 1: detect conflicts for the whole batch. Each change is assumed to be applied,
+    # so a later change to the same row compares against it
+    rows = {}  # change id -> row_data of INSERT/UPDATE changes that can be applied
+    conflicts = []
+    for change in changes:
+        try:
+            op = change["operation"]
+            table = change["table_name"]
+            pk_value = change["row_pk"]
+            table_snapshot = snapshot.get(table)
+
+            if op == "DELETE":
+                if table_snapshot:
+                    table_snapshot["rows"].pop(str(pk_value), None)
+                continue
+
+            if op not in ("INSERT", "UPDATE"):
+                continue
+
+            row_data = json.loads(change["row_data"] or "{}")
+            if not row_data:
+                print(f"    ⚠️ No row data for {op} on {table}, skipping")
+                continue
+
+            if not table_snapshot:
+                print(f"    ⚠️ No primary key found for {table}")
+                continue
+
+            versioned = versions is not None and change.get("hlc")
+            if versioned:
+                has_conflict, conflict_info = compare_versions(change, versions.get((table, str(pk_value))))
+            elif needs_target_row(change, local_edits=local_edits):
+                has_conflict, conflict_info = detect_conflict_in_snapshot(change, table_snapshot)
+            else:
+                has_conflict, conflict_info = False, None
+            if has_conflict:
+                flag_target_edit(conflict_info, change, target_edits)
+                print(f"    ⚠️ CONFLICT DETECTED on {table} [pk={pk_value}]: {conflict_info['type']}")
+                conflicts.append((change, conflict_info, table_snapshot["pk_col"]))
+
+            if versioned:
+                versions[(table, str(pk_value))] = change["hlc"]
+            else:
+                current = table_snapshot["rows"].get(str(pk_value)) or {}
+                table_snapshot["rows"][str(pk_value)] = {**current, **row_data}
+            rows[change["id"]] = row_data
+
+        except BatchAborted:
+            raise
+        except Exception as e:
+            print(f"    ❌ Error processing change {change['id']}: {e}")
+            stats["failed_ids"].append(change["id"])
+            stats["errors"][change["id"]] = str(e)
+
+    # Pass 2: settle every conflict of the batch through the compiled policy
+    decisions = compile_conflict_policy(resolution_strategy).resolve_batch(conflicts)
+    for change, conflict_info, _ in conflicts:
+        report_conflict(target_conn, change, conflict_info, decisions[change["id"]])
+    stats["conflicts"] += len(conflicts)
+
+    # Pass 3: write the batch in order, merged conflict rows included
+    for change in changes:
+        try:
+            op = change["operation"]
+            table = change["table_name"]
+            pk_value = change["row_pk"]
+
+            if op == "DELETE":
+                flush()
+                with change_savepoint(target_conn, savepoints):
+                    deleted = apply_change_with_conflict_detection(target_conn, change, resolution_strategy)
+                if deleted:
+                    stats["statements"] += 1
+                    stats["rows"] += 1
+                    applied_ids.append(change["id"])
+                continue
+
+            if change["id"] not in rows:
+                continue
+
+            row_data = rows[change["id"]]
+            partial = is_delta_change(change)
+            decision = decisions.get(change["id"])
+            if decision:
+                if not decision.apply:
+                    continue
+                row_data = decision.row
+                partial = partial or decision.partial
+
+            if partial:
+                pk_col = snapshot[table]["pk_col"]
+                columns = tuple(col for col in row_data if col != pk_col)
+                if not columns:
+                    applied_ids.append(change["id"])
+                    continue
+                key = (table, columns, pk_col)
+                values = [serialize_row_value(row_data[col]) for col in columns] + [pk_value]
+            else:
+                key = (table, tuple(row_data.keys()), None)
+                values = [serialize_row_value(value) for value in row_data.values()]
+            row_bytes = estimate_row_bytes(values)
+
+            if key != pending_key or len(pending) >= max_rows or pending_bytes + row_bytes > max_bytes:
+                flush()
+
+            pending_key = key
+            pending.append((change, values))
+            pending_bytes += row_bytes
+
+        except BatchAborted:
+            raise
+        except Exception as e:
+            print(f"    ❌ Error processing change {change['id']}: {e}")
+            stats["failed_ids"].append(change["id"])
+            stats["errors"][change["id"]] = str(e)
+
+    flush()
+    return applied_ids, stats
+
+
+def coalesce_changes(changes):
+    """
+    Collapse a batch into the net effect per (table_name, row_pk).
+
+    - INSERT/UPDATE followed by more UPDATEs becomes one upsert carrying the merged row data
+    - anything followed by DELETE becomes a DELETE
+    - an INSERT later deleted in the same batch disappears entirely
+
+    Each surviving change keeps the id and created_at of the latest change it absorbed and
+    lists every absorbed id under 'coalesced_ids'. Returns (net_changes, dropped_ids, stats)
+    where dropped_ids are changes with no net effect that still need to be marked applied.
+
+    Net upserts are ordered at the first change they absorbed, so a parent row written
+    before its children still lands first; net DELETEs stay at their latest position,
+    after any change to the rows that reference them.
+    """
+    chains = {}  # (table, pk) -> {"ids": [...], "net": change or None, "absent": bool}
+    dropped_ids = []
+
+    for change in changes:
+        key = (change["table_name"], str(change["row_pk"]))
+        chain = chains.get(key)
+        if chain is None:
+            # An INSERT first means the row did not exist before this batch
+            chain = chains[key] = {"ids": [], "net": None, "absent": change["operation"] == "INSERT"}
+
+        chain["ids"].append(change["id"])
+        net = chain["net"]
+        op = change["operation"]
+
+        if op == "DELETE":
+            if chain["absent"]:
+                # Row was created inside this batch: nothing to apply on the target
+                dropped_ids.extend(chain["ids"])
+                chain["ids"] = []
+                chain["net"] = None
+            else:
+                chain["net"] = dict(change)
+        elif net is None or net["operation"] == "DELETE":
+            chain["net"] = dict(change)
+        else:
+            merged = json.loads(net["row_data"] or "{}")
+            merged.update(json.loads(change["row_data"] or "{}"))
+            # The merged row is only a delta if every absorbed change was a delta
+            row_format = "delta" if is_delta_change(net) and is_delta_change(change) else "full"
+            chain["net"] = dict(change, operation=net["operation"], row_data=json.dumps(merged),
+                                row_format=row_format)
+
+    positions = {}
+    net_changes = []
+    for chain in chains.values():
+        net = chain["net"]
+        if net is not None:
+            net["coalesced_ids"] = chain["ids"]
+            positions[net["id"]] = net["id"] if net["operation"] == "DELETE" else chain["ids"][0]
+            net_changes.append(net)
+
+    # Keep the original order (see above); the net change's own id stays the latest one
+    net_changes.sort(key=lambda c: positions[c["id"]])
+
+    stats = {
+        "input": len(changes),
+        "output": len(net_changes),
+        "eliminated": len(changes) - len(net_changes),
+        "cancelled": len(dropped_ids),
+    }
+    return net_changes, dropped_ids, stats
+
+
+def decode_compact_changes(conn, changes):
+    """Expand compact (positional array) row_data into the column -> value object the appliers use"""
+    db_name = None
+    for change in changes:
+        if change.get("row_format") != COMPACT_ROW_FORMAT:
+            continue
+        db_name = db_name or conn.db.decode()
+        columns = get_versioned_columns(conn, db_name, change["table_name"], change["columns_version"])
+        change["row_data"] = json.dumps(dict(zip(columns, json.loads(change["row_data"]))))
+        change["row_format"] = "full"
+    return changes
+
+
+def fetch_unapplied_changes(conn, target_node_id, table_name=None, limit=100, after_id=None):
+    """Fetch changes that haven't been applied to the target node yet.
+
+    Pass `after_id` to page through the backlog by id (keyset pagination).
+    """
     with conn.cursor() as cur:
         base_sql = """
                    SELECT * \
@@ -348,14 +1027,19 @@ def fetch_unapplied_changes(conn, target_node_id, table_name=None, limit=100):
             base_sql += " AND table_name = %s"
             args.append(table_name)
 
-        base_sql += " ORDER BY created_at ASC LIMIT %s"
+        if after_id is not None:
+            base_sql += " AND id > %s ORDER BY id ASC LIMIT %s"
+            args.append(after_id)
+        else:
+            # created_at has one-second resolution; id breaks ties so the order is deterministic
+            base_sql += " ORDER BY created_at ASC, id ASC LIMIT %s"
         args.append(limit)
 
         cur.execute(base_sql, args)
         results = cur.fetchall()
 
         print(f"    📋 Found {len(results)} unapplied changes")
-        return results
+        return decode_compact_changes(conn, results)
 
 
 def mark_change_as_applied(conn, change_id, target_node_id):
@@ -372,8 +1056,668 @@ def mark_change_as_applied(conn, change_id, target_node_id):
         return cur.rowcount > 0
 
 
+# Servers (host, port) where INFORMATION_SCHEMA.INNODB_TRX is readable (needs PROCESS)
+_trx_guard_available = {}
+
+# Oldest open transaction that has already written rows and may be writing to this
+# schema's change_log (sessions using another default schema, and read-only or idle
+# transactions, cannot hold uncommitted change_log ids of this database)
+OLDEST_WRITING_TRX_SQL = """
+    SELECT t.trx_started, t.trx_mysql_thread_id AS thread_id,
+           TIMESTAMPDIFF(SECOND, t.trx_started, NOW()) AS open_seconds
+    FROM information_schema.INNODB_TRX t
+    JOIN information_schema.PROCESSLIST p ON p.ID = t.trx_mysql_thread_id
+    WHERE t.trx_rows_modified > 0
+      AND t.trx_mysql_thread_id <> CONNECTION_ID()
+      AND (p.DB IS NULL OR p.DB = DATABASE())
+    ORDER BY t.trx_started
+    LIMIT 1
+    """
+
+
+def settled_changes_filter(conn, lag_seconds, max_hold_seconds=0):
+    """
+    SQL condition (and args) keeping only changes that can no longer be overtaken by a late
+    commit: older than `lag_seconds` and older than the oldest open transaction that has
+    written rows in this schema. A change_log row is stamped no earlier than its
+    transaction started, so an uncommitted row (invisible to the fetch) is always held back
+    with everything after it. A transaction open longer than `max_hold_seconds` (0 = no
+    limit) holds changes back by that long at most, and is reported.
+
+    Without the PROCESS privilege the open-transaction check is unavailable and only the
+    time lag applies: a transaction committing later than that is then skipped by the cursor.
+    """
+    if not lag_seconds:
+        return "", []
+
+    key = (getattr(conn, "host", None), getattr(conn, "port", None))
+    oldest = None
+    if _trx_guard_available.get(key, True):
+        try:
+            with conn.cursor() as cur:
+                cur.execute(OLDEST_WRITING_TRX_SQL)
+                oldest = cur.fetchone()
+            _trx_guard_available[key] = True
+        except Exception as e:
+            print(f"    ⚠️ Cannot read INNODB_TRX ({e}); relying on cursor_lag_seconds alone")
+            _trx_guard_available.setdefault(key, False)
+
+    if not oldest:
+        return " AND created_at <= NOW() - INTERVAL %s SECOND", [lag_seconds]
+
+    if max_hold_seconds and oldest["open_seconds"] > max_hold_seconds:
+        print(f"    ⚠️ Transaction on thread {oldest['thread_id']} has been open for {oldest['open_seconds']}s; "
+              f"holding changes back by {max_hold_seconds}s at most (cursor_guard_max_seconds), "
+              f"its changes are skipped if it commits later")
+        return " AND created_at <= NOW() - INTERVAL %s SECOND", [max_hold_seconds + lag_seconds]
+
+    if oldest["open_seconds"] > lag_seconds:
+        print(f"    ⏳ Holding back changes made after {oldest['trx_started']} until the transaction on "
+              f"thread {oldest['thread_id']} commits")
+    return " AND created_at <= %s - INTERVAL %s SECOND", [oldest["trx_started"], lag_seconds]
+
+
+def fetch_changes_after(conn, after_id, table_name=None, limit=100, lag_seconds=0, max_hold_seconds=0):
+    """Fetch changes with id > after_id in id order (an indexed range scan on change_log)."""
+    with conn.cursor() as cur:
+        sql = "SELECT * FROM change_log WHERE id > %s"
+        args = [after_id]
+
+        if table_name:
+            sql += " AND table_name = %s"
+            args.append(table_name)
+
+        settled_sql, settled_args = settled_changes_filter(conn, lag_seconds, max_hold_seconds)
+        sql += settled_sql
+        args.extend(settled_args)
+
+        sql += " ORDER BY id ASC LIMIT %s"
+        args.append(limit)
+
+        cur.execute(sql, args)
+        results = cur.fetchall()
+
+        print(f"    📋 Found {len(results)} changes after id {after_id}")
+        return decode_compact_changes(conn, results)
+
+
+def estimate_backlog(conn, after_id, table_name=None, tables=None):
+    """Count changes past `after_id` for one table or several (an upper bound in applied_nodes mode)."""
+    with conn.cursor() as cur:
+        sql = "SELECT COUNT(*) AS pending FROM change_log WHERE id > %s"
+        args = [after_id]
+
+        if table_name:
+            sql += " AND table_name = %s"
+            args.append(table_name)
+
+        if tables:
+            placeholders = ", ".join(["%s"] * len(tables))
+            sql += f" AND table_name IN ({placeholders})"
+            args.extend(tables)
+
+        cur.execute(sql, args)
+        row = cur.fetchone()
+        return row["pending"] if row else 0
+
+
+def fetch_change_stream(conn, after_id, tables=None, limit=100, lag_seconds=0, unapplied_for_node=None,
+                        max_hold_seconds=0):
+    """
+    Fetch one id-ordered page of changes across all `tables` (None = every table).
+
+    With `unapplied_for_node` the legacy applied_nodes filter is added, for pairs that
+    still track progress that way.
+    """
+    with conn.cursor() as cur:
+        sql = "SELECT * FROM change_log WHERE id > %s"
+        args = [after_id]
+
+        if tables:
+            placeholders = ", ".join(["%s"] * len(tables))
+            sql += f" AND table_name IN ({placeholders})"
+            args.extend(tables)
+
+        if unapplied_for_node:
+            sql += " AND (applied_nodes IS NULL OR JSON_SEARCH(applied_nodes, 'one', %s) IS NULL)"
+            args.append(unapplied_for_node)
+
+        settled_sql, settled_args = settled_changes_filter(conn, lag_seconds, max_hold_seconds)
+        sql += settled_sql
+        args.extend(settled_args)
+
+        sql += " ORDER BY id ASC LIMIT %s"
+        args.append(limit)
+
+        cur.execute(sql, args)
+        results = cur.fetchall()
+
+        print(f"    📋 Found {len(results)} changes after id {after_id} across all tables")
+        return decode_compact_changes(conn, results)
+
+
+def get_sync_cursors(conn, source_node_id, target_node_id, tables):
+    """
+    Load the cursors for several tables in one query, seeding missing ones from applied_nodes.
+
+    Tables that still have no cursor (no change_log rows yet) are absent from the result.
+    """
+    def load():
+        placeholders = ", ".join(["%s"] * len(tables))
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                        SELECT table_name, last_change_id
+                        FROM sync_cursor
+                        WHERE source_node = %s
+                          AND target_node = %s
+                          AND table_name IN ({placeholders})
+                        """, [source_node_id, target_node_id, *tables])
+            return {row["table_name"]: row["last_change_id"] for row in cur.fetchall()}
+
+    if not tables:
+        return {}
+
+    cursors = load()
+    missing = [t for t in tables if t not in cursors]
+    if missing:
+        migrate_applied_nodes_to_cursors(conn, source_node_id, target_node_id, missing)
+        cursors = load()
+
+    return cursors
+
+
+def get_sync_cursor(conn, source_node_id, target_node_id, table_name):
+    """
+    Return the last change id applied from this source to the target for a table.
+
+    A missing cursor is seeded once from legacy applied_nodes data; tables without any
+    change_log rows start at 0.
+    """
+    query = """
+            SELECT last_change_id
+            FROM sync_cursor
+            WHERE source_node = %s
+              AND target_node = %s
+              AND table_name = %s
+            """
+    args = (source_node_id, target_node_id, table_name)
+
+    with conn.cursor() as cur:
+        cur.execute(query, args)
+        row = cur.fetchone()
+        if row:
+            return row["last_change_id"]
+
+    migrate_applied_nodes_to_cursors(conn, source_node_id, target_node_id, [table_name])
+
+    with conn.cursor() as cur:
+        cur.execute(query, args)
+        row = cur.fetchone()
+        return row["last_change_id"] if row else 0
+
+
+def advance_sync_cursor(conn, source_node_id, target_node_id, table_name, last_change_id):
+    """Move a cursor forward to last_change_id (never backwards)."""
+    with conn.cursor() as cur:
+        cur.execute("""
+                    INSERT INTO sync_cursor (source_node, target_node, table_name, last_change_id)
+                    VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE last_change_id = GREATEST(last_change_id, VALUES(last_change_id))
+                    """, (source_node_id, target_node_id, table_name, last_change_id))
+
+
+def safe_cursor_position(fetched_changes, failed_ids):
+    """
+    Highest change id the cursor may move to after a batch.
+
+    Everything up to the batch's last id is done unless something failed, in which case
+    the cursor stops just before the earliest failed change so it is retried next run.
+    Dead-lettered changes (see record_failed_changes) are not passed in as failures.
+    """
+    if not fetched_changes:
+        return None
+
+    if failed_ids:
+        return min(failed_ids) - 1
+
+    return max(change["id"] for change in fetched_changes)
+
+
+def record_failed_changes(conn, source_node_id, target_node_id, failures, max_attempts):
+    """
+    Count one more failed attempt for each of `failures` ([(change, error message)]) in
+    sync_failed_change on the source. Changes that have now failed `max_attempts` times
+    are dead-lettered there; their ids are returned so the caller can acknowledge them
+    and move the cursor past them. With `max_attempts` 0 nothing is dead-lettered.
+    """
+    if not failures:
+        return set()
+
+    ids = [change["id"] for change, _ in failures]
+    placeholders = ", ".join(["%s"] * len(ids))
+    with conn.cursor() as cur:
+        cur.execute(f"""
+                    INSERT INTO `{SYNC_FAILED_CHANGE_TABLE}`
+                    (source_node, target_node, change_id, table_name, operation, row_pk, row_data, last_error)
+                    VALUES {", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(failures))}
+                    ON DUPLICATE KEY UPDATE attempts = attempts + 1, last_error = VALUES(last_error)
+                    """, [value for change, error in failures
+                          for value in (source_node_id, target_node_id, change["id"], change["table_name"],
+                                        change["operation"], str(change["row_pk"]), change.get("row_data"), error)])
+        if not max_attempts:
+            return set()
+
+        cur.execute(f"""
+                    SELECT change_id
+                    FROM `{SYNC_FAILED_CHANGE_TABLE}`
+                    WHERE source_node = %s
+                      AND target_node = %s
+                      AND change_id IN ({placeholders})
+                      AND attempts >= %s
+                    """, [source_node_id, target_node_id, *ids, max_attempts])
+        dead_ids = {row["change_id"] for row in cur.fetchall()}
+
+        if dead_ids:
+            cur.execute(f"""
+                        UPDATE `{SYNC_FAILED_CHANGE_TABLE}`
+                        SET dead_lettered_at = COALESCE(dead_lettered_at, NOW())
+                        WHERE source_node = %s
+                          AND target_node = %s
+                          AND change_id IN ({", ".join(["%s"] * len(dead_ids))})
+                        """, [source_node_id, target_node_id, *sorted(dead_ids)])
+
+    return dead_ids
+
+
+def mark_changes_as_applied(conn, change_ids, target_node_id, chunk_size=500):
+    """
+    Mark a batch of changes as applied to the target node.
+
+    All chunks run in one source transaction, so either every id is acknowledged or,
+    on error, none are. Ids that already list the node are left untouched.
+    Returns the number of rows updated.
+    """
+    change_ids = list(dict.fromkeys(change_ids))
+    if not change_ids:
+        return 0
+
+    updated = 0
+    conn.begin()
+    try:
+        with conn.cursor() as cur:
+            for start in range(0, len(change_ids), chunk_size):
+                chunk = change_ids[start:start + chunk_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cur.execute(f"""
+                            UPDATE change_log
+                            SET applied_nodes = JSON_ARRAY_APPEND(
+                                    COALESCE(applied_nodes, JSON_ARRAY()), '$', %s
+                                                )
+                            WHERE id IN ({placeholders})
+                              AND (applied_nodes IS NULL OR JSON_SEARCH(applied_nodes, 'one', %s) IS NULL)
+                            """, [target_node_id, *chunk, target_node_id])
+                updated += cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return updated
+
+
+def acknowledge_batch(source_conn, target_conn, change_ids, target_node_id, chunk_size=500, cursors=None,
+                      commit_target=False):
+    """
+    Acknowledge applied changes on the source only after the target has committed them.
+
+    If the target connection has an open transaction (`commit_target`, or autocommit off)
+    it is committed first; a failed commit raises before anything is acknowledged, so the
+    batch is retried as a whole.
+    With `cursors=[(source_node_id, table_name, last_change_id), ...]` the sync_cursor rows
+    are advanced instead of rewriting applied_nodes on every change.
+    """
+    if commit_target or not target_conn.get_autocommit():
+        target_conn.commit()
+
+    if cursors is not None:
+        for source_node_id, table_name, last_change_id in cursors:
+            if last_change_id is not None:
+                advance_sync_cursor(source_conn, source_node_id, target_node_id, table_name, last_change_id)
+        return len(set(change_ids))
+
+    return mark_changes_as_applied(source_conn, change_ids, target_node_id, chunk_size)
+
+
+def iter_change_pages(fetch_page, after_id, fetch_limit, pipeline_depth=0, source_lock=None):
+    """
+    Yield pages of changes using keyset pagination: fetch_page(after_id) -> list of changes,
+    continuing from the highest id of each page until a short or empty page.
+
+    With `pipeline_depth` > 0 the pages are fetched on a worker thread into a bounded
+    queue, so the next page is read from the source while the caller applies the current
+    one. The queue bound is the backpressure: the worker blocks once `pipeline_depth`
+    pages are waiting. The worker holds `source_lock` while fetching; the caller must hold
+    it for any other use of the source connection. Close the generator to stop early.
+    """
+    if not pipeline_depth:
+        while True:
+            page = fetch_page(after_id)
+            if not page:
+                return
+            yield page
+            if len(page) < fetch_limit:
+                return
+            after_id = max(change["id"] for change in page)
+
+    pages = queue.Queue(maxsize=pipeline_depth)
+    stop = threading.Event()
+    done = object()
+    lock = source_lock or threading.Lock()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def worker():
+        next_after_id = after_id
+        try:
+            while not stop.is_set():
+                with lock:
+                    page = fetch_page(next_after_id)
+                if not page:
+                    break
+                put(page)
+                if len(page) < fetch_limit:
+                    break
+                next_after_id = max(change["id"] for change in page)
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    thread = threading.Thread(target=worker, name="sync-prefetch", daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = pages.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def process_change_batch(source_conn, target_conn, changes, resolution_strategy, options,
+                         source_node_id, target_node_id, cursor_caps=None, source_lock=None):
+    """
+    Coalesce, apply and acknowledge one fetched batch.
+
+    `cursor_caps` ({table: last safe id}) is shared across the batches of a run when
+    change tracking uses sync_cursor: once a change fails, that table's cursor never moves
+    past it again in the same run, even if later batches succeed.
+
+    With the `transactional` option the whole batch is applied in one target transaction
+    (one commit instead of one per change), each change under its own savepoint, and the
+    source is acknowledged only after that commit.
+
+    Failed changes are counted in sync_failed_change; after `max_change_attempts` runs a
+    change is dead-lettered there and acknowledged, so it no longer pins the cursor.
+
+    Returns {"synced", "conflicts", "eliminated", "failed_ids", "dead_lettered"}.
+    """
+    fetched_changes = changes
+    result = {"synced": 0, "conflicts": 0, "eliminated": 0, "failed_ids": [], "dead_lettered": 0}
+    ack_ids = []
+    failed_ids = result["failed_ids"]
+    errors = {}  # change id -> error message of the failed changes
+    aborted = False
+    transactional = options["transactional"]
+
+    # Changes tagged with the target as their origin were applied there by this agent:
+    # acknowledge them without sending them back
+    echo_ids = [change["id"] for change in changes if change.get("source_node") == target_node_id]
+    if echo_ids:
+        ack_ids.extend(echo_ids)
+        changes = [change for change in changes if change.get("source_node") != target_node_id]
+        print(f"    🔁 Skipping {len(echo_ids)} changes that originated on the target")
+
+    if options["coalesce"]:
+        changes, dropped_ids, coalesce_stats = coalesce_changes(changes)
+        ack_ids.extend(dropped_ids)
+        result["eliminated"] = coalesce_stats["eliminated"]
+        print(f"    🧮 Coalesced {coalesce_stats['input']} changes into {coalesce_stats['output']} "
+              f"({coalesce_stats['eliminated']} eliminated, {coalesce_stats['cancelled']} cancelled out)")
+
+    absorbed = {change["id"]: change.get("coalesced_ids", [change["id"]]) for change in changes}
+
+    # merge_fields needs the conflicting fields, so it always compares target rows
+    resolution_strategy = compile_conflict_policy(resolution_strategy)
+    versions = None
+    detection = options["conflict_detection"]
+    if detection == "hlc" and not resolution_strategy.needs_field_values:
+        versions = fetch_row_versions(target_conn, target_node_id, changes, options["conflict_chunk_size"])
+    elif detection == "version" and not resolution_strategy.needs_field_values:
+        versions = fetch_registered_versions(target_conn, changes, options["conflict_chunk_size"])
+    local_edits = None
+    if detection == "change_log":
+        local_edits = fetch_locally_modified_keys(target_conn, target_node_id, source_node_id, changes,
+                                                  options["conflict_chunk_size"],
+                                                  use_cursor=options["change_tracking"] == "cursor")
+        print(f"    🔍 {len(local_edits)} rows in this batch have unsynced edits on the target")
+    target_edits = local_edits
+    if resolution_strategy.needs_field_values and target_edits is None:
+        # merge_fields keeps target values only where the target row was edited concurrently
+        target_edits = fetch_locally_modified_keys(target_conn, target_node_id, source_node_id, changes,
+                                                   options["conflict_chunk_size"],
+                                                   use_cursor=options["change_tracking"] == "cursor")
+    applied_changes = []
+
+    # CREATE TABLE commits implicitly, so it must not run inside the batch transaction
+    ensure_conflict_log_table(target_conn)
+
+    if transactional:
+        target_conn.begin()
+
+    try:
+        # Conflicts are written with one multi-row insert when the batch is done
+        with buffer_conflict_log(target_conn):
+            if options["apply_mode"] == "batch":
+                applied_ids, stats = apply_changes_batched(
+                    target_conn, changes, resolution_strategy,
+                    max_rows=options["batch_max_rows"], max_bytes=options["batch_max_bytes"],
+                    conflict_chunk_size=options["conflict_chunk_size"], savepoints=transactional,
+                    versions=versions, local_edits=local_edits, target_edits=target_edits
+                )
+                result["conflicts"] += stats["conflicts"]
+
+                applied_set = set(applied_ids)
+                applied_changes = [change for change in changes if change["id"] in applied_set]
+                for change_id in applied_ids:
+                    ack_ids.extend(absorbed[change_id])
+                for change_id in stats["failed_ids"]:
+                    failed_ids.extend(absorbed[change_id])
+                    errors.update(dict.fromkeys(absorbed[change_id], stats["errors"].get(change_id)))
+            else:
+                # Target rows are read once per batch, not with a SELECT per change
+                snapshot = prefetch_target_snapshot(target_conn, changes, options["conflict_chunk_size"],
+                                                    versions, local_edits)
+                for change in changes:
+                    try:
+                        print(f"\n    🔄 Processing change ID {change['id']}")
+
+                        # Apply change with conflict detection
+                        with change_savepoint(target_conn, transactional):
+                            applied = apply_change_with_conflict_detection(target_conn, change, resolution_strategy,
+                                                                           versions, local_edits, target_edits,
+                                                                           snapshot)
+                        if applied:
+                            applied_changes.append(change)
+                            ack_ids.extend(absorbed[change["id"]])
+
+                    except BatchAborted:
+                        raise
+                    except Exception as e:
+                        print(f"    ❌ Error processing change {change['id']}: {e}")
+                        failed_ids.extend(absorbed[change["id"]])
+                        errors.update(dict.fromkeys(absorbed[change["id"]], str(e)))
+                        import traceback
+                        traceback.print_exc()
+
+            if any(change.get("hlc") for change in changes):
+                try:
+                    with change_savepoint(target_conn, transactional):
+                        advance_sync_clock(target_conn, target_node_id, changes)
+                        if detection == "version":
+                            record_row_versions(target_conn, applied_changes)
+                except BatchAborted:
+                    raise
+                except Exception as e:
+                    print(f"    ⚠️ Could not record applied versions on the target: {e}")
+    except BatchAborted as e:
+        # The server already discarded the transaction: nothing from this batch is on the target
+        print(f"    ❌ Batch transaction aborted by the server, batch will be retried: {e}")
+        target_conn.rollback()
+        ack_ids = []
+        failed_ids[:] = [change["id"] for change in fetched_changes]
+        aborted = True
+    except Exception:
+        # The target connection is the source of the opposite direction: its next commit
+        # must not pick up a half-applied batch
+        if transactional:
+            target_conn.rollback()
+        raise
+
+    if failed_ids and not aborted:
+        # A change that keeps failing (FK or NOT NULL violation...) must not pin the cursor forever
+        fetched_by_id = {change["id"]: change for change in fetched_changes}
+        try:
+            with source_lock or nullcontext():
+                dead_ids = record_failed_changes(source_conn, source_node_id, target_node_id,
+                                                 [(fetched_by_id[i], errors.get(i)) for i in failed_ids],
+                                                 options["max_change_attempts"])
+        except Exception as e:
+            print(f"    ⚠️ Could not record failed changes in {SYNC_FAILED_CHANGE_TABLE}: {e}")
+            dead_ids = set()
+        if dead_ids:
+            print(f"    ☠️ {len(dead_ids)} changes failed {options['max_change_attempts']} times, "
+                  f"dead-lettered in {SYNC_FAILED_CHANGE_TABLE}")
+            ack_ids.extend(sorted(dead_ids))
+            failed_ids[:] = [i for i in failed_ids if i not in dead_ids]
+            result["dead_lettered"] = len(dead_ids)
+
+    # Mark as applied, including changes absorbed or cancelled out by coalescing
+    cursors = None
+    if cursor_caps is not None:
+        cursors = []
+        tables_in_batch = dict.fromkeys(change["table_name"] for change in fetched_changes)
+        for table in tables_in_batch:
+            table_changes = [c for c in fetched_changes if c["table_name"] == table]
+            table_ids = {c["id"] for c in table_changes}
+            position = safe_cursor_position(table_changes, [i for i in failed_ids if i in table_ids])
+
+            if table in cursor_caps:
+                position = min(position, cursor_caps[table])
+            if position < max(table_ids):
+                cursor_caps[table] = position
+            cursors.append((source_node_id, table, position))
+
+    try:
+        with source_lock or nullcontext():
+            result["synced"] = acknowledge_batch(source_conn, target_conn, ack_ids, target_node_id,
+                                                 options["ack_chunk_size"], cursors, commit_target=transactional)
+    except Exception as e:
+        print(f"    ❌ Failed to acknowledge {len(ack_ids)} changes, batch will be retried: {e}")
+        if transactional:
+            target_conn.rollback()
+
+    return result
+
+
+def sync_change_stream(source_conn, target_conn, tables_to_sync, resolution_strategy, options,
+                       source_node_id, target_node_id, budget_exhausted, source_lock=None):
+    """
+    Sync a direction from one id-ordered change_log stream covering every table.
+
+    One query per page replaces one query per table, and rows from different tables are
+    applied in the order they were written, so parents land before their children.
+    Rows at or below their own table's cursor (tables can sit at different positions)
+    are skipped. After each page, the cursors of tables with nothing to apply in it (and
+    no failure this run) move up to the page's last id, so an idle table does not hold the
+    start of the next run's stream back. Returns {"synced", "conflicts", "eliminated", "fetched"}.
+    """
+    use_cursor = options["change_tracking"] == "cursor"
+    fetch_limit = options["fetch_limit"]
+    totals = {"synced": 0, "conflicts": 0, "eliminated": 0, "fetched": 0}
+
+    cursors = get_sync_cursors(source_conn, source_node_id, target_node_id, tables_to_sync) if use_cursor else {}
+    cursor_caps = {} if use_cursor else None
+    start_after_id = min(cursors.values()) if cursors else 0
+    remaining = None
+    started = time.perf_counter()
+
+    def fetch_page(after_id):
+        return fetch_change_stream(source_conn, after_id, tables_to_sync, fetch_limit,
+                                   options["cursor_lag_seconds"] if use_cursor else 0,
+                                   None if use_cursor else target_node_id, options["cursor_guard_max_seconds"])
+
+    pages = iter_change_pages(fetch_page, start_after_id, fetch_limit,
+                              options["pipeline_depth"] if source_lock else 0, source_lock)
+    try:
+        for page in pages:
+            if remaining is None and len(page) == fetch_limit:
+                with source_lock or nullcontext():
+                    remaining = estimate_backlog(source_conn, start_after_id, tables=tables_to_sync)
+
+            totals["fetched"] += len(page)
+
+            changes = [c for c in page if c["id"] > cursors.get(c["table_name"], 0)]
+            if changes:
+                result = process_change_batch(source_conn, target_conn, changes, resolution_strategy, options,
+                                              source_node_id, target_node_id, cursor_caps, source_lock)
+                for key in ("synced", "conflicts", "eliminated"):
+                    totals[key] += result[key]
+
+            if use_cursor:
+                page_end = max(c["id"] for c in page)
+                busy = {c["table_name"] for c in changes}
+                idle = [t for t in tables_to_sync
+                        if t not in busy and t not in cursor_caps and cursors.get(t, 0) < page_end]
+                if idle:
+                    with source_lock or nullcontext():
+                        for table in idle:
+                            advance_sync_cursor(source_conn, source_node_id, target_node_id, table, page_end)
+                    cursors.update(dict.fromkeys(idle, page_end))
+
+            if len(page) < fetch_limit:
+                break
+
+            elapsed = time.perf_counter() - started
+            rate = totals["fetched"] / elapsed if elapsed > 0 else 0.0
+            left = max((remaining or 0) - totals["fetched"], 0)
+            print(f"    ⏩ {totals['fetched']} changes processed, ~{left} remaining ({rate:.1f} rows/sec)")
+
+            if budget_exhausted(totals["fetched"]):
+                print(f"    ⏸️ Run budget used up, ~{left} changes left for the next run")
+                break
+    finally:
+        pages.close()
+
+    if not totals["fetched"]:
+        print(f"  📭 No unapplied changes for any table")
+
+    return totals
+
+
 def sync_changes_with_conflict_resolution(source_conn, target_conn, sync_pair_name, tables="all",
-                                          resolution_strategy='timestamp_wins'):
+                                          resolution_strategy='timestamp_wins', options=None):
     """
     Sync changes from source to target database with conflict resolution.
 
@@ -383,7 +1727,21 @@ def sync_changes_with_conflict_resolution(source_conn, target_conn, sync_pair_na
     - 'target_wins': Target database always wins
     - 'merge_fields': Merge non-conflicting fields only
     - 'manual': Log conflicts for manual resolution
+
+    `resolution_strategy` may also be a per-table/per-column policy dict (see
+    core.conflict_policy); it is compiled once for the whole run.
+
+    Each table is paged by change id until its backlog is drained or the run's time/row
+    budget (max_run_seconds / max_run_rows) is spent; whatever is left waits for the next run.
+
+    `options` overrides DEFAULT_SYNC_OPTIONS (see doc/config_reference.md).
     """
+    options = resolve_sync_options(options)
+    resolution_strategy = compile_conflict_policy(resolution_strategy)
+    apply_mode = options["apply_mode"]
+    use_cursor = options["change_tracking"] == "cursor"
+    fetch_limit = options["fetch_limit"]
+
     try:
         source_db = source_conn.db.decode()
         target_db = target_conn.db.decode()
@@ -394,15 +1752,18 @@ def sync_changes_with_conflict_resolution(source_conn, target_conn, sync_pair_na
 
         # Determine sync direction
         if "local" in source_db.lower() or "127.0.0.1" in source_db:
-            target_node_id = cloud_node_id
+            source_node_id, target_node_id = local_node_id, cloud_node_id
             direction = "LOCAL → CLOUD"
         else:
-            target_node_id = local_node_id
+            source_node_id, target_node_id = cloud_node_id, local_node_id
             direction = "CLOUD → LOCAL"
 
-        print(f"\n📊 {direction} (Strategy: {resolution_strategy})")
+        print(f"\n📊 {direction} (Strategy: {resolution_strategy}, apply mode: {apply_mode})")
         print(f"🔄 {source_db} → {target_db}")
 
+        # Let the target's triggers recognise the changes this run applies
+        set_sync_origin(target_conn, source_node_id, options["binlog_session_marker"])
+
         # Get tables to sync
         if tables == "all":
             tables_to_sync = get_table_list(source_conn, source_db, tables)
@@ -411,43 +1772,106 @@ def sync_changes_with_conflict_resolution(source_conn, target_conn, sync_pair_na
 
         total_synced = 0
         total_conflicts = 0
+        total_eliminated = 0
+        total_fetched = 0
+        run_started = time.perf_counter()
+        budget_spent = False
+
+        # In pipeline mode the prefetch worker and this thread share the source connection
+        source_lock = threading.Lock() if options["pipeline"] else None
+        pipeline_depth = options["pipeline_depth"] if options["pipeline"] else 0
+
+        def budget_exhausted(fetched):
+            if options["max_run_seconds"] and time.perf_counter() - run_started >= options["max_run_seconds"]:
+                return True
+            return bool(options["max_run_rows"]) and fetched >= options["max_run_rows"]
+
+        if options["fetch_mode"] == "stream":
+            totals = sync_change_stream(source_conn, target_conn, tables_to_sync, resolution_strategy, options,
+                                        source_node_id, target_node_id, budget_exhausted, source_lock)
+            print(f"\n  📊 SYNC SUMMARY: {totals['synced']} changes synced, {totals['conflicts']} conflicts handled, "
+                  f"{totals['eliminated']} superseded changes coalesced away")
+            return
 
         # Sync each table
         for table in tables_to_sync:
-            print(f"\n  📋 Processing table: {table}")
-            changes = fetch_unapplied_changes(source_conn, target_node_id, table)
+            if budget_spent:
+                break
 
-            if not changes:
-                print(f"  📭 No unapplied changes for table: {table}")
-                continue
+            print(f"\n  📋 Processing table: {table}")
+            cursor_caps = {} if use_cursor else None
+            after_id = get_sync_cursor(source_conn, source_node_id, target_node_id, table) if use_cursor else 0
 
             table_conflicts = 0
             table_synced = 0
+            table_fetched = 0
+            remaining = None
+            started = time.perf_counter()
+
+            def fetch_page(after_id, table=table):
+                if use_cursor:
+                    return fetch_changes_after(source_conn, after_id, table, fetch_limit,
+                                               options["cursor_lag_seconds"], options["cursor_guard_max_seconds"])
+                return fetch_unapplied_changes(source_conn, target_node_id, table, fetch_limit, after_id)
+
+            # Keyset pagination: keep fetching id > last seen until drained or out of budget
+            pages = iter_change_pages(fetch_page, after_id, fetch_limit, pipeline_depth, source_lock)
+            try:
+                for changes in pages:
+                    # Only count the backlog when it is bigger than one page
+                    if remaining is None and len(changes) == fetch_limit:
+                        with source_lock or nullcontext():
+                            remaining = estimate_backlog(source_conn, after_id, table)
+
+                    table_fetched += len(changes)
+                    total_fetched += len(changes)
+
+                    result = process_change_batch(source_conn, target_conn, changes, resolution_strategy, options,
+                                                  source_node_id, target_node_id, cursor_caps, source_lock)
+                    table_synced += result["synced"]
+                    table_conflicts += result["conflicts"]
+                    total_synced += result["synced"]
+                    total_conflicts += result["conflicts"]
+                    total_eliminated += result["eliminated"]
+
+                    if len(changes) < fetch_limit:
+                        break
+
+                    elapsed = time.perf_counter() - started
+                    rate = table_fetched / elapsed if elapsed > 0 else 0.0
+                    left = max((remaining or 0) - table_fetched, 0)
+                    print(f"    ⏩ {table}: {table_fetched} changes processed, ~{left} remaining "
+                          f"({rate:.1f} rows/sec)")
+
+                    if budget_exhausted(total_fetched):
+                        budget_spent = True
+                        print(f"    ⏸️ Run budget used up, ~{left} changes for {table} left for the next run")
+                        break
+            finally:
+                pages.close()
+
+            if not table_fetched:
+                print(f"  📭 No unapplied changes for table: {table}")
+                continue
 
-            for change in changes:
-                try:
-                    print(f"\n    🔄 Processing change ID {change['id']}")
-
-                    # Apply change with conflict detection
-                    if apply_change_with_conflict_detection(target_conn, change, resolution_strategy):
-                        # Mark as applied
-                        if mark_change_as_applied(source_conn, change["id"], target_node_id):
-                            table_synced += 1
-                            total_synced += 1
-
-                except Exception as e:
-                    print(f"    ❌ Error processing change {change['id']}: {e}")
-                    import traceback
-                    traceback.print_exc()
-
-            print(f"  🎯 Table {table}: {table_synced} synced, {table_conflicts} conflicts")
+            elapsed = time.perf_counter() - started
+            rate = table_synced / elapsed if elapsed > 0 else 0.0
+            print(f"  🎯 Table {table}: {table_synced} synced, {table_conflicts} conflicts "
+                  f"({rate:.1f} rows/sec, {apply_mode} mode)")
 
-        print(f"\n  📊 SYNC SUMMARY: {total_synced} changes synced, {total_conflicts} conflicts handled")
+        print(f"\n  📊 SYNC SUMMARY: {total_synced} changes synced, {total_conflicts} conflicts handled, "
+              f"{total_eliminated} superseded changes coalesced away")
 
     except Exception as e:
         print(f"❌ Sync error: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        # The same connection is the source of the opposite direction
+        try:
+            set_sync_origin(target_conn, None, options["binlog_session_marker"])
+        except Exception as e:
+            print(f"⚠️ Could not clear sync session marker: {e}")
 
 
 def sync_changes(source_conn, target_conn, table_name, batch_size=1000):
@@ -3,106 +3,120 @@ Debug script to identify and fix the trigger issue.
 Run this to see what's wrong with your triggers and fix them.
 """
 
+from core.collector import collect_from_databases
 from core.config import load_config
-from core.connector import connect_mysql
+
+def describe_tables_and_triggers(conn, pair_name, db_type):
+    """Structure and triggers of every table in one database, as report lines"""
+    lines = []
+    db_name = conn.db.decode()
+
+    with conn.cursor() as cur:
+        # Show all tables
+        cur.execute("SHOW TABLES")
+        tables = [list(row.values())[0] for row in cur.fetchall()]
+        lines.append(f"Tables: {tables}")
+
+        # For each table (except change_log), show structure and triggers
+        for table in tables:
+            if table == "change_log":
+                continue
+
+            lines.append(f"\n📋 Table: {table}")
+
+            # Show table columns
+            cur.execute(f"DESCRIBE `{table}`")
+            columns = cur.fetchall()
+            lines.append("Columns:")
+            for col in columns:
+                key_info = f" [{col['Key']}]" if col['Key'] else ""
+                lines.append(f"  - {col['Field']}: {col['Type']}{key_info}")
+
+            # Show existing triggers
+            cur.execute(f"""
+                SELECT TRIGGER_NAME, EVENT_MANIPULATION, ACTION_STATEMENT
+                FROM INFORMATION_SCHEMA.TRIGGERS
+                WHERE TRIGGER_SCHEMA = %s AND EVENT_OBJECT_TABLE = %s
+            """, (db_name, table))
+
+            triggers = cur.fetchall()
+            if triggers:
+                lines.append("Existing triggers:")
+                for trig in triggers:
+                    lines.append(f"  - {trig['TRIGGER_NAME']} ({trig['EVENT_MANIPULATION']})")
+                    # Print first 200 chars of trigger code
+                    action = trig['ACTION_STATEMENT'][:200] + "..." if len(trig['ACTION_STATEMENT']) > 200 else trig['ACTION_STATEMENT']
+                    lines.append(f"    Action: {action}")
+            else:
+                lines.append("No triggers found")
+
+    return lines
+
 
 def debug_table_structure():
     """Debug the table structure and triggers to identify the issue."""
     config = load_config()
+    results = collect_from_databases(config, describe_tables_and_triggers)
 
     for pair in config["sync_pairs"]:
         print(f"\n=== Debugging sync pair: {pair['name']} ===")
 
-        for db_type in ["local", "cloud"]:
-            print(f"\n--- {db_type.upper()} DATABASE ---")
-
-            try:
-                conn = connect_mysql(pair[db_type])
-                db_name = pair[db_type]["db"]
-
-                with conn.cursor() as cur:
-                    # Show all tables
-                    cur.execute("SHOW TABLES")
-                    tables = [list(row.values())[0] for row in cur.fetchall()]
-                    print(f"Tables: {tables}")
-
-                    # For each table (except change_log), show structure and triggers
-                    for table in tables:
-                        if table == "change_log":
-                            continue
-
-                        print(f"\n📋 Table: {table}")
-
-                        # Show table columns
-                        cur.execute(f"DESCRIBE `{table}`")
-                        columns = cur.fetchall()
-                        print("Columns:")
-                        for col in columns:
-                            key_info = f" [{col['Key']}]" if col['Key'] else ""
-                            print(f"  - {col['Field']}: {col['Type']}{key_info}")
-
-                        # Show existing triggers
-                        cur.execute(f"""
-                            SELECT TRIGGER_NAME, EVENT_MANIPULATION, ACTION_STATEMENT
-                            FROM INFORMATION_SCHEMA.TRIGGERS
-                            WHERE TRIGGER_SCHEMA = %s AND EVENT_OBJECT_TABLE = %s
-                        """, (db_name, table))
-
-                        triggers = cur.fetchall()
-                        if triggers:
-                            print("Existing triggers:")
-                            for trig in triggers:
-                                print(f"  - {trig['TRIGGER_NAME']} ({trig['EVENT_MANIPULATION']})")
-                                # Print first 200 chars of trigger code
-                                action = trig['ACTION_STATEMENT'][:200] + "..." if len(trig['ACTION_STATEMENT']) > 200 else trig['ACTION_STATEMENT']
-                                print(f"    Action: {action}")
-                        else:
-                            print("No triggers found")
-
-                conn.close()
-
-            except Exception as e:
-                print(f"❌ Error debugging {db_type}: {e}")
+        for result in results:
+            if result.pair != pair["name"]:
+                continue
+
+            print(f"\n--- {result.db_type.upper()} DATABASE ---")
+            if not result.ok:
+                print(f"❌ Error debugging {result.db_type}: {result.error}")
+                continue
+            for line in result.value:
+                print(line)
+
+
+def drop_sync_triggers(conn, pair_name, db_type):
+    """Drop the sync triggers (trg_*) of one database, as report lines"""
+    lines = []
+    db_name = conn.db.decode()
+
+    with conn.cursor() as cur:
+        # Get all triggers
+        cur.execute("""
+            SELECT TRIGGER_NAME, EVENT_OBJECT_TABLE
+            FROM INFORMATION_SCHEMA.TRIGGERS
+            WHERE TRIGGER_SCHEMA = %s
+            AND TRIGGER_NAME LIKE 'trg_%%'
+        """, (db_name,))
+
+        triggers = cur.fetchall()
+
+        if not triggers:
+            lines.append(f"  📭 No triggers found in {db_type}")
+        else:
+            for trig in triggers:
+                drop_sql = f"DROP TRIGGER IF EXISTS `{trig['TRIGGER_NAME']}`"
+                cur.execute(drop_sql)
+                lines.append(f"  ❌ Dropped: {trig['TRIGGER_NAME']} on {trig['EVENT_OBJECT_TABLE']}")
+            lines.append(f"  ✅ Dropped {len(triggers)} triggers from {db_type}")
+
+    return lines
 
 
 def drop_all_triggers():
     """Drop all existing triggers to start fresh."""
     config = load_config()
+    results = collect_from_databases(config, drop_sync_triggers)
 
     for pair in config["sync_pairs"]:
         print(f"\n🧹 Cleaning triggers for: {pair['name']}")
 
-        for db_type in ["local", "cloud"]:
-            try:
-                conn = connect_mysql(pair[db_type])
-                db_name = pair[db_type]["db"]
-
-                with conn.cursor() as cur:
-                    # Get all triggers
-                    cur.execute("""
-                        SELECT TRIGGER_NAME, EVENT_OBJECT_TABLE
-                        FROM INFORMATION_SCHEMA.TRIGGERS
-                        WHERE TRIGGER_SCHEMA = %s
-                        AND TRIGGER_NAME LIKE 'trg_%%'
-                    """, (db_name,))
-
-                    triggers = cur.fetchall()
-
-                    if not triggers:
-                        print(f"  📭 No triggers found in {db_type}")
-                    else:
-                        for trig in triggers:
-                            drop_sql = f"DROP TRIGGER IF EXISTS `{trig['TRIGGER_NAME']}`"
-                            cur.execute(drop_sql)
-                            print(f"  ❌ Dropped: {trig['TRIGGER_NAME']} on {trig['EVENT_OBJECT_TABLE']}")
-                        print(f"  ✅ Dropped {len(triggers)} triggers from {db_type}")
-
-                conn.close()
-
-            except Exception as e:
-                print(f"  ❌ Error cleaning {db_type}: {e}")
-                import traceback
-                traceback.print_exc()
+        for result in results:
+            if result.pair != pair["name"]:
+                continue
+            if not result.ok:
+                print(f"  ❌ Error cleaning {result.db_type}: {result.error}")
+                continue
+            for line in result.value:
+                print(line)
 
 
 if __name__ == "__main__":
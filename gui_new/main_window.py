@@ -293,7 +293,7 @@ class MainWindow(QMainWindow):
         QApplication.quit()  # Quit application
 
     def manage_triggers(self, config=None):
-        """Manage database triggers - drop existing and create new ones"""
+        """Manage database triggers - redeploy only triggers whose definition changed"""
         if not config:
             config = load_gui_config()
 
@@ -302,18 +302,19 @@ class MainWindow(QMainWindow):
         try:
             self.logger.log_sync_operation(
                 'Trigger Management',
-                {'status': 'starting', 'action': 'recreating triggers'}
+                {'status': 'starting', 'action': 'updating triggers'}
             )
 
-            # First drop all existing triggers
-            self._drop_all_triggers(core_config)
+            # Table definitions may have changed since they were cached
+            from core.schema import invalidate_table_meta
+            invalidate_table_meta()
 
-            # Then recreate triggers for selected tables
+            # Changed tables are redeployed, removed tables lose their triggers
             self._setup_new_triggers(core_config)
 
             self.logger.log_sync_operation(
                 'Trigger Management',
-                {'status': 'completed', 'action': 'triggers recreated'}
+                {'status': 'completed', 'action': 'triggers updated'}
             )
         except Exception as e:
             self.logger.log_sync_operation(
@@ -323,54 +324,9 @@ class MainWindow(QMainWindow):
             )
             raise
 
-    def _drop_all_triggers(self, config):
-        """Drop all existing triggers from sync pairs"""
-        for pair in config["sync_pairs"]:
-            self.logger.log_sync_operation(
-                'Drop Triggers',
-                {'sync_pair': pair['name'], 'status': 'starting'}
-            )
-
-            for db_type in ["local", "cloud"]:
-                try:
-                    conn = connect_mysql(pair[db_type])
-                    db_name = pair[db_type]["db"]
-
-                    with conn.cursor() as cur:
-                        cur.execute("""
-                            SELECT TRIGGER_NAME, EVENT_OBJECT_TABLE
-                            FROM INFORMATION_SCHEMA.TRIGGERS
-                            WHERE TRIGGER_SCHEMA = %s
-                            AND TRIGGER_NAME LIKE 'trg_%%'
-                        """, (db_name,))
-
-                        triggers = cur.fetchall()
-
-                        for trig in triggers:
-                            drop_sql = f"DROP TRIGGER IF EXISTS `{trig['TRIGGER_NAME']}`"
-                            cur.execute(drop_sql)
-                            self.logger.log_sync_operation(
-                                'Drop Trigger',
-                                {
-                                    'sync_pair': pair['name'],
-                                    'database': db_type,
-                                    'trigger': trig['TRIGGER_NAME'],
-                                    'table': trig['EVENT_OBJECT_TABLE']
-                                }
-                            )
-
-                    conn.close()
-                except Exception as e:
-                    self.logger.log_sync_operation(
-                        'Drop Triggers',
-                        {'sync_pair': pair['name'], 'database': db_type, 'status': 'failed'},
-                        error=str(e)
-                    )
-                    raise
-
     def _setup_new_triggers(self, config):
         """Set up new triggers for all sync pairs"""
-        from core.schema import ensure_change_log_table, setup_triggers
+        from core.schema import ensure_change_log_table, setup_change_capture
 
         for pair in config["sync_pairs"]:
             self.logger.log_sync_operation(
@@ -391,8 +347,8 @@ class MainWindow(QMainWindow):
                 local_conn = connect_mysql(pair["local"])
                 local_db = pair["local"]["db"]
 
-                ensure_change_log_table(local_conn)
-                setup_triggers(local_conn, local_db, tables, local_node_id)
+                ensure_change_log_table(local_conn, (pair.get("retention") or {}).get("partitioned", False))
+                setup_change_capture(local_conn, local_db, tables, local_node_id, pair.get("capture"))
 
                 local_conn.close()
 
@@ -419,8 +375,8 @@ class MainWindow(QMainWindow):
                 cloud_conn = connect_mysql(pair["cloud"])
                 cloud_db = pair["cloud"]["db"]
 
-                ensure_change_log_table(cloud_conn)
-                setup_triggers(cloud_conn, cloud_db, tables, cloud_node_id)
+                ensure_change_log_table(cloud_conn, (pair.get("retention") or {}).get("partitioned", False))
+                setup_change_capture(cloud_conn, cloud_db, tables, cloud_node_id, pair.get("capture"))
 
                 cloud_conn.close()
 
@@ -1,6 +1,6 @@
 from core.config import load_config
 from core.connector import connect_mysql
-from core.schema import ensure_change_log_table, setup_triggers
+from core.schema import ensure_change_log_table, ensure_conflict_log_table, setup_change_capture
 from core.scheduler.jobs import start_sync_scheduler_with_conflict_resolution, show_conflict_strategies
 import uuid
 
@@ -43,60 +43,10 @@ def initialize_sync_infrastructure_with_conflict_resolution():
             local_db = pair["local"]["db"]
 
             print(f"  🔧 Setting up local DB: {local_db}")
-            ensure_change_log_table(local_conn)
-            setup_triggers(local_conn, local_db, tables, local_node_id)
-
-            # Create conflict_log table
-            with local_conn.cursor() as cur:
-                cur.execute("""
-                            CREATE TABLE IF NOT EXISTS conflict_log
-                            (
-                                id
-                                BIGINT
-                                AUTO_INCREMENT
-                                PRIMARY
-                                KEY,
-                                change_id
-                                BIGINT
-                                NOT
-                                NULL,
-                                table_name
-                                VARCHAR
-                            (
-                                255
-                            ) NOT NULL,
-                                record_pk VARCHAR
-                            (
-                                255
-                            ) NOT NULL,
-                                conflict_type VARCHAR
-                            (
-                                50
-                            ) NOT NULL,
-                                source_data JSON,
-                                target_data JSON,
-                                conflict_details JSON,
-                                resolution VARCHAR
-                            (
-                                50
-                            ) NOT NULL,
-                                resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                INDEX idx_table_pk
-                            (
-                                table_name,
-                                record_pk
-                            ),
-                                INDEX idx_resolved_at
-                            (
-                                resolved_at
-                            ),
-                                INDEX idx_resolution
-                            (
-                                resolution
-                            )
-                                )
-                            """)
+            ensure_change_log_table(local_conn, (pair.get("retention") or {}).get("partitioned", False))
+            setup_change_capture(local_conn, local_db, tables, local_node_id, pair.get("capture"))
 
+            ensure_conflict_log_table(local_conn)
             local_conn.close()
             print(f"  ✅ Local DB setup complete")
 
@@ -112,60 +62,10 @@ def initialize_sync_infrastructure_with_conflict_resolution():
             cloud_db = pair["cloud"]["db"]
 
             print(f"  🔧 Setting up cloud DB: {cloud_db}")
-            ensure_change_log_table(cloud_conn)
-            setup_triggers(cloud_conn, cloud_db, tables, cloud_node_id)
-
-            # Create conflict_log table
-            with cloud_conn.cursor() as cur:
-                cur.execute("""
-                            CREATE TABLE IF NOT EXISTS conflict_log
-                            (
-                                id
-                                BIGINT
-                                AUTO_INCREMENT
-                                PRIMARY
-                                KEY,
-                                change_id
-                                BIGINT
-                                NOT
-                                NULL,
-                                table_name
-                                VARCHAR
-                            (
-                                255
-                            ) NOT NULL,
-                                record_pk VARCHAR
-                            (
-                                255
-                            ) NOT NULL,
-                                conflict_type VARCHAR
-                            (
-                                50
-                            ) NOT NULL,
-                                source_data JSON,
-                                target_data JSON,
-                                conflict_details JSON,
-                                resolution VARCHAR
-                            (
-                                50
-                            ) NOT NULL,
-                                resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                INDEX idx_table_pk
-                            (
-                                table_name,
-                                record_pk
-                            ),
-                                INDEX idx_resolved_at
-                            (
-                                resolved_at
-                            ),
-                                INDEX idx_resolution
-                            (
-                                resolution
-                            )
-                                )
-                            """)
+            ensure_change_log_table(cloud_conn, (pair.get("retention") or {}).get("partitioned", False))
+            setup_change_capture(cloud_conn, cloud_db, tables, cloud_node_id, pair.get("capture"))
 
+            ensure_conflict_log_table(cloud_conn)
             cloud_conn.close()
             print(f"  ✅ Cloud DB setup complete")
 
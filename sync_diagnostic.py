@@ -3,10 +3,95 @@ Sync Diagnostic Tool - Run this to debug what's happening with your sync
 """
 
 import json
+from core.collector import collect_from_databases
 from core.config import load_config
 from core.connector import connect_mysql
 
 
+def diagnose_database(conn, node_id):
+    """change_log checks for one database, as report lines"""
+    lines = []
+
+    with conn.cursor() as cur:
+        # 1. Check if change_log table exists
+        cur.execute("SHOW TABLES LIKE 'change_log'")
+        if not cur.fetchone():
+            lines.append("❌ change_log table doesn't exist!")
+            return lines
+
+        # 2. Show all changes in change_log
+        cur.execute("""
+                    SELECT id,
+                           table_name,
+                           operation,
+                           row_pk,
+                           source_node,
+                           applied_nodes,
+                           created_at
+                    FROM change_log
+                    ORDER BY created_at DESC LIMIT 10
+                    """)
+        changes = cur.fetchall()
+
+        if not changes:
+            lines.append("📭 No changes found in change_log")
+        else:
+            lines.append(f"📊 Found {len(changes)} recent changes:")
+            for change in changes:
+                applied = change.get('applied_nodes', '[]')
+                lines.append(f"  ID {change['id']}: {change['operation']} on {change['table_name']}")
+                lines.append(f"    PK: {change['row_pk']}, Source: {change['source_node']}")
+                lines.append(f"    Applied to: {applied}")
+                lines.append(f"    Created: {change['created_at']}")
+
+        # 3. Test the unapplied changes query
+        lines.append(f"\n🔍 Testing unapplied changes query for node: {node_id}")
+
+        # Try different query approaches
+        queries = [
+            # Original query
+            ("Original Query", """
+                               SELECT COUNT(*) as count
+                               FROM change_log
+                               WHERE NOT JSON_CONTAINS(applied_nodes
+                                   , %s)
+                                 AND source_node != %s
+                               """),
+            # Alternative query 1
+            ("Alternative 1", """
+                              SELECT COUNT(*) as count
+                              FROM change_log
+                              WHERE applied_nodes NOT LIKE %s
+                                AND source_node != %s
+                              """),
+            # Alternative query 2
+            ("Alternative 2", """
+                              SELECT COUNT(*) as count
+                              FROM change_log
+                              WHERE JSON_SEARCH(applied_nodes
+                                  , 'one'
+                                  , %s) IS NULL
+                                AND source_node != %s
+                              """)
+        ]
+
+        for name, query in queries:
+            try:
+                if "JSON_CONTAINS" in query:
+                    cur.execute(query, (json.dumps(node_id), node_id))
+                elif "NOT LIKE" in query:
+                    cur.execute(query, (f'%"{node_id}"%', node_id))
+                else:
+                    cur.execute(query, (node_id, node_id))
+
+                result = cur.fetchone()
+                lines.append(f"    {name}: {result['count']} unapplied changes")
+            except Exception as e:
+                lines.append(f"    {name}: ERROR - {e}")
+
+    return lines
+
+
 def diagnose_sync_issues():
     """Comprehensive sync diagnosis"""
     config = load_config()
@@ -16,101 +101,22 @@ def diagnose_sync_issues():
     print(f"Node ID: {node_id}")
     print("=" * 60)
 
+    # Check change_log in every database at once
+    results = collect_from_databases(config, lambda conn, pair_name, db_type: diagnose_database(conn, node_id))
+
     for pair in config["sync_pairs"]:
         print(f"\n📋 Analyzing sync pair: {pair['name']}")
 
-        try:
-            local_conn = connect_mysql(pair["local"])
-            cloud_conn = connect_mysql(pair["cloud"])
-
-            # Check change_log in both databases
-            for db_type, conn in [("LOCAL", local_conn), ("CLOUD", cloud_conn)]:
-                print(f"\n--- {db_type} DATABASE ---")
-
-                with conn.cursor() as cur:
-                    # 1. Check if change_log table exists
-                    cur.execute("SHOW TABLES LIKE 'change_log'")
-                    if not cur.fetchone():
-                        print("❌ change_log table doesn't exist!")
-                        continue
-
-                    # 2. Show all changes in change_log
-                    cur.execute("""
-                                SELECT id,
-                                       table_name,
-                                       operation,
-                                       row_pk,
-                                       source_node,
-                                       applied_nodes,
-                                       created_at
-                                FROM change_log
-                                ORDER BY created_at DESC LIMIT 10
-                                """)
-                    changes = cur.fetchall()
-
-                    if not changes:
-                        print("📭 No changes found in change_log")
-                    else:
-                        print(f"📊 Found {len(changes)} recent changes:")
-                        for change in changes:
-                            applied = change.get('applied_nodes', '[]')
-                            print(f"  ID {change['id']}: {change['operation']} on {change['table_name']}")
-                            print(f"    PK: {change['row_pk']}, Source: {change['source_node']}")
-                            print(f"    Applied to: {applied}")
-                            print(f"    Created: {change['created_at']}")
-
-                    # 3. Test the unapplied changes query
-                    print(f"\n🔍 Testing unapplied changes query for node: {node_id}")
-
-                    # Try different query approaches
-                    queries = [
-                        # Original query
-                        ("Original Query", """
-                                           SELECT COUNT(*) as count
-                                           FROM change_log
-                                           WHERE NOT JSON_CONTAINS(applied_nodes
-                                               , %s)
-                                             AND source_node != %s
-                                           """),
-                        # Alternative query 1
-                        ("Alternative 1", """
-                                          SELECT COUNT(*) as count
-                                          FROM change_log
-                                          WHERE applied_nodes NOT LIKE %s
-                                            AND source_node != %s
-                                          """),
-                        # Alternative query 2
-                        ("Alternative 2", """
-                                          SELECT COUNT(*) as count
-                                          FROM change_log
-                                          WHERE JSON_SEARCH(applied_nodes
-                                              , 'one'
-                                              , %s) IS NULL
-                                            AND source_node != %s
-                                          """)
-                    ]
-
-                    for name, query in queries:
-                        try:
-                            if "JSON_CONTAINS" in query:
-                                cur.execute(query, (json.dumps(node_id), node_id))
-                            elif "NOT LIKE" in query:
-                                cur.execute(query, (f'%"{node_id}"%', node_id))
-                            else:
-                                cur.execute(query, (node_id, node_id))
-
-                            result = cur.fetchone()
-                            print(f"    {name}: {result['count']} unapplied changes")
-                        except Exception as e:
-                            print(f"    {name}: ERROR - {e}")
+        for result in results:
+            if result.pair != pair["name"]:
+                continue
 
-            local_conn.close()
-            cloud_conn.close()
-
-        except Exception as e:
-            print(f"❌ Error analyzing {pair['name']}: {e}")
-            import traceback
-            traceback.print_exc()
+            print(f"\n--- {result.db_type.upper()} DATABASE ---")
+            if not result.ok:
+                print(f"❌ Error analyzing {result.label}: {result.error}")
+                continue
+            for line in result.value:
+                print(line)
 
 
 def test_manual_sync():
@@ -0,0 +1,116 @@
+import unittest
+from unittest.mock import patch
+
+from core import binlog_capture
+from core.binlog_capture import build_binlog_change, name_binlog_columns, next_binlog_hlc
+from core.schema import resolve_capture_options
+
+
+class FakeQueryEvent:
+    def __init__(self, query, thread_id=1):
+        self.query = query
+        self.slave_proxy_id = thread_id
+
+
+class FakeXidEvent:
+    pass
+
+
+class FakeRowsEvent:
+    def __init__(self, table, rows, timestamp=1700000000):
+        self.table = table
+        self.rows = rows
+        self.timestamp = timestamp
+
+
+class FakeWriteRowsEvent(FakeRowsEvent):
+    pass
+
+
+class FakeUpdateRowsEvent(FakeRowsEvent):
+    pass
+
+
+class FakeDeleteRowsEvent(FakeRowsEvent):
+    pass
+
+
+class TestBinlogCapture(unittest.TestCase):
+
+    def test_build_binlog_change_honours_delta_and_noop_options(self):
+        row = {"before_values": {"id": 1, "name": "a", "stock": 5},
+               "after_values": {"id": 1, "name": "a", "stock": 4}}
+
+        full = build_binlog_change("UPDATE", "id", row, resolve_capture_options(None, "products"))
+        self.assertEqual(full, ("UPDATE", 1, {"id": 1, "name": "a", "stock": 4}, "full"))
+
+        delta = build_binlog_change("UPDATE", "id", row,
+                                    resolve_capture_options({"update_capture": "delta"}, "products"))
+        self.assertEqual(delta, ("UPDATE", 1, {"id": 1, "stock": 4}, "delta"))
+
+        noop = {"before_values": {"id": 1, "name": "a"}, "after_values": {"id": 1, "name": "a"}}
+        self.assertIsNone(build_binlog_change("UPDATE", "id", noop,
+                                              resolve_capture_options({"skip_noop_updates": True}, "products")))
+
+    def test_next_binlog_hlc_orders_events_within_a_second(self):
+        clock = [1700000000000000, 3]  # floor from an earlier run
+        self.assertEqual(next_binlog_hlc(clock, 1700000000, "n1"), "1700000000000000.000004.n1")
+        self.assertEqual(next_binlog_hlc(clock, 1700000001, "n1"), "1700000001000000.000000.n1")
+
+    def test_name_binlog_columns_maps_positional_keys(self):
+        values = {"UNKNOWN_COL0": 1, "UNKNOWN_COL1": "a"}
+        self.assertEqual(name_binlog_columns(values, ["id", "name"]), {"id": 1, "name": "a"})
+
+    @patch.multiple(binlog_capture, QueryEvent=FakeQueryEvent, XidEvent=FakeXidEvent,
+                    WriteRowsEvent=FakeWriteRowsEvent, UpdateRowsEvent=FakeUpdateRowsEvent,
+                    DeleteRowsEvent=FakeDeleteRowsEvent, create=True)
+    @patch("core.binlog_capture.get_table_columns", return_value=["id", "name"])
+    @patch("core.binlog_capture.get_primary_key_column", return_value="id")
+    @patch("core.binlog_capture.get_table_list", return_value=["users"])
+    @patch("core.binlog_capture.load_binlog_clock", return_value=[0, 0])
+    @patch("core.binlog_capture.load_binlog_checkpoint", return_value=("binlog.000001", 4))
+    @patch("core.binlog_capture.connect_mysql")
+    @patch("core.binlog_capture.BinLogStreamReader")
+    def test_capture_skips_agent_transactions_and_checkpoints_after_commit(
+            self, mock_reader, mock_connect, mock_checkpoint, mock_clock, mock_tables, mock_pk, mock_columns):
+        conn = mock_connect.return_value
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = {"server_started": 1700000000}
+        cursor.fetchall.return_value = [
+            {"connection_id": 7, "origin_node": "cloud-node", "server_started": 1700000001},
+            # left behind by an agent session before a server restart; id 9 is now an application session
+            {"connection_id": 9, "origin_node": "cloud-node", "server_started": 1690000000},
+        ]
+        flushed = []
+        cursor.executemany.side_effect = lambda sql, rows: flushed.extend(rows)
+
+        stream = mock_reader.return_value
+        stream.log_file, stream.log_pos = "binlog.000001", 900
+        stream.__iter__.return_value = iter([
+            FakeQueryEvent("BEGIN", thread_id=3),
+            FakeWriteRowsEvent("users", [{"values": {"id": 1, "name": "app write"}}]),
+            FakeXidEvent(),
+            FakeQueryEvent("BEGIN", thread_id=7),
+            FakeWriteRowsEvent("users", [{"values": {"id": 2, "name": "agent write"}}]),
+            FakeXidEvent(),
+            FakeQueryEvent("BEGIN", thread_id=9),
+            FakeWriteRowsEvent("users", [{"values": {"id": 4, "name": "app write after restart"}}]),
+            FakeXidEvent(),
+            FakeQueryEvent("BEGIN", thread_id=3),
+            FakeWriteRowsEvent("users", [{"values": {"id": 3, "name": "uncommitted"}}]),
+        ])
+
+        written = binlog_capture.capture_binlog_changes({"db": "app", "host": "h", "user": "u", "password": "p"},
+                                                        "local-node", capture={"hlc": True})
+
+        self.assertEqual(written, 2)
+        self.assertEqual([(r[0], r[1], r[2], r[4]) for r in flushed],
+                         [("users", "INSERT", "1", "local-node"), ("users", "INSERT", "4", "local-node")])
+        stale_deletes = [c[0][1] for c in cursor.execute.call_args_list
+                         if c[0][0].startswith("DELETE FROM `sync_agent_session`")]
+        self.assertEqual(stale_deletes, [[9]])
+        self.assertEqual(flushed[0][-1], "1700000000000000.000000.local-node")
+        checkpoint_params = [c[0][1] for c in cursor.execute.call_args_list
+                             if "binlog_checkpoint" in c[0][0] and "INSERT" in c[0][0]]
+        self.assertEqual(checkpoint_params, [("local-node", "binlog.000001", 900)])
+        conn.commit.assert_called_once()
@@ -0,0 +1,64 @@
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from core.collector import CollectResult, collect_from_databases, merge_sorted
+
+
+def make_config(*names):
+    return {"sync_pairs": [{"name": name, "local": {"host": f"{name}-local"}, "cloud": {"host": f"{name}-cloud"}}
+                           for name in names]}
+
+
+class TestCollector(unittest.TestCase):
+
+    @patch("core.collector.connect_mysql")
+    def test_databases_are_queried_concurrently_in_config_order(self, mock_connect):
+        mock_connect.side_effect = lambda db_config, **options: MagicMock(host=db_config["host"])
+        barrier = threading.Barrier(4, timeout=2)
+
+        def query(conn, pair_name, db_type):
+            barrier.wait()  # only passes if all four databases are being queried at once
+            return conn.host
+
+        results = collect_from_databases(make_config("shop1", "shop2"), query, max_workers=4)
+
+        self.assertEqual([r.value for r in results], ["shop1-local", "shop1-cloud", "shop2-local", "shop2-cloud"])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual(mock_connect.call_args[1]["read_timeout"], 30)
+
+    @patch("core.collector.connect_mysql")
+    def test_failed_and_slow_hosts_give_partial_results(self, mock_connect):
+        release = threading.Event()
+
+        def connect(db_config, **options):
+            if db_config["host"] == "shop1-cloud":
+                raise ConnectionError("host unreachable")
+            if db_config["host"] == "shop2-local":
+                release.wait(5)  # a host that hangs past the deadline
+            return MagicMock()
+
+        mock_connect.side_effect = connect
+        try:
+            results = collect_from_databases(make_config("shop1", "shop2"), lambda conn, pair, db: "ok",
+                                             timeout=0.2)
+        finally:
+            release.set()
+
+        by_label = {r.label: r for r in results}
+        self.assertEqual(by_label["shop1.local"].value, "ok")
+        self.assertEqual(by_label["shop1.cloud"].error, "host unreachable")
+        self.assertIn("timed out", by_label["shop2.local"].error)
+        self.assertEqual(by_label["shop2.cloud"].value, "ok")
+
+    def test_merge_sorted_combines_per_database_orderings(self):
+        results = [
+            CollectResult("shop1", "local", [{"t": datetime(2024, 1, 5)}, {"t": datetime(2024, 1, 2)}]),
+            CollectResult("shop1", "cloud", error="timed out"),
+            CollectResult("shop2", "local", [{"t": datetime(2024, 1, 4)}, {"t": datetime(2024, 1, 1)}]),
+        ]
+
+        merged = merge_sorted(results, key=lambda row: row["t"], reverse=True, limit=3)
+
+        self.assertEqual([row["t"].day for row in merged], [5, 4, 2])
@@ -0,0 +1,47 @@
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from core.comparator import TableComparator, get_table_comparator
+from core.schema import TableMeta
+
+
+class TestComparator(unittest.TestCase):
+
+    def setUp(self):
+        self.comparator = TableComparator("products", {
+            "id": "int", "price": "decimal", "updated_at": "datetime", "attrs": "json",
+            "open_at": "time", "name": "varchar",
+        })
+
+    def test_equal_values_of_different_wire_types_do_not_conflict(self):
+        source = {"id": 1, "price": 19.5, "updated_at": "2024-03-01 08:15:00.000000",
+                  "attrs": {"b": 2, "a": 1}, "open_at": "09:30:00", "name": "Lamp"}
+        target = {"id": 1, "price": Decimal("19.50"), "updated_at": datetime(2024, 3, 1, 8, 15),
+                  "attrs": '{"a": 1, "b": 2}', "open_at": timedelta(hours=9, minutes=30), "name": "Lamp"}
+
+        self.assertEqual(self.comparator.diff(source, target), [])
+
+    def test_only_carried_columns_are_compared(self):
+        source = {"id": 1, "price": "21.00"}
+        target = {"id": 1, "price": Decimal("19.50"), "name": "something else"}
+
+        self.assertEqual(self.comparator.diff(source, target),
+                         [{"field": "price", "source_value": "21.00", "target_value": Decimal("19.50")}])
+
+    def test_unparseable_values_fall_back_to_text(self):
+        self.assertEqual(self.comparator.normalize("price", "n/a"), "n/a")
+        self.assertIsNone(self.comparator.normalize("price", None))
+
+    @patch("core.comparator.get_table_meta")
+    def test_comparator_is_recompiled_when_schema_metadata_changes(self, mock_meta):
+        conn = MagicMock()
+        first = TableMeta("products", ["id"], ["id"], {"id": "int"})
+        mock_meta.return_value = first
+
+        comparator = get_table_comparator(conn, "app", "products")
+        self.assertIs(get_table_comparator(conn, "app", "products"), comparator)
+
+        mock_meta.return_value = TableMeta("products", ["id"], ["id", "sku"], {"id": "int", "sku": "varchar"})
+        self.assertIsNot(get_table_comparator(conn, "app", "products"), comparator)
@@ -56,6 +56,18 @@ class TestLoadConfig(unittest.TestCase):
         self.assertEqual(config["sync_interval_minutes"], 5)
         self.assertIsInstance(config["sync_pairs"], list)
 
+    @patch("core.config.importlib.util.find_spec", return_value=None)
+    @patch("core.config.os.path.exists", return_value=True)
+    @patch("core.config.open", new_callable=mock_open)
+    def test_binlog_capture_without_mysql_replication_is_rejected(self, mock_open_fn, mock_exists, mock_find_spec):
+        config = dict(self.base_config, node_id="abc-123")
+        config["sync_pairs"][0]["capture"] = {"mode": "binlog"}
+        mock_open_fn.return_value.read.return_value = json.dumps(config)
+
+        with self.assertRaisesRegex(ValueError, "mysql-replication"):
+            load_config()
+        mock_find_spec.assert_called_once_with("pymysqlreplication")
+
     @patch("core.config.os.path.exists", return_value=True)
     @patch("core.config.open", new_callable=mock_open, read_data="{ invalid json }")
     def test_invalid_json_raises_exception(self, mock_open_fn, mock_exists):
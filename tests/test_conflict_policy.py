@@ -0,0 +1,110 @@
+import unittest
+
+from core.conflict_policy import ConflictPolicy, compile_conflict_policy
+
+POLICY = {
+    "default": "timestamp_wins",
+    "tables": {
+        "products": {"columns": {"price": "source_wins", "stock": "target_wins"}},
+        "notes": {"default": "manual"},
+    },
+}
+
+
+def field_conflict(*fields, target_edited=None):
+    conflict = {"type": "field_conflict",
+                "conflicts": [{"field": f, "source_value": 1, "target_value": 2} for f in fields]}
+    if target_edited is not None:
+        conflict["target_edited"] = target_edited
+    return conflict
+
+
+class TestConflictPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = compile_conflict_policy(POLICY)
+        self.change = {"id": 1, "table_name": "products", "row_pk": "7",
+                       "row_data": '{"id": 7, "price": 10, "stock": 3, "name": "Lamp"}'}
+
+    def test_plain_strategy_name_still_compiles(self):
+        policy = compile_conflict_policy("merge_fields")
+        self.assertIsInstance(policy, ConflictPolicy)
+        self.assertTrue(policy.needs_field_values)
+        self.assertFalse(compile_conflict_policy(None).needs_field_values)
+
+    def test_hyphenated_strategy_names_are_accepted(self):
+        self.assertEqual(compile_conflict_policy("timestamp-wins").default.name, "timestamp_wins")
+        policy = compile_conflict_policy({"tables": {"products": {"columns": {"price": "source-wins"}}}})
+        self.assertEqual(policy.strategy_for("products", "price").name, "source_wins")
+
+    def test_columns_are_decided_by_their_own_strategy(self):
+        decision = self.policy.resolve(self.change, field_conflict("price", "stock"), "id")
+
+        self.assertTrue(decision.apply)
+        self.assertTrue(decision.partial)
+        self.assertEqual(decision.row, {"id": 7, "price": 10, "name": "Lamp"})
+        self.assertEqual(decision.kept_target, ("stock",))
+        self.assertEqual(decision.resolution, "column_policy")
+
+    def test_target_winning_every_conflicting_column_skips_the_change(self):
+        decision = self.policy.resolve(self.change, field_conflict("stock"), "id")
+
+        self.assertFalse(decision.apply)
+        self.assertEqual(decision.resolution, "target_wins")
+
+    def test_timestamp_default_applies_to_other_tables(self):
+        change = {"id": 2, "table_name": "users", "row_pk": "1", "row_data": '{"id": 1, "name": "a"}'}
+        older = {"type": "timestamp_conflict", "source_time": "2024-01-01", "target_time": "2024-02-01"}
+
+        decision = self.policy.resolve(change, older, "id")
+
+        self.assertFalse(decision.apply)
+        self.assertEqual(decision.resolution, "timestamp_wins_target")
+
+    def test_manual_table_only_logs(self):
+        change = {"id": 3, "table_name": "notes", "row_pk": "1", "row_data": '{"id": 1, "body": "x"}'}
+
+        decisions = self.policy.resolve_batch([(change, field_conflict("body"), "id")])
+
+        self.assertFalse(decisions[3].apply)
+        self.assertEqual(decisions[3].resolution, "manual")
+
+    def test_merge_fields_applies_safe_fields_and_keeps_conflicting_ones(self):
+        decision = compile_conflict_policy("merge_fields").resolve(
+            self.change, field_conflict("price", target_edited=True), "id")
+
+        self.assertTrue(decision.apply)
+        self.assertTrue(decision.partial)
+        self.assertEqual(decision.row, {"id": 7, "stock": 3, "name": "Lamp"})
+        self.assertEqual(decision.resolution, "merge_fields")
+
+    def test_merge_fields_applies_uncontested_updates(self):
+        # The fields differ only because the source changed them: no target edit to protect
+        decision = compile_conflict_policy("merge_fields").resolve(
+            self.change, field_conflict("name", target_edited=False), "id")
+
+        self.assertTrue(decision.apply)
+        self.assertFalse(decision.partial)
+        self.assertEqual(decision.row, {"id": 7, "price": 10, "stock": 3, "name": "Lamp"})
+        self.assertEqual(decision.kept_target, ())
+
+    def test_merge_fields_applies_timestamp_only_conflicts(self):
+        newer_target = {"type": "timestamp_conflict", "source_time": "2024-01-01", "target_time": "2024-02-01"}
+
+        decision = compile_conflict_policy("merge_fields").resolve(self.change, newer_target, "id")
+
+        self.assertTrue(decision.apply)
+        self.assertFalse(decision.partial)
+        self.assertEqual(decision.row, {"id": 7, "price": 10, "stock": 3, "name": "Lamp"})
+        self.assertEqual(decision.resolution, "merge_fields")
+
+    def test_merge_fields_without_safe_fields_skips(self):
+        decision = compile_conflict_policy("merge_fields").resolve(
+            self.change, field_conflict("price", "stock", "name", target_edited=True), "id")
+
+        self.assertFalse(decision.apply)
+        self.assertEqual(decision.resolution, "merge_no_safe_fields")
+
+    def test_unknown_strategy_is_rejected(self):
+        with self.assertRaises(ValueError):
+            compile_conflict_policy({"tables": {"products": {"columns": {"price": "newest"}}}})
@@ -0,0 +1,97 @@
+import gzip
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from core.retention import (ChangeLogArchive, apply_conflict_log_retention, get_purge_horizons,
+                            maintain_change_log_partitions, purge_acknowledged_changes, purge_old_conflicts,
+                            resolve_retention_options)
+
+
+class TestRetention(unittest.TestCase):
+
+    def test_get_purge_horizons_requires_every_target(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = [
+            {"table_name": "users", "horizon": 120, "targets": 2},
+            {"table_name": "orders", "horizon": 80, "targets": 1},  # one target has no cursor yet
+        ]
+
+        horizons = get_purge_horizons(mock_conn, "local-node", ["cloud-node", "backup-node"])
+
+        self.assertEqual(horizons, {"users": 120})
+        self.assertEqual(mock_cursor.execute.call_args[0][1], ["local-node", "cloud-node", "backup-node"])
+
+    @patch("core.retention.time.sleep")
+    def test_purge_deletes_in_chunks_until_drained(self, mock_sleep):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.execute.side_effect = [2, 2, 1]  # rows deleted per chunk
+        options = resolve_retention_options({"enabled": True, "chunk_size": 2})
+
+        purged = purge_acknowledged_changes(mock_conn, {"users": 500}, options)
+
+        self.assertEqual(purged, 5)
+        sql, args = mock_cursor.execute.call_args_list[0][0]
+        self.assertIn("ORDER BY id LIMIT %s", sql)
+        self.assertEqual(args, ["users", 500, 24, 2])
+
+    def test_purge_archives_rows_before_deleting(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.side_effect = [[{"id": 1, "table_name": "users", "created_at": datetime(2024, 1, 1)}], []]
+        options = resolve_retention_options({"enabled": True})
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            archive = ChangeLogArchive(archive_dir, "app")
+            purged = purge_acknowledged_changes(mock_conn, {"users": 10}, options, archive)
+            archive.close()
+
+            with gzip.open(archive.path, "rt", encoding="utf-8") as f:
+                archived = [json.loads(line) for line in f]
+
+        self.assertEqual(purged, 1)
+        self.assertEqual(archived, [{"id": 1, "table_name": "users", "created_at": "2024-01-01 00:00:00"}])
+        self.assertIn("DELETE FROM change_log WHERE id IN (%s)", mock_cursor.execute.call_args_list[-1][0][0])
+
+    def test_partitions_are_dropped_only_when_acknowledged(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.side_effect = [
+            [{"name": "p20240101"}, {"name": "p20240102"}, {"name": "p20240110"}, {"name": "p_future"}],
+            [{"table_name": "users", "max_id": 50}],  # p20240101: acknowledged
+            [{"table_name": "users", "max_id": 150}],  # p20240102: not yet
+        ]
+        options = resolve_retention_options({"enabled": True})
+
+        dropped = maintain_change_log_partitions(mock_conn, {"users": 100}, options, now=datetime(2024, 1, 5, 12))
+
+        self.assertEqual(dropped, 1)
+        executed = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        self.assertIn("ALTER TABLE change_log DROP PARTITION p20240101", executed)
+        self.assertFalse(any("DROP PARTITION p20240102" in sql for sql in executed))
+        self.assertTrue(any("REORGANIZE PARTITION p_future" in sql and "p20240112" in sql for sql in executed))
+
+    @patch("core.retention.time.sleep")
+    def test_old_conflicts_are_purged_but_manual_ones_kept(self, mock_sleep):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.execute.side_effect = [2, 0]
+        options = resolve_retention_options({"enabled": True, "chunk_size": 2, "conflict_log_days": 30})
+
+        purged = purge_old_conflicts(mock_conn, options)
+
+        self.assertEqual(purged, 2)
+        sql, args = mock_cursor.execute.call_args_list[0][0]
+        self.assertIn("DELETE FROM `conflict_log`", sql)
+        self.assertIn("resolution <> 'manual'", sql)
+        self.assertEqual(args, (30, 2))
+
+    def test_conflict_log_retention_is_off_without_days(self):
+        mock_conn = MagicMock()
+
+        self.assertEqual(apply_conflict_log_retention(mock_conn, {"enabled": True}), 0)
+        mock_conn.cursor.assert_not_called()
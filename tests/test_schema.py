@@ -1,6 +1,8 @@
 import unittest
-from unittest.mock import MagicMock, call
-from core.schema import ensure_change_log_table, setup_triggers
+from unittest.mock import MagicMock, call, patch
+from core.schema import (ensure_change_log_table, setup_triggers, get_table_meta, invalidate_table_meta,
+                         migrate_applied_nodes_to_cursors, build_trigger_sql, resolve_capture_options,
+                         trigger_fingerprint, columns_version, format_hlc, ensure_conflict_log_table)
 
 class TestSchema(unittest.TestCase):
 
@@ -20,6 +22,23 @@ class TestSchema(unittest.TestCase):
         assert any("CREATE TABLE IF NOT EXISTS `change_log`" in sql for sql in executed_sqls)
         assert any("SELECT COLUMN_NAME" in sql for sql in executed_sqls)
         assert any("ALTER TABLE change_log" in sql for sql in executed_sqls)
+        assert any("CREATE TABLE IF NOT EXISTS `sync_cursor`" in sql for sql in executed_sqls)
+
+    def test_ensure_conflict_log_table_backfills_new_stats_rollup_once(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = None  # conflict_stats does not exist yet
+        mock_cursor.execute.return_value = 0
+
+        ensure_conflict_log_table(mock_conn)
+        ensure_conflict_log_table(mock_conn)
+
+        executed = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        self.assertEqual(sum("CREATE TABLE IF NOT EXISTS `conflict_stats`" in sql for sql in executed), 1)
+        backfill = [sql for sql in executed if "INSERT INTO `conflict_stats`" in sql]
+        self.assertEqual(len(backfill), 1)
+        self.assertIn("FROM `conflict_log`", backfill[0])
+        self.assertIn("MAKETIME(HOUR(resolved_at), 0, 0)", backfill[0])
 
     def test_setup_triggers_skips_tables_with_no_pk(self):
         # Setup mock connection
@@ -32,7 +51,182 @@ class TestSchema(unittest.TestCase):
         schema.get_primary_key_column = lambda conn, db, table: None  # Simulate missing PK
         schema.get_table_columns = lambda conn, db, table: ["id", "name"]
 
+        mock_cursor.fetchall.return_value = []
+
         setup_triggers(mock_conn, "test_db", ["products"], "node-123")
 
-        # If no primary key, no trigger SQL should be executed
+        # If no primary key, no trigger should be created
+        executed = [args[0] for args, _ in mock_cursor.execute.call_args_list]
+        assert not any("CREATE TRIGGER" in sql for sql in executed)
+
+    def test_build_trigger_sql_delta_update_records_changed_columns_only(self):
+        capture = resolve_capture_options({"update_capture": "delta", "tables": {"logs": {"update_capture": "full"}}},
+                                          "products")
+        sql = build_trigger_sql("products", "UPDATE", "id", ["id", "name", "stock"], "node-123", capture)
+
+        assert "NOT (OLD.`name` <=> NEW.`name`)" in sql
+        assert "JSON_SET(row_delta, '$.\"stock\"', NEW.`stock`)" in sql
+        assert "NOT (OLD.`id` <=> NEW.`id`)" in sql  # PK change falls back to a full row
+        assert "row_format" in sql
+
+        # Per-table override and the other operations keep the full row image
+        self.assertEqual(resolve_capture_options({"update_capture": "delta",
+                                                  "tables": {"logs": {"update_capture": "full"}}},
+                                                 "logs")["update_capture"], "full")
+        insert_sql = build_trigger_sql("products", "INSERT", "id", ["id", "name"], "node-123", capture)
+        assert "JSON_OBJECT('id', NEW.`id`, 'name', NEW.`name`)" in insert_sql
+        assert "row_delta" not in insert_sql
+
+    def test_build_trigger_sql_skips_noop_updates_when_enabled(self):
+        capture = resolve_capture_options({"skip_noop_updates": True}, "products")
+        sql = build_trigger_sql("products", "UPDATE", "id", ["id", "name"], "node-123", capture)
+
+        assert "NOT (OLD.`id` <=> NEW.`id` AND OLD.`name` <=> NEW.`name`) THEN" in sql
+        assert "INSERT INTO change_log" in sql
+
+        # Off by default: without HLC versions the plain single-statement trigger is generated
+        plain_sql = build_trigger_sql("products", "UPDATE", "id", ["id", "name"], "node-123",
+                                      resolve_capture_options({"hlc": False}, "products"))
+        assert "<=>" not in plain_sql
+        assert "BEGIN" not in plain_sql
+
+    def test_build_trigger_sql_handles_sync_agent_writes(self):
+        suppressed = build_trigger_sql("products", "INSERT", "id", ["id", "name"], "node-123",
+                                       resolve_capture_options({"hlc": False}, "products"))
+        assert "WHERE @sync_origin_node IS NULL" in suppressed
+
+        tagged = build_trigger_sql("products", "UPDATE", "id", ["id", "name"], "node-123",
+                                   resolve_capture_options({"echo": "tag", "update_capture": "delta"}, "products"))
+        assert "COALESCE(@sync_origin_node, 'node-123')" in tagged
+        assert "@sync_origin_node IS NULL" not in tagged
+
+    def test_build_trigger_sql_stamps_hlc_versions(self):
+        sql = build_trigger_sql("products", "DELETE", "id", ["id", "name"], "node-123",
+                                resolve_capture_options({"hlc": True}, "products"))
+
+        assert "AFTER DELETE ON `products`" in sql
+        assert "FROM `sync_clock` WHERE node_id = 'node-123'" in sql
+        assert "IF @sync_origin_node IS NULL THEN" in sql
+        assert "source_node, hlc)" in sql
+        assert "OLD.`id`, JSON_OBJECT('id', OLD.`id`, 'name', OLD.`name`), 'node-123', @sync_hlc);" in sql
+        assert format_hlc(1700000000123456, 2, "node-123") == "1700000000123456.000002.node-123"
+        assert "row_version" not in sql
+
+        registry_sql = build_trigger_sql("products", "UPDATE", "id", ["id", "name"], "node-123",
+                                         resolve_capture_options({"hlc": True, "row_versions": True}, "products"))
+        assert "VALUES ('products', NEW.`id`, @sync_hlc, 'node-123')" in registry_sql
+        assert "ON DUPLICATE KEY UPDATE version = VALUES(version), node = VALUES(node);" in registry_sql
+
+    @patch("core.schema.get_table_columns", return_value=["id", "name"])
+    @patch("core.schema.get_primary_key_column", return_value="id")
+    @patch("core.schema.get_table_list", return_value=["users", "orders"])
+    def test_setup_triggers_only_redeploys_changed_tables(self, mock_tables, mock_pk, mock_columns):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+
+        capture = resolve_capture_options(None, "users")
+        users_fingerprint = trigger_fingerprint(
+            [build_trigger_sql("users", op, "id", ["id", "name"], "node-123", capture)
+             for op in ("INSERT", "UPDATE", "DELETE")])
+        mock_cursor.fetchall.side_effect = [
+            [{"table_name": "users", "fingerprint": users_fingerprint},
+             {"table_name": "legacy", "fingerprint": "0" * 64}],
+            [{"TRIGGER_NAME": f"trg_users_{op}"} for op in ("insert", "update", "delete")],
+        ]
+
+        setup_triggers(mock_conn, "test_db", "all", "node-123")
+
+        executed = [args[0] for args, _ in mock_cursor.execute.call_args_list]
+        assert not any("trg_users_" in sql for sql in executed)
+        assert sum("CREATE TRIGGER `trg_orders_" in sql for sql in executed) == 3
+        assert "DROP TRIGGER IF EXISTS `trg_legacy_insert`" in executed
+        assert any("DELETE FROM `sync_trigger_state`" in sql for sql in executed)
+
+    @patch("core.schema.get_table_list", return_value=[])
+    def test_setup_triggers_removes_untracked_triggers_when_nothing_is_selected(self, mock_tables):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        # Upgraded database: triggers exist but sync_trigger_state is still empty
+        mock_cursor.fetchall.side_effect = [
+            [],
+            [{"TRIGGER_NAME": f"trg_order_items_{op}"} for op in ("insert", "update", "delete")],
+        ]
+
+        setup_triggers(mock_conn, "test_db", [], "node-123")
+
+        executed = [args[0] for args, _ in mock_cursor.execute.call_args_list]
+        for op in ("insert", "update", "delete"):
+            assert f"DROP TRIGGER IF EXISTS `trg_order_items_{op}`" in executed
+
+    def test_build_trigger_sql_compact_encoding_stores_positional_values(self):
+        capture = resolve_capture_options({"row_encoding": "compact"}, "products")
+        sql = build_trigger_sql("products", "INSERT", "id", ["id", "name"], "node-123", capture)
+
+        assert "JSON_ARRAY(NEW.`id`, NEW.`name`)" in sql
+        assert "JSON_OBJECT" not in sql
+        assert f"'compact', '{columns_version(['id', 'name'])}'" in sql
+        self.assertNotEqual(columns_version(["id", "name"]), columns_version(["name", "id"]))
+
+    def test_get_table_meta_caches_and_reloads_on_ddl_change(self):
+        invalidate_table_meta()
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+
+        mock_cursor.fetchall.return_value = [
+            {"COLUMN_NAME": "id", "DATA_TYPE": "int", "COLUMN_TYPE": "int", "COLUMN_KEY": "PRI", "ORDINAL_POSITION": 1},
+            {"COLUMN_NAME": "name", "DATA_TYPE": "varchar", "COLUMN_TYPE": "varchar(50)", "COLUMN_KEY": "",
+             "ORDINAL_POSITION": 2},
+            {"COLUMN_NAME": "updated_at", "DATA_TYPE": "datetime", "COLUMN_TYPE": "datetime", "COLUMN_KEY": "",
+             "ORDINAL_POSITION": 3},
+        ]
+
+        meta = get_table_meta(mock_conn, "test_db", "products")
+        self.assertEqual(meta.pk_column, "id")
+        self.assertEqual(meta.columns, ["id", "name", "updated_at"])
+        self.assertEqual(meta.timestamp_column, "updated_at")
+
+        # Fresh entries are served without touching the database
+        mock_cursor.execute.reset_mock()
+        self.assertIs(get_table_meta(mock_conn, "test_db", "products"), meta)
         mock_cursor.execute.assert_not_called()
+
+        # Unchanged signature: only the column check runs
+        self.assertIs(get_table_meta(mock_conn, "test_db", "products", max_age=0), meta)
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+
+        # A type change with the same column count is noticed
+        rows = [dict(row) for row in mock_cursor.fetchall.return_value]
+        rows[1].update(DATA_TYPE="text", COLUMN_TYPE="text")
+        mock_cursor.fetchall.return_value = rows
+        retyped = get_table_meta(mock_conn, "test_db", "products", max_age=0)
+        self.assertIsNot(retyped, meta)
+        self.assertEqual(retyped.column_types["name"], "text")
+
+        # So is an instant rename
+        rows = [dict(row) for row in rows]
+        rows[2]["COLUMN_NAME"] = "modified_at"
+        mock_cursor.fetchall.return_value = rows
+        renamed = get_table_meta(mock_conn, "test_db", "products", max_age=0)
+        self.assertEqual(renamed.columns, ["id", "name", "modified_at"])
+        self.assertEqual(renamed.timestamp_column, "modified_at")
+
+        invalidate_table_meta(mock_conn, "test_db", "products")
+        mock_cursor.execute.reset_mock()
+        get_table_meta(mock_conn, "test_db", "products")
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+
+    def test_migrate_applied_nodes_to_cursors_derives_per_table_cursors(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+
+        mock_cursor.fetchall.return_value = [{"table_name": "orders", "last_change_id": 41}]
+
+        migrate_applied_nodes_to_cursors(mock_conn, "local-node", "cloud-node", ["orders"])
+
+        (scan_sql, scan_args), (insert_sql, insert_args) = [c[0] for c in mock_cursor.execute.call_args_list]
+        self.assertIn("GROUP BY table_name", scan_sql)
+        # Only tables without a cursor are scanned
+        self.assertIn("table_name NOT IN (SELECT table_name", scan_sql)
+        self.assertEqual(scan_args, ["cloud-node", "local-node", "cloud-node", "orders"])
+        self.assertIn("INSERT IGNORE INTO sync_cursor", insert_sql)
+        self.assertEqual(insert_args, ["local-node", "cloud-node", "orders", 41])
@@ -1,7 +1,15 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
-from core.sync_engine import fetch_unapplied_changes, mark_change_as_applied
+from core.comparator import TableComparator
+
+from core.sync_engine import (fetch_unapplied_changes, mark_change_as_applied, apply_changes_batched,
+                              coalesce_changes, mark_changes_as_applied,
+                              fetch_changes_after, safe_cursor_position,
+                              sync_changes_with_conflict_resolution, process_change_batch,
+                              resolve_sync_options, iter_change_pages, decode_compact_changes,
+                              fetch_row_versions, fetch_locally_modified_keys, buffer_conflict_log, log_conflict,
+                              settled_changes_filter)
 
 class TestSyncEngine(unittest.TestCase):
 
@@ -36,3 +44,668 @@ class TestSyncEngine(unittest.TestCase):
         sql = mock_cursor.execute.call_args[0][0]
         self.assertIn("UPDATE change_log", sql)
         self.assertIn("JSON_ARRAY_APPEND", sql)
+
+    @patch("core.sync_engine.prefetch_target_snapshot",
+           return_value={"users": {"pk_col": "id", "timestamp_col": None, "rows": {}}})
+    def test_apply_changes_batched_groups_rows_into_one_upsert(self, mock_snapshot):
+        mock_conn = MagicMock()
+        mock_conn.db = b"target_db"
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+
+        changes = [
+            {"id": i, "table_name": "users", "operation": "INSERT", "row_pk": str(i),
+             "row_data": f'{{"id": {i}, "name": "user{i}"}}'}
+            for i in range(1, 4)
+        ]
+
+        applied_ids, stats = apply_changes_batched(mock_conn, changes, max_rows=2)
+
+        self.assertEqual(applied_ids, [1, 2, 3])
+        self.assertEqual(stats["statements"], 2)
+        first_sql, first_params = mock_cursor.execute.call_args_list[0][0]
+        self.assertIn("ON DUPLICATE KEY UPDATE", first_sql)
+        self.assertEqual(first_params, [1, "user1", 2, "user2"])
+
+    @patch("core.sync_engine.prefetch_target_snapshot",
+           return_value={"users": {"pk_col": "id", "timestamp_col": None,
+                                   "rows": {"1": {"id": 1, "name": "a", "email": "a@x"},
+                                            "2": {"id": 2, "name": "b", "email": "b@x"}}}})
+    def test_apply_changes_batched_writes_delta_updates_as_partial_update(self, mock_snapshot):
+        mock_conn = MagicMock()
+        mock_conn.db = b"target_db"
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+
+        changes = [
+            {"id": i, "table_name": "users", "operation": "UPDATE", "row_pk": str(i), "row_format": "delta",
+             "row_data": f'{{"id": {i}, "name": "new{i}"}}'}
+            for i in (1, 2)
+        ]
+
+        mock_cursor.rowcount = 1
+
+        applied_ids, stats = apply_changes_batched(mock_conn, changes)
+
+        self.assertEqual(applied_ids, [1, 2])
+        # pymysql runs UPDATEs one round trip per row, and that is what gets counted
+        self.assertEqual(stats["statements"], 2)
+        calls = [c[0] for c in mock_cursor.execute.call_args_list if c[0][0].startswith("UPDATE")]
+        self.assertEqual(calls, [("UPDATE `users` SET `name`=%s WHERE `id` = %s", ["new1", "1"]),
+                                 ("UPDATE `users` SET `name`=%s WHERE `id` = %s", ["new2", "2"])])
+
+    @patch("core.sync_engine.log_conflict")
+    @patch("core.sync_engine.prefetch_target_snapshot",
+           return_value={"users": {"pk_col": "id", "timestamp_col": None, "rows": {}}})
+    def test_delta_update_of_a_missing_row_is_skipped_not_inserted(self, mock_snapshot, mock_log):
+        mock_conn = MagicMock()
+        mock_conn.db = b"target_db"
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.rowcount = 0  # the UPDATE matched nothing
+        mock_cursor.fetchone.return_value = None  # and the row does not exist
+
+        changes = [{"id": 1, "table_name": "users", "operation": "UPDATE", "row_pk": "7", "row_format": "delta",
+                    "row_data": '{"id": 7, "name": "new"}'}]
+
+        applied_ids, stats = apply_changes_batched(mock_conn, changes)
+
+        self.assertEqual(applied_ids, [1])
+        self.assertEqual(stats["statements"], 2)
+        executed = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        self.assertFalse(any("INSERT INTO `users`" in sql for sql in executed))
+        self.assertEqual(mock_log.call_args[0][2]["type"], "missing_row")
+        self.assertEqual(mock_log.call_args[0][3], "skipped_missing_row")
+
+    @patch("core.sync_engine.log_conflict")
+    @patch("core.sync_engine.prefetch_target_snapshot",
+           return_value={"products": {"pk_col": "id", "timestamp_col": None,
+                                      "rows": {"1": {"id": 1, "price": 5, "stock": 9}}}})
+    def test_merged_update_of_a_row_deleted_meanwhile_upserts_the_full_row(self, mock_snapshot, mock_log):
+        mock_conn = MagicMock()
+        mock_conn.db = b"target_db"
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.rowcount = 0
+        mock_cursor.fetchone.return_value = None
+        policy = {"tables": {"products": {"columns": {"price": "source_wins", "stock": "target_wins"}}}}
+
+        changes = [{"id": 1, "table_name": "products", "operation": "UPDATE", "row_pk": "1",
+                    "row_data": '{"id": 1, "price": 10, "stock": 0}'}]
+
+        applied_ids, stats = apply_changes_batched(mock_conn, changes, policy)
+
+        self.assertEqual(applied_ids, [1])
+        sql, params = mock_cursor.execute.call_args[0]
+        self.assertIn("ON DUPLICATE KEY UPDATE", sql)
+        self.assertEqual(params, [1, 10, 0])
+
+    @patch("core.sync_engine.log_conflict")
+    @patch("core.sync_engine.prefetch_target_snapshot",
+           return_value={"products": {"pk_col": "id", "timestamp_col": None,
+                                      "rows": {"1": {"id": 1, "price": 5, "stock": 9},
+                                               "2": {"id": 2, "price": 6, "stock": 4}}}})
+    def test_apply_changes_batched_writes_policy_merged_rows_in_bulk(self, mock_snapshot, mock_log):
+        mock_conn = MagicMock()
+        mock_conn.db = b"target_db"
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        policy = {"tables": {"products": {"columns": {"price": "source_wins", "stock": "target_wins"}}}}
+
+        changes = [
+            {"id": i, "table_name": "products", "operation": "UPDATE", "row_pk": str(i),
+             "row_data": f'{{"id": {i}, "price": {i * 10}, "stock": 0}}'}
+            for i in (1, 2)
+        ]
+
+        mock_cursor.rowcount = 1
+
+        applied_ids, stats = apply_changes_batched(mock_conn, changes, policy)
+
+        self.assertEqual(applied_ids, [1, 2])
+        self.assertEqual(stats["conflicts"], 2)
+        self.assertEqual(stats["statements"], 2)
+        self.assertEqual(mock_log.call_args[0][3], "column_policy")
+        calls = [c[0] for c in mock_cursor.execute.call_args_list]
+        self.assertEqual(calls, [("UPDATE `products` SET `price`=%s WHERE `id` = %s", [10, "1"]),
+                                 ("UPDATE `products` SET `price`=%s WHERE `id` = %s", [20, "2"])])
+
+    @patch("core.sync_engine.log_conflict")
+    @patch("core.sync_engine.prefetch_target_snapshot",
+           return_value={"users": {"pk_col": "id", "timestamp_col": None,
+                                   "comparator": TableComparator("users", {"id": "int", "name": "varchar"}),
+                                   "rows": {"1": {"id": 1, "name": "old", "email": "a@x"},
+                                            "2": {"id": 2, "name": "mine", "email": "b@x"}}}})
+    def test_merge_fields_propagates_updates_without_a_target_edit(self, mock_snapshot, mock_log):
+        mock_conn = MagicMock()
+        mock_conn.db = b"target_db"
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        changes = [
+            {"id": i, "table_name": "users", "operation": "UPDATE", "row_pk": str(i),
+             "row_data": f'{{"id": {i}, "name": "new", "email": "{e}"}}'}
+            for i, e in ((1, "a@x"), (2, "b@x"))
+        ]
+
+        # Only row 2 has an unsynced edit on the target
+        applied_ids, stats = apply_changes_batched(mock_conn, changes, "merge_fields",
+                                                   target_edits={("users", "2")})
+
+        self.assertEqual(applied_ids, [1, 2])
+        self.assertEqual(stats["conflicts"], 2)
+        calls = [c[0] for c in mock_cursor.execute.call_args_list]
+        self.assertIn("ON DUPLICATE KEY UPDATE", calls[0][0])
+        self.assertEqual(calls[0][1], [1, "new", "a@x"])
+        # The target's own edit of row 2's name is kept
+        self.assertEqual(calls[1], ("UPDATE `users` SET `email`=%s WHERE `id` = %s", ["b@x", "2"]))
+
+    @patch("core.sync_engine.log_conflict")
+    @patch("core.sync_engine.get_timestamp_column", return_value=None)
+    @patch("core.sync_engine.get_primary_key_column", return_value="id")
+    @patch("core.sync_engine.get_table_comparator",
+           return_value=TableComparator("users", {"id": "int", "name": "varchar"}))
+    def test_hlc_detection_compares_versions_without_reading_target_rows(self, mock_comparator, mock_pk, mock_ts, mock_log):
+        mock_conn = MagicMock()
+        mock_conn.db = b"target_db"
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = [{"row_pk": "1", "hlc": "1700000000000500.000000.cloud-node"}]
+
+        changes = [
+            {"id": 10, "table_name": "users", "operation": "UPDATE", "row_pk": "1",
+             "row_data": '{"id": 1, "name": "older"}', "hlc": "1700000000000100.000000.local-node"},
+            {"id": 11, "table_name": "users", "operation": "UPDATE", "row_pk": "2",
+             "row_data": '{"id": 2, "name": "newer"}', "hlc": "1700000000000200.000000.local-node"},
+        ]
+
+        versions = fetch_row_versions(mock_conn, "cloud-node", changes)
+        applied_ids, stats = apply_changes_batched(mock_conn, changes, "timestamp_wins", versions=versions)
+
+        self.assertEqual(applied_ids, [11])
+        self.assertEqual(stats["conflicts"], 1)
+        self.assertEqual(mock_log.call_args[0][2]["type"], "version_conflict")
+        self.assertEqual(mock_log.call_args[0][3], "timestamp_wins_target")
+        executed = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        self.assertFalse(any("SELECT * FROM `users`" in sql for sql in executed))
+        self.assertEqual(versions[("users", "2")], "1700000000000200.000000.local-node")
+
+    @patch("core.sync_engine.get_timestamp_column", return_value=None)
+    @patch("core.sync_engine.get_primary_key_column", return_value="id")
+    @patch("core.sync_engine.get_table_comparator",
+           return_value=TableComparator("users", {"id": "int", "name": "varchar"}))
+    def test_change_log_detection_only_checks_rows_with_unsynced_target_edits(self, mock_comparator, mock_pk, mock_ts):
+        mock_conn = MagicMock()
+        mock_conn.db = b"target_db"
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.side_effect = [
+            [{"table_name": "users", "row_pk": "2"}],  # pending target edits
+            [{"id": 2, "name": "Bob"}],  # target row for the key that needs a check
+        ]
+        changes = [
+            {"id": i, "table_name": "users", "operation": "UPDATE", "row_pk": str(i),
+             "row_data": f'{{"id": {i}, "name": "new{i}"}}'}
+            for i in (1, 2)
+        ]
+
+        local_edits = fetch_locally_modified_keys(mock_conn, "cloud-node", "local-node", changes)
+        applied_ids, stats = apply_changes_batched(mock_conn, changes, "source_wins", local_edits=local_edits)
+
+        pending_sql, pending_args = mock_cursor.execute.call_args_list[0][0]
+        self.assertIn("(c.table_name, c.row_pk) IN ((%s, %s), (%s, %s))", pending_sql)
+        self.assertEqual(pending_args, ["local-node", "users", "1", "users", "2", "cloud-node"])
+        row_sql, row_args = mock_cursor.execute.call_args_list[1][0]
+        self.assertIn("SELECT * FROM `users` WHERE `id` IN (%s)", row_sql)
+        self.assertEqual(row_args, ["2"])
+        self.assertEqual(stats["conflicts"], 1)
+        self.assertEqual(applied_ids, [1, 2])
+
+    @patch("core.sync_engine.get_timestamp_column", return_value=None)
+    @patch("core.sync_engine.get_primary_key_column", return_value="id")
+    @patch("core.sync_engine.get_table_comparator",
+           return_value=TableComparator("users", {"id": "int", "name": "varchar"}))
+    @patch("core.sync_engine.acknowledge_batch", return_value=3)
+    @patch("core.sync_engine.report_conflict")
+    def test_row_mode_reads_target_rows_with_one_in_query(self, mock_report, mock_ack, mock_comparator,
+                                                           mock_pk, mock_ts):
+        target_conn = MagicMock()
+        target_conn.db = b"target_db"
+        target_cursor = target_conn.cursor.return_value.__enter__.return_value
+        target_cursor.fetchall.return_value = [{"id": 1, "name": "Alice"}, {"id": 2, "name": "Bob"}]
+        changes = [
+            {"id": 10, "table_name": "users", "operation": "UPDATE", "row_pk": "1",
+             "row_data": '{"id": 1, "name": "Alice"}'},
+            {"id": 11, "table_name": "users", "operation": "UPDATE", "row_pk": "2",
+             "row_data": '{"id": 2, "name": "Robert"}'},
+            # compared against the change before it, not against the prefetched row
+            {"id": 12, "table_name": "users", "operation": "UPDATE", "row_pk": "2",
+             "row_data": '{"id": 2, "name": "Robert"}'},
+        ]
+        options = resolve_sync_options({"coalesce": False, "apply_mode": "row"})
+
+        process_change_batch(MagicMock(), target_conn, changes, "source_wins", options,
+                             "local-node", "cloud-node", cursor_caps=None)
+
+        selects = [c[0][0] for c in target_cursor.execute.call_args_list if c[0][0].startswith("SELECT * FROM `users`")]
+        self.assertEqual(len(selects), 1)
+        self.assertIn("IN (%s, %s)", selects[0])
+        mock_report.assert_called_once()
+        change, info, _ = mock_report.call_args[0][1:]
+        self.assertEqual(change["id"], 11)
+        self.assertEqual(info["conflicts"][0]["field"], "name")
+        self.assertEqual(mock_ack.call_args[0][2], [10, 11, 12])
+
+    def test_coalesce_changes_keeps_net_effect_per_key(self):
+        changes = [
+            {"id": 1, "table_name": "products", "operation": "INSERT", "row_pk": "1",
+             "row_data": '{"id": 1, "stock": 10}'},
+            {"id": 2, "table_name": "products", "operation": "UPDATE", "row_pk": "1",
+             "row_data": '{"id": 1, "stock": 9}'},
+            {"id": 3, "table_name": "products", "operation": "UPDATE", "row_pk": "2",
+             "row_data": '{"id": 2, "stock": 5}'},
+            {"id": 4, "table_name": "products", "operation": "UPDATE", "row_pk": "1",
+             "row_data": '{"id": 1, "stock": 8}'},
+            {"id": 5, "table_name": "products", "operation": "DELETE", "row_pk": "2",
+             "row_data": '{"id": 2, "stock": 5}'},
+            {"id": 6, "table_name": "products", "operation": "INSERT", "row_pk": "3",
+             "row_data": '{"id": 3, "stock": 1}'},
+            {"id": 7, "table_name": "products", "operation": "DELETE", "row_pk": "3",
+             "row_data": '{"id": 3, "stock": 1}'},
+        ]
+
+        net, dropped_ids, stats = coalesce_changes(changes)
+
+        self.assertEqual([c["id"] for c in net], [4, 5])
+        self.assertEqual(net[0]["operation"], "INSERT")
+        self.assertEqual(net[0]["row_data"], '{"id": 1, "stock": 8}')
+        self.assertEqual(net[0]["coalesced_ids"], [1, 2, 4])
+        self.assertEqual(net[1]["operation"], "DELETE")
+        self.assertEqual(net[1]["coalesced_ids"], [3, 5])
+        self.assertEqual(dropped_ids, [6, 7])
+        self.assertEqual(stats["eliminated"], 5)
+
+    def test_coalesce_changes_keeps_parents_before_their_children(self):
+        changes = [
+            {"id": 1, "table_name": "orders", "operation": "INSERT", "row_pk": "1",
+             "row_data": '{"id": 1, "status": "new"}'},
+            {"id": 2, "table_name": "order_items", "operation": "INSERT", "row_pk": "5",
+             "row_data": '{"id": 5, "order_id": 1}'},
+            {"id": 3, "table_name": "orders", "operation": "UPDATE", "row_pk": "1",
+             "row_data": '{"id": 1, "status": "paid"}'},
+            {"id": 4, "table_name": "order_items", "operation": "DELETE", "row_pk": "6",
+             "row_data": '{"id": 6, "order_id": 2}'},
+            {"id": 5, "table_name": "orders", "operation": "UPDATE", "row_pk": "2",
+             "row_data": '{"id": 2, "status": "void"}'},
+            {"id": 6, "table_name": "orders", "operation": "DELETE", "row_pk": "2",
+             "row_data": '{"id": 2, "status": "void"}'},
+        ]
+
+        net, _, _ = coalesce_changes(changes)
+
+        self.assertEqual([(c["id"], c["table_name"], c["operation"]) for c in net],
+                         [(3, "orders", "INSERT"), (2, "order_items", "INSERT"),
+                          (4, "order_items", "DELETE"), (6, "orders", "DELETE")])
+
+    def test_coalesce_changes_keeps_delta_only_when_all_parts_are_deltas(self):
+        changes = [
+            {"id": 1, "table_name": "products", "operation": "UPDATE", "row_pk": "1", "row_format": "delta",
+             "row_data": '{"id": 1, "stock": 9}'},
+            {"id": 2, "table_name": "products", "operation": "UPDATE", "row_pk": "1", "row_format": "delta",
+             "row_data": '{"id": 1, "price": 3}'},
+            {"id": 3, "table_name": "products", "operation": "INSERT", "row_pk": "2", "row_format": "full",
+             "row_data": '{"id": 2, "stock": 1, "price": 2}'},
+            {"id": 4, "table_name": "products", "operation": "UPDATE", "row_pk": "2", "row_format": "delta",
+             "row_data": '{"id": 2, "stock": 0}'},
+        ]
+
+        net, _, _ = coalesce_changes(changes)
+
+        self.assertEqual(net[0]["row_format"], "delta")
+        self.assertEqual(net[0]["row_data"], '{"id": 1, "stock": 9, "price": 3}')
+        self.assertEqual(net[1]["row_format"], "full")
+        self.assertEqual(net[1]["operation"], "INSERT")
+
+    @patch("core.sync_engine.get_versioned_columns", return_value=["id", "name", "stock"])
+    def test_decode_compact_changes_expands_positional_row_data(self, mock_columns):
+        mock_conn = MagicMock()
+        mock_conn.db = b"source_db"
+        changes = [
+            {"id": 1, "table_name": "products", "row_format": "compact", "columns_version": "abc123abc123",
+             "row_data": '[1, "Widget", 5]'},
+            {"id": 2, "table_name": "products", "row_format": "delta", "row_data": '{"id": 2, "stock": 1}'},
+        ]
+
+        decoded = decode_compact_changes(mock_conn, changes)
+
+        self.assertEqual(decoded[0]["row_data"], '{"id": 1, "name": "Widget", "stock": 5}')
+        self.assertEqual(decoded[0]["row_format"], "full")
+        self.assertEqual(decoded[1]["row_data"], '{"id": 2, "stock": 1}')
+        mock_columns.assert_called_once_with(mock_conn, "source_db", "products", "abc123abc123")
+
+    def test_mark_changes_as_applied_chunks_inside_one_transaction(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.rowcount = 2
+
+        updated = mark_changes_as_applied(mock_conn, [1, 2, 3, 3], "edge-01", chunk_size=2)
+
+        self.assertEqual(updated, 4)
+        self.assertEqual(mock_cursor.execute.call_count, 2)
+        sql, params = mock_cursor.execute.call_args_list[0][0]
+        self.assertIn("WHERE id IN (%s, %s)", sql)
+        self.assertEqual(params, ["edge-01", 1, 2, "edge-01"])
+        mock_conn.begin.assert_called_once()
+        mock_conn.commit.assert_called_once()
+        mock_conn.rollback.assert_not_called()
+
+    def test_mark_changes_as_applied_rolls_back_on_error(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.execute.side_effect = Exception("lock wait timeout")
+
+        with self.assertRaises(Exception):
+            mark_changes_as_applied(mock_conn, [1, 2], "edge-01")
+
+        mock_conn.rollback.assert_called_once()
+        mock_conn.commit.assert_not_called()
+
+    def test_fetch_changes_after_uses_keyset_range(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = [{"id": 43, "table_name": "users"}]
+
+        changes = fetch_changes_after(mock_conn, 42, table_name="users", limit=10)
+
+        sql, args = mock_cursor.execute.call_args[0]
+        self.assertIn("id > %s", sql)
+        self.assertIn("ORDER BY id ASC", sql)
+        self.assertNotIn("JSON_SEARCH", sql)
+        self.assertEqual(args, [42, "users", 10])
+        self.assertEqual(changes[0]["id"], 43)
+
+    def test_settled_changes_filter_holds_back_changes_of_open_transactions(self):
+        mock_conn = MagicMock(host="db-guard-ok", port=3306)
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = {"trx_started": "2024-01-01 10:00:00", "thread_id": 77,
+                                             "open_seconds": 30}
+
+        sql, args = settled_changes_filter(mock_conn, 5, max_hold_seconds=300)
+
+        guard_sql = mock_cursor.execute.call_args[0][0]
+        self.assertIn("t.trx_rows_modified > 0", guard_sql)
+        self.assertIn("p.DB = DATABASE()", guard_sql)
+        self.assertEqual(sql, " AND created_at <= %s - INTERVAL %s SECOND")
+        self.assertEqual(args, ["2024-01-01 10:00:00", 5])
+        self.assertEqual(settled_changes_filter(mock_conn, 0), ("", []))
+
+        mock_cursor.fetchone.return_value = None  # no writing transaction open in this schema
+        self.assertEqual(settled_changes_filter(mock_conn, 5),
+                         (" AND created_at <= NOW() - INTERVAL %s SECOND", [5]))
+
+    def test_settled_changes_filter_caps_how_long_a_transaction_holds_back(self):
+        mock_conn = MagicMock(host="db-guard-cap", port=3306)
+        mock_conn.cursor.return_value.__enter__.return_value.fetchone.return_value = {
+            "trx_started": "2024-01-01 09:00:00", "thread_id": 77, "open_seconds": 3600}
+
+        sql, args = settled_changes_filter(mock_conn, 5, max_hold_seconds=300)
+
+        self.assertEqual(sql, " AND created_at <= NOW() - INTERVAL %s SECOND")
+        self.assertEqual(args, [305])
+
+    def test_settled_changes_filter_falls_back_to_time_lag_without_process_privilege(self):
+        mock_conn = MagicMock(host="db-no-process", port=3306)
+        mock_conn.cursor.return_value.__enter__.return_value.execute.side_effect = Exception("1227 Access denied")
+
+        sql, args = settled_changes_filter(mock_conn, 5)
+
+        self.assertEqual(sql, " AND created_at <= NOW() - INTERVAL %s SECOND")
+        self.assertEqual(args, [5])
+
+    def test_safe_cursor_position_stops_before_first_failure(self):
+        fetched = [{"id": 5}, {"id": 6}, {"id": 7}]
+
+        self.assertEqual(safe_cursor_position(fetched, []), 7)
+        self.assertEqual(safe_cursor_position(fetched, [7, 6]), 5)
+        self.assertIsNone(safe_cursor_position([], []))
+
+    @patch("core.sync_engine.process_change_batch",
+           return_value={"synced": 2, "conflicts": 0, "eliminated": 0, "failed_ids": []})
+    @patch("core.sync_engine.estimate_backlog", return_value=5)
+    @patch("core.sync_engine.get_sync_cursor", return_value=10)
+    @patch("core.sync_engine.fetch_changes_after")
+    def test_sync_drains_backlog_with_keyset_pages(self, mock_fetch, mock_cursor, mock_backlog, mock_process):
+        source_conn, target_conn = MagicMock(), MagicMock()
+        source_conn.db, target_conn.db = b"shop_local", b"shop_cloud"
+        mock_fetch.side_effect = [
+            [{"id": 11, "table_name": "users"}, {"id": 12, "table_name": "users"}],
+            [{"id": 13, "table_name": "users"}, {"id": 14, "table_name": "users"}],
+            [{"id": 15, "table_name": "users"}],
+        ]
+
+        sync_changes_with_conflict_resolution(source_conn, target_conn, "pair", ["users"],
+                                              options={"fetch_limit": 2})
+
+        self.assertEqual([c[0][1] for c in mock_fetch.call_args_list], [10, 12, 14])
+        self.assertEqual(mock_process.call_count, 3)
+
+    @patch("core.sync_engine.process_change_batch",
+           return_value={"synced": 2, "conflicts": 0, "eliminated": 0, "failed_ids": []})
+    @patch("core.sync_engine.estimate_backlog", return_value=100)
+    @patch("core.sync_engine.get_sync_cursor", return_value=0)
+    @patch("core.sync_engine.fetch_changes_after")
+    def test_sync_stops_when_row_budget_is_spent(self, mock_fetch, mock_cursor, mock_backlog, mock_process):
+        source_conn, target_conn = MagicMock(), MagicMock()
+        source_conn.db, target_conn.db = b"shop_local", b"shop_cloud"
+        mock_fetch.side_effect = lambda conn, after_id, *args: [
+            {"id": after_id + 1, "table_name": "users"}, {"id": after_id + 2, "table_name": "users"}
+        ]
+
+        sync_changes_with_conflict_resolution(source_conn, target_conn, "pair", ["users", "orders"],
+                                              options={"fetch_limit": 2, "max_run_rows": 4})
+
+        self.assertEqual(mock_fetch.call_count, 2)
+
+    @patch("core.sync_engine.process_change_batch",
+           return_value={"synced": 2, "conflicts": 0, "eliminated": 0, "failed_ids": []})
+    @patch("core.sync_engine.get_sync_cursors", return_value={"customers": 5, "orders": 8})
+    @patch("core.sync_engine.fetch_change_stream")
+    def test_stream_mode_reads_all_tables_in_one_ordered_query(self, mock_stream, mock_cursors, mock_process):
+        source_conn, target_conn = MagicMock(), MagicMock()
+        source_conn.db, target_conn.db = b"shop_local", b"shop_cloud"
+        mock_stream.return_value = [
+            {"id": 6, "table_name": "customers"},
+            {"id": 7, "table_name": "orders"},  # already past the orders cursor
+            {"id": 9, "table_name": "orders"},
+        ]
+
+        sync_changes_with_conflict_resolution(source_conn, target_conn, "pair", ["customers", "orders"],
+                                              options={"fetch_mode": "stream"})
+
+        mock_stream.assert_called_once()
+        self.assertEqual(mock_stream.call_args[0][1], 5)
+        dispatched = mock_process.call_args[0][2]
+        self.assertEqual([c["id"] for c in dispatched], [6, 9])
+
+    @patch("core.sync_engine.advance_sync_cursor")
+    @patch("core.sync_engine.process_change_batch")
+    @patch("core.sync_engine.estimate_backlog", return_value=3)
+    @patch("core.sync_engine.get_sync_cursors", return_value={"customers": 100, "orders": 100})
+    @patch("core.sync_engine.fetch_change_stream")
+    def test_stream_mode_moves_idle_table_cursors_with_the_page(self, mock_stream, mock_cursors, mock_backlog,
+                                                               mock_process, mock_advance):
+        source_conn, target_conn = MagicMock(), MagicMock()
+        source_conn.db, target_conn.db = b"shop_local", b"shop_cloud"
+        mock_process.return_value = {"synced": 2, "conflicts": 0, "eliminated": 0, "failed_ids": []}
+        mock_stream.side_effect = [
+            [{"id": 101, "table_name": "orders"}, {"id": 102, "table_name": "orders"}],
+            [{"id": 103, "table_name": "orders"}],
+        ]
+
+        sync_changes_with_conflict_resolution(source_conn, target_conn, "pair", ["customers", "orders"],
+                                              options={"fetch_mode": "stream", "fetch_limit": 2})
+
+        # customers had nothing in either page, so its cursor follows the stream
+        advanced = [(c[0][3], c[0][4]) for c in mock_advance.call_args_list]
+        self.assertEqual(advanced, [("customers", 102), ("customers", 103)])
+        self.assertEqual(mock_backlog.call_args[1]["tables"], ["customers", "orders"])
+
+    @patch("core.sync_engine.acknowledge_batch", return_value=2)
+    @patch("core.sync_engine.apply_change_with_conflict_detection",
+           side_effect=[True, Exception("Data too long"), True])
+    def test_transactional_batch_rolls_back_only_the_failed_change(self, mock_apply, mock_ack):
+        source_conn, target_conn = MagicMock(), MagicMock()
+        target_cursor = target_conn.cursor.return_value.__enter__.return_value
+        changes = [
+            {"id": i, "table_name": "users", "operation": "UPDATE", "row_pk": str(i),
+             "row_data": f'{{"id": {i}}}'}
+            for i in (1, 2, 3)
+        ]
+        options = resolve_sync_options({"transactional": True, "coalesce": False})
+
+        result = process_change_batch(source_conn, target_conn, changes, "source_wins", options,
+                                      "local-node", "cloud-node", cursor_caps=None)
+
+        target_conn.begin.assert_called_once()
+        executed = [c[0][0] for c in target_cursor.execute.call_args_list]
+        self.assertEqual(executed.count("SAVEPOINT sync_change"), 3)
+        # conflict_log DDL runs before the transaction, not inside it
+        first_savepoint = executed.index("SAVEPOINT sync_change")
+        self.assertTrue(any("CREATE TABLE IF NOT EXISTS `conflict_log`" in sql for sql in executed[:first_savepoint]))
+        self.assertEqual(executed.count("ROLLBACK TO SAVEPOINT sync_change"), 1)
+        self.assertEqual(result["failed_ids"], [2])
+        ack_args, ack_kwargs = mock_ack.call_args
+        self.assertEqual(ack_args[2], [1, 3])
+        self.assertTrue(ack_kwargs["commit_target"])
+
+    @patch("core.sync_engine.acknowledge_batch", return_value=3)
+    @patch("core.sync_engine.apply_change_with_conflict_detection",
+           side_effect=[True, Exception("Cannot add or update a child row"), True])
+    def test_change_failing_max_attempts_is_dead_lettered_and_passed(self, mock_apply, mock_ack):
+        source_conn = MagicMock()
+        source_cursor = source_conn.cursor.return_value.__enter__.return_value
+        source_cursor.fetchall.return_value = [{"change_id": 2}]  # its 5th failed attempt
+        changes = [
+            {"id": i, "table_name": "order_items", "operation": "INSERT", "row_pk": str(i),
+             "row_data": f'{{"id": {i}}}'}
+            for i in (1, 2, 3)
+        ]
+        options = resolve_sync_options({"coalesce": False})
+        cursor_caps = {}
+
+        result = process_change_batch(source_conn, MagicMock(), changes, "source_wins", options,
+                                      "local-node", "cloud-node", cursor_caps=cursor_caps)
+
+        record_sql, record_args = source_cursor.execute.call_args_list[0][0]
+        self.assertIn("INSERT INTO `sync_failed_change`", record_sql)
+        self.assertIn("attempts = attempts + 1", record_sql)
+        self.assertEqual(record_args, ["local-node", "cloud-node", 2, "order_items", "INSERT", "2", '{"id": 2}',
+                                       "Cannot add or update a child row"])
+        self.assertEqual(source_cursor.execute.call_args_list[1][0][1], ["local-node", "cloud-node", 2, 5])
+        self.assertIn("dead_lettered_at", source_cursor.execute.call_args_list[2][0][0])
+        self.assertEqual(result["failed_ids"], [])
+        self.assertEqual(result["dead_lettered"], 1)
+        ack_args, ack_kwargs = mock_ack.call_args
+        self.assertEqual(ack_args[2], [1, 3, 2])
+        self.assertEqual(ack_args[5], [("local-node", "order_items", 3)])
+        self.assertEqual(cursor_caps, {})
+
+    @patch("core.sync_engine.acknowledge_batch")
+    @patch("core.sync_engine.apply_changes_batched", side_effect=ConnectionError("Lost connection during query"))
+    def test_transactional_batch_rolls_back_on_unexpected_errors(self, mock_apply, mock_ack):
+        target_conn = MagicMock()
+        changes = [{"id": 1, "table_name": "users", "operation": "UPDATE", "row_pk": "1", "row_data": '{"id": 1}'}]
+        options = resolve_sync_options({"transactional": True, "apply_mode": "batch"})
+
+        with self.assertRaises(ConnectionError):
+            process_change_batch(MagicMock(), target_conn, changes, "source_wins", options,
+                                 "local-node", "cloud-node", cursor_caps={})
+
+        target_conn.begin.assert_called_once()
+        target_conn.rollback.assert_called_once()
+        target_conn.commit.assert_not_called()
+        mock_ack.assert_not_called()
+
+    @patch("core.sync_engine.acknowledge_batch", return_value=2)
+    @patch("core.sync_engine.apply_change_with_conflict_detection", return_value=True)
+    def test_changes_originating_on_target_are_acknowledged_not_applied(self, mock_apply, mock_ack):
+        changes = [
+            {"id": 1, "table_name": "users", "operation": "UPDATE", "row_pk": "1",
+             "row_data": '{"id": 1}', "source_node": "local-node"},
+            {"id": 2, "table_name": "users", "operation": "UPDATE", "row_pk": "2",
+             "row_data": '{"id": 2}', "source_node": "cloud-node"},
+        ]
+        options = resolve_sync_options({"coalesce": False})
+
+        process_change_batch(MagicMock(), MagicMock(), changes, "source_wins", options,
+                             "local-node", "cloud-node", cursor_caps=None)
+
+        mock_apply.assert_called_once()
+        self.assertEqual(mock_apply.call_args[0][1]["id"], 1)
+        self.assertEqual(sorted(mock_ack.call_args[0][2]), [1, 2])
+
+    @patch("core.sync_engine.acknowledge_batch", return_value=2)
+    @patch("core.sync_engine.prefetch_target_snapshot", return_value={})
+    @patch("core.sync_engine.apply_change_with_conflict_detection", side_effect=[True, False])
+    def test_version_detection_reads_and_maintains_row_version_registry(self, mock_apply, mock_snapshot, mock_ack):
+        target_conn = MagicMock()
+        target_cursor = target_conn.cursor.return_value.__enter__.return_value
+        target_cursor.fetchall.return_value = [{"row_pk": "2", "version": "1700000000000900.000000.cloud-node"}]
+        changes = [
+            {"id": i, "table_name": "users", "operation": "UPDATE", "row_pk": str(i), "row_data": f'{{"id": {i}}}',
+             "source_node": "local-node", "hlc": f"170000000000050{i}.000000.local-node"}
+            for i in (1, 2)
+        ]
+        options = resolve_sync_options({"coalesce": False, "conflict_detection": "version"})
+
+        process_change_batch(MagicMock(), target_conn, changes, "timestamp_wins", options,
+                             "local-node", "cloud-node", cursor_caps=None)
+
+        lookup_sql, lookup_args = target_cursor.execute.call_args_list[0][0]
+        self.assertIn("FROM `row_version` WHERE table_name = %s AND row_pk IN (%s, %s)", lookup_sql)
+        self.assertEqual(mock_apply.call_args[0][3], {("users", "2"): "1700000000000900.000000.cloud-node"})
+        registry_sql, registry_rows = target_cursor.executemany.call_args[0]
+        self.assertIn("INSERT INTO `row_version`", registry_sql)
+        self.assertEqual(registry_rows, [("users", "1", "1700000000000501.000000.local-node", "local-node")])
+
+    def test_conflicts_are_buffered_and_written_in_one_insert(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        changes = [{"id": i, "table_name": "users", "row_pk": str(i), "row_data": "{}"} for i in (1, 2, 3)]
+
+        with buffer_conflict_log(mock_conn):
+            for change in changes:
+                log_conflict(mock_conn, change, {"type": "field_conflict", "target_record": {}}, "source_wins")
+            mock_cursor.execute.assert_not_called()
+
+        executed = [c[0] for c in mock_cursor.execute.call_args_list]
+        self.assertEqual(sum("CREATE TABLE IF NOT EXISTS `conflict_log`" in sql for sql, *_ in executed), 1)
+        insert_sql, insert_args = executed[-2]
+        self.assertEqual(insert_sql.count("(%s, %s, %s, %s, %s, %s, %s, %s)"), 3)
+        self.assertEqual(insert_args[0::8], [1, 2, 3])
+
+        # The hourly rollup gets one upsert with the counts per (table, type, resolution)
+        stats_sql, stats_args = executed[-1]
+        self.assertIn("INSERT INTO `conflict_stats`", stats_sql)
+        self.assertIn("conflict_count = conflict_count + VALUES(conflict_count)", stats_sql)
+        self.assertEqual(stats_args, ["users", "field_conflict", "source_wins", 3])
+
+        # The table is ensured once per connection, not once per conflict
+        log_conflict(mock_conn, changes[0], {"type": "field_conflict"}, "target_wins")
+        executed = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        self.assertEqual(sum("CREATE TABLE" in sql for sql in executed), 1)
+
+    def test_iter_change_pages_prefetches_on_worker_thread(self):
+        calls = []
+
+        def fetch_page(after_id):
+            calls.append(after_id)
+            if after_id >= 6:
+                return [{"id": 7}]
+            return [{"id": after_id + 1}, {"id": after_id + 2}]
+
+        pages = list(iter_change_pages(fetch_page, 0, fetch_limit=2, pipeline_depth=1))
+
+        self.assertEqual([[c["id"] for c in page] for page in pages], [[1, 2], [3, 4], [5, 6], [7]])
+        self.assertEqual(calls, [0, 2, 4, 6])
+
+    def test_iter_change_pages_stops_worker_when_closed_early(self):
+        fetch_page = MagicMock(side_effect=lambda after_id: [{"id": after_id + 1}, {"id": after_id + 2}])
+
+        pages = iter_change_pages(fetch_page, 0, fetch_limit=2, pipeline_depth=2)
+        self.assertEqual(next(pages)[0]["id"], 1)
+        pages.close()
+
+        # Bounded queue: the worker can only run a couple of pages ahead before it stops
+        self.assertLessEqual(fetch_page.call_count, 4)